@@ -1,8 +1,15 @@
 import argparse
+import math
 from argparse import ArgumentParser
 
 from bbc_to_spotify import __project_name__, __version__
 from bbc_to_spotify.authorize.authorize import REDIRECT_URI
+from bbc_to_spotify.serve.serve import (
+    DEFAULT_HOST,
+    DEFAULT_PORT,
+    DEFAULT_WORKERS,
+    TOKEN_ENV_VAR,
+)
 from bbc_to_spotify.utils import Station
 
 SOURCES: list[Station] = [
@@ -14,6 +21,26 @@ SOURCES: list[Station] = [
 ]
 
 
+def positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"must be a whole number, not '{value}'")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {number}")
+    return number
+
+
+def positive_float(value: str) -> float:
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"must be a number, not '{value}'")
+    if not math.isfinite(number) or number <= 0:
+        raise argparse.ArgumentTypeError(f"must be more than 0, not {value}")
+    return number
+
+
 def setup_parser() -> ArgumentParser:
     root_parser = argparse.ArgumentParser(
         prog=__project_name__,
@@ -49,6 +76,25 @@ def setup_parser() -> ArgumentParser:
         default=None,
         type=str,
     )
+    logging_parser.add_argument(
+        "--log-json",
+        help=(
+            "Write logs as JSON lines, including the run ID, station, playlist ID and"
+            " phase timings."
+        ),
+        required=False,
+        action="store_true",
+    )
+    logging_parser.add_argument(
+        "--trace-memory",
+        help=(
+            "Trace memory allocations with tracemalloc, logging the peak memory of each"
+            " phase. Phases that run at the same time share a peak. Slows the run"
+            " down."
+        ),
+        required=False,
+        action="store_true",
+    )
 
     command_parsers = root_parser.add_subparsers(
         title="commands", dest="command", required=True
@@ -67,12 +113,14 @@ def setup_parser() -> ArgumentParser:
     )
 
     update_parser.add_argument(
-        "playlist_id",
+        "playlist_ids",
         metavar="playlist-id",
         help=(
             "The ID of the Spotify playlist on which to add the BBC station's current"
-            " playlist tracks."
+            " playlist tracks. Several IDs may be given to update multiple playlists"
+            " from a single scrape of the station."
         ),
+        nargs="+",
         type=str,
     )
     update_parser.add_argument(
@@ -115,6 +163,46 @@ def setup_parser() -> ArgumentParser:
         required=False,
         action="store_true",
     )
+    update_parser.add_argument(
+        "--fast-parse",
+        help=(
+            "Build tracks directly from Spotify's responses, skipping validation of"
+            " the response data."
+        ),
+        required=False,
+        action="store_true",
+    )
+    update_parser.add_argument(
+        "--max-tracks",
+        help=(
+            "Keep the destination playlist within this many tracks, removing the"
+            " longest-standing ones once it grows past it."
+        ),
+        required=False,
+        default=None,
+        type=positive_int,
+        metavar="N",
+    )
+    update_parser.add_argument(
+        "--deadline",
+        help=(
+            "Finish the run within this many seconds, deferring any tracks that could"
+            " not be searched for in time to the next run."
+        ),
+        required=False,
+        default=None,
+        type=positive_float,
+        metavar="SECONDS",
+    )
+    update_parser.add_argument(
+        "--hedge-search",
+        help=(
+            "Search for tracks by the two best ranked query forms at the same time,"
+            " rather than one after the other."
+        ),
+        required=False,
+        action="store_true",
+    )
     update_parser.add_argument(
         "--prepend",
         "-P",
@@ -159,6 +247,139 @@ def setup_parser() -> ArgumentParser:
         action="store_true",
     )
 
+    create_parser.add_argument(
+        "--fast-parse",
+        help=(
+            "Build tracks directly from Spotify's responses, skipping validation of"
+            " the response data."
+        ),
+        required=False,
+        action="store_true",
+    )
+    create_parser.add_argument(
+        "--deadline",
+        help=(
+            "Finish the run within this many seconds, deferring any tracks that could"
+            " not be searched for in time to the next run."
+        ),
+        required=False,
+        default=None,
+        type=positive_float,
+        metavar="SECONDS",
+    )
+    create_parser.add_argument(
+        "--hedge-search",
+        help=(
+            "Search for tracks by the two best ranked query forms at the same time,"
+            " rather than one after the other."
+        ),
+        required=False,
+        action="store_true",
+    )
+
+    serve_parser = command_parsers.add_parser(
+        "serve",
+        add_help=True,
+        parents=[logging_parser],
+        description="Serve an HTTP API for queueing playlist updates on demand.",
+    )
+    serve_parser.add_argument(
+        "--host",
+        help=(
+            f"Host to listen on. Default value is `{DEFAULT_HOST}`. Other than loopback"
+            f" addresses, requires a token to be set in `{TOKEN_ENV_VAR}`"
+        ),
+        required=False,
+        default=DEFAULT_HOST,
+        type=str,
+    )
+    serve_parser.add_argument(
+        "--port",
+        help=f"Port to listen on. Default value is `{DEFAULT_PORT}`",
+        required=False,
+        default=DEFAULT_PORT,
+        type=int,
+    )
+    serve_parser.add_argument(
+        "--workers",
+        help=(
+            f"Number of update jobs to run at once. Default value is"
+            f" `{DEFAULT_WORKERS}`"
+        ),
+        required=False,
+        default=DEFAULT_WORKERS,
+        type=positive_int,
+    )
+    serve_parser.add_argument(
+        "--fast-parse",
+        help=(
+            "Build tracks directly from Spotify's responses, skipping validation of"
+            " the response data."
+        ),
+        required=False,
+        action="store_true",
+    )
+    serve_parser.add_argument(
+        "--hedge-search",
+        help=(
+            "Search for tracks by the two best ranked query forms at the same time,"
+            " rather than one after the other."
+        ),
+        required=False,
+        action="store_true",
+    )
+
+    export_cache_parser = command_parsers.add_parser(
+        "export-cache",
+        add_help=True,
+        parents=[logging_parser],
+        description=(
+            "Export the Spotify tracks that BBC tracks were matched to as an index"
+            " file, for other hosts to import."
+        ),
+    )
+    export_cache_parser.add_argument(
+        "path", help="Path to write the index file to.", type=str
+    )
+    import_cache_parser = command_parsers.add_parser(
+        "import-cache",
+        add_help=True,
+        parents=[logging_parser],
+        description=(
+            "Import an index file written by export-cache, replacing any previously"
+            " imported one."
+        ),
+    )
+    import_cache_parser.add_argument(
+        "path", help="Path of the index file to import.", type=str
+    )
+
+    stats_parser = command_parsers.add_parser(
+        "stats",
+        add_help=True,
+        parents=[logging_parser],
+        description=(
+            "Show the timings and trends of recent runs for each playlist, and the"
+            " runs that were slower than usual."
+        ),
+    )
+    stats_parser.add_argument(
+        "--station",
+        help=f"Only show runs for this station. Possible values: {SOURCES}",
+        required=False,
+        default=None,
+        choices=SOURCES,
+        metavar="STATION",
+        type=str,
+    )
+    stats_parser.add_argument(
+        "--days",
+        help="Show runs from this many days ago onwards. Default value is `30`",
+        required=False,
+        default=30,
+        type=float,
+    )
+
     auth_parser = command_parsers.add_parser(
         "authorize", add_help=True, parents=[logging_parser]
     )
@@ -0,0 +1,70 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Once less than this share of the run's budget remains, no more tracks are searched
+# for, so that the rest is left for mutating the playlists.
+RESERVE_FRACTION = 0.2
+MIN_RESERVE_S = 5.0
+# Short budgets would otherwise be all reserve, and search for nothing.
+MAX_RESERVE_FRACTION = 0.5
+
+# Requests get at least this long, even past the deadline, so that mutations which
+# were already planned can still complete.
+MIN_TIMEOUT_S = 5.0
+
+# The monotonic time at which the run's budget is spent, and the reserve before it.
+# Workers run in copies of the caller's context, so share its deadline.
+DEADLINE: ContextVar[tuple[float, float] | None] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceededError(TimeoutError):
+    pass
+
+
+@contextmanager
+def run_deadline(budget_s: float | None):
+    if budget_s is None:
+        yield
+        return
+    reserve_s = min(
+        max(budget_s * RESERVE_FRACTION, MIN_RESERVE_S),
+        budget_s * MAX_RESERVE_FRACTION,
+    )
+    token = DEADLINE.set((time.monotonic() + budget_s, reserve_s))
+    try:
+        yield
+    finally:
+        DEADLINE.reset(token)
+
+
+def get_remaining_s() -> float | None:
+    deadline = DEADLINE.get()
+    if deadline is None:
+        return None
+    expires_at, _ = deadline
+    return expires_at - time.monotonic()
+
+
+def get_timeout_s(timeout_s: float) -> float:
+    remaining_s = get_remaining_s()
+    if remaining_s is None:
+        return timeout_s
+    return min(timeout_s, max(remaining_s, MIN_TIMEOUT_S))
+
+
+def get_wait_timeout_s() -> float | None:
+    # How long to wait for a lock or a free slot, or None to wait for as long as it
+    # takes. Like requests, waits get at least MIN_TIMEOUT_S even past the deadline.
+    remaining_s = get_remaining_s()
+    if remaining_s is None:
+        return None
+    return max(remaining_s, MIN_TIMEOUT_S)
+
+
+def is_nearly_spent() -> bool:
+    deadline = DEADLINE.get()
+    if deadline is None:
+        return False
+    expires_at, reserve_s = deadline
+    return expires_at - time.monotonic() < reserve_s
@@ -0,0 +1,259 @@
+import datetime as dt
+import logging
+import sqlite3
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+from bbc_to_spotify.history.models import (
+    PhaseStats,
+    PlaylistStats,
+    RunRecord,
+    RunRecording,
+    SlowRun,
+)
+from bbc_to_spotify.logging import RUN_ID, record_phase_durations
+from bbc_to_spotify.spotify.spotify import record_api_metrics
+from bbc_to_spotify.store.store import Store
+from bbc_to_spotify.utils import get_percentile
+
+logger = logging.getLogger(__name__)
+
+# A run is slow when it takes this many times the median of the runs before it.
+SLOW_RUN_FACTOR = 1.5
+BASELINE_RUNS = 20
+MIN_BASELINE_RUNS = 5
+
+# Trends compare the median of the most recent runs with that of the runs before them.
+TREND_RUNS = 5
+
+MAX_SLOW_RUNS_SHOWN = 10
+
+
+@contextmanager
+def record_run(
+    store: Store,
+    command: str,
+    station: str,
+    playlist_ids: list[str],
+    dry_run: bool,
+    run_id: str = RUN_ID,
+) -> Iterator[RunRecording]:
+    recording = RunRecording(playlist_ids=list(playlist_ids))
+    started_ts = time.time()
+    start = time.perf_counter()
+    error: Exception | None = None
+    try:
+        with (
+            record_phase_durations(recording.phase_durations_s),
+            record_api_metrics(recording.api_metrics),
+        ):
+            yield recording
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        # Dry runs skip the mutations, so would skew the baselines of real runs.
+        if not dry_run:
+            runs = make_run_records(
+                recording=recording,
+                run_id=run_id,
+                command=command,
+                station=station,
+                started_ts=started_ts,
+                duration_s=round(time.perf_counter() - start, 3),
+                error=error,
+            )
+            try:
+                store.add_runs(runs)
+            except sqlite3.Error:
+                logger.warning("Failed to record the run's history.", exc_info=True)
+
+
+def make_run_records(
+    recording: RunRecording,
+    run_id: str,
+    command: str,
+    station: str,
+    started_ts: float,
+    duration_s: float,
+    error: Exception | None = None,
+) -> list[RunRecord]:
+    results = {result.playlist_id: result for result in recording.results}
+    runs = []
+    for playlist_id in dict.fromkeys(recording.playlist_ids):
+        result = results.get(playlist_id)
+        run = RunRecord(
+            run_id=run_id,
+            command=command,
+            station=station,
+            playlist_id=playlist_id,
+            started_ts=started_ts,
+            duration_s=duration_s,
+            phase_durations_s=dict(recording.phase_durations_s),
+            requests=recording.api_metrics.requests,
+            retries=recording.api_metrics.retries,
+            throttled=recording.api_metrics.throttled,
+            server_errors=recording.api_metrics.server_errors,
+            tracks=recording.resolve_stats.tracks,
+            cache_hits=recording.resolve_stats.cache_hits,
+            tracks_added=0,
+            tracks_removed=0,
+            tracks_evicted=0,
+            tracks_deferred=0,
+            error=str(error) if error is not None else None,
+        )
+        if result is not None:
+            run.phase_durations_s.update(result.phase_durations_s)
+            run.tracks_added = len(result.tracks_added)
+            run.tracks_removed = len(result.tracks_removed)
+            run.tracks_evicted = result.tracks_evicted
+            run.tracks_deferred = len(result.tracks_deferred)
+            if result.error is not None:
+                run.error = str(result.error)
+        elif run.error is None:
+            run.error = "The playlist was not updated."
+        runs.append(run)
+    return runs
+
+
+def get_run_durations(run: RunRecord) -> dict[str, float]:
+    return {"total": run.duration_s, **run.phase_durations_s}
+
+
+def get_trend(values: list[float]) -> float | None:
+    recent = values[-TREND_RUNS:]
+    before = values[-TREND_RUNS - BASELINE_RUNS : -TREND_RUNS]
+    if len(recent) < TREND_RUNS or len(before) < MIN_BASELINE_RUNS:
+        return None
+    before_p50 = get_percentile(before, 50)
+    if before_p50 == 0:
+        return None
+    return get_percentile(recent, 50) / before_p50 - 1
+
+
+def find_slow_runs(runs: list[RunRecord]) -> list[SlowRun]:
+    # Each run is compared with the median of the runs before it, so the baseline
+    # follows gradual changes, and sudden ones stand out.
+    slow_runs = []
+    for i, run in enumerate(runs):
+        baseline_runs = runs[max(i - BASELINE_RUNS, 0) : i]
+        if len(baseline_runs) < MIN_BASELINE_RUNS:
+            continue
+        baseline_s = get_percentile([run_.duration_s for run_ in baseline_runs], 50)
+        if run.duration_s <= SLOW_RUN_FACTOR * baseline_s:
+            continue
+
+        slow_run = SlowRun(run=run, baseline_s=baseline_s)
+        for phase, duration_s in run.phase_durations_s.items():
+            phase_baseline = [
+                run_.phase_durations_s[phase]
+                for run_ in baseline_runs
+                if phase in run_.phase_durations_s
+            ]
+            if not phase_baseline:
+                continue
+            delta_s = duration_s - get_percentile(phase_baseline, 50)
+            if delta_s > slow_run.slowest_phase_delta_s:
+                slow_run.slowest_phase = phase
+                slow_run.slowest_phase_delta_s = delta_s
+        slow_runs.append(slow_run)
+    return slow_runs
+
+
+def get_playlist_stats(runs: Iterable[RunRecord]) -> list[PlaylistStats]:
+    runs_by_playlist: dict[tuple[str, str], list[RunRecord]] = defaultdict(list)
+    for run in runs:
+        runs_by_playlist[(run.station, run.playlist_id)].append(run)
+
+    playlist_stats = []
+    for (station, playlist_id), playlist_runs in sorted(runs_by_playlist.items()):
+        # Failed runs may have stopped early, so are left out of the timings.
+        succeeded_runs = [run for run in playlist_runs if run.error is None]
+
+        durations: dict[str, list[float]] = defaultdict(list)
+        for run in succeeded_runs:
+            for phase, duration_s in get_run_durations(run).items():
+                durations[phase].append(duration_s)
+        phases = {
+            phase: PhaseStats(
+                p50_s=get_percentile(values, 50),
+                p95_s=get_percentile(values, 95),
+                trend=get_trend(values),
+            )
+            for phase, values in durations.items()
+        }
+
+        tracks = sum(run.tracks for run in playlist_runs)
+        stats = PlaylistStats(
+            station=station,
+            playlist_id=playlist_id,
+            runs=len(playlist_runs),
+            failed_runs=len(playlist_runs) - len(succeeded_runs),
+            phases=phases,
+            requests_p50=get_percentile([run.requests for run in playlist_runs], 50),
+            retries=sum(run.retries for run in playlist_runs),
+            cache_hit_rate=(
+                sum(run.cache_hits for run in playlist_runs) / tracks
+                if tracks > 0
+                else None
+            ),
+            tracks_added=sum(run.tracks_added for run in playlist_runs),
+            tracks_removed=sum(run.tracks_removed for run in playlist_runs),
+            slow_runs=find_slow_runs(succeeded_runs),
+        )
+        playlist_stats.append(stats)
+    return playlist_stats
+
+
+def format_playlist_stats(stats: PlaylistStats) -> str:
+    lines = [
+        f"{stats.station} / {stats.playlist_id}: {stats.runs} runs,"
+        f" {stats.failed_runs} failed"
+    ]
+    if stats.phases:
+        lines.append(f"  {'phase':<20}{'p50':>10}{'p95':>10}{'trend':>10}")
+    for phase, phase_stats in stats.phases.items():
+        trend = f"{phase_stats.trend:+.0%}" if phase_stats.trend is not None else "-"
+        lines.append(
+            f"  {phase:<20}{phase_stats.p50_s:>9.3f}s{phase_stats.p95_s:>9.3f}s"
+            f"{trend:>10}"
+        )
+    cache_hit_rate = (
+        f"{stats.cache_hit_rate:.0%}" if stats.cache_hit_rate is not None else "-"
+    )
+    lines.append(
+        f"  {stats.requests_p50:.0f} requests per run (p50), {stats.retries} retries,"
+        f" {cache_hit_rate} cache hits, {stats.tracks_added} tracks added,"
+        f" {stats.tracks_removed} removed"
+    )
+    if stats.slow_runs:
+        lines.append(
+            f"  {len(stats.slow_runs)} runs slower than {SLOW_RUN_FACTOR}x the median"
+            f" of the {BASELINE_RUNS} runs before them:"
+        )
+        for slow_run in stats.slow_runs[-MAX_SLOW_RUNS_SHOWN:]:
+            started_at = dt.datetime.fromtimestamp(slow_run.run.started_ts)
+            line = (
+                f"    {started_at:%Y-%m-%d %H:%M:%S} (run {slow_run.run.run_id}):"
+                f" {slow_run.run.duration_s:.3f}s vs {slow_run.baseline_s:.3f}s"
+            )
+            if slow_run.slowest_phase is not None:
+                line += (
+                    f", {slow_run.slowest_phase}"
+                    f" +{slow_run.slowest_phase_delta_s:.3f}s"
+                )
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def get_stats(days: float, station: str | None = None) -> list[PlaylistStats]:
+    store = Store()
+    try:
+        runs = store.get_runs(
+            since_ts=time.time() - days * 24 * 60 * 60, station=station
+        )
+    finally:
+        store.close()
+    return get_playlist_stats(runs)
@@ -0,0 +1,76 @@
+from dataclasses import dataclass, field
+
+from bbc_to_spotify.playlist.models import PlaylistUpdateResult, ResolveStats
+from bbc_to_spotify.spotify.models.internal import ApiMetrics
+
+
+@dataclass
+class RunRecord:
+    run_id: str
+    command: str
+    station: str
+    playlist_id: str
+    started_ts: float
+    duration_s: float
+    # Includes the station's phases, which are shared by every playlist in the run.
+    phase_durations_s: dict[str, float]
+    requests: int
+    retries: int
+    throttled: int
+    server_errors: int
+    tracks: int
+    cache_hits: int
+    tracks_added: int
+    tracks_removed: int
+    tracks_evicted: int
+    tracks_deferred: int
+    error: str | None = None
+
+    @property
+    def cache_hit_rate(self) -> float | None:
+        if self.tracks == 0:
+            return None
+        return self.cache_hits / self.tracks
+
+
+@dataclass
+class RunRecording:
+    # Filled in while a run is in progress, and recorded once it ends.
+    playlist_ids: list[str]
+    results: list[PlaylistUpdateResult] = field(default_factory=list)
+    resolve_stats: ResolveStats = field(default_factory=ResolveStats)
+    api_metrics: ApiMetrics = field(default_factory=ApiMetrics)
+    phase_durations_s: dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class PhaseStats:
+    p50_s: float
+    p95_s: float
+    # The change in the median of the recent runs, relative to the runs before them.
+    trend: float | None = None
+
+
+@dataclass
+class SlowRun:
+    run: RunRecord
+    baseline_s: float
+    # The phase that grew the most relative to its own baseline, if any did.
+    slowest_phase: str | None = None
+    slowest_phase_delta_s: float = 0
+
+
+@dataclass
+class PlaylistStats:
+    station: str
+    playlist_id: str
+    runs: int
+    failed_runs: int
+    # The whole run's duration is under "total".
+    phases: dict[str, PhaseStats]
+    requests_p50: float
+    retries: int
+    cache_hit_rate: float | None
+    tracks_added: int
+    tracks_removed: int
+    slow_runs: list[SlowRun] = field(default_factory=list)
@@ -1,14 +1,173 @@
+import atexit
+import copy
+import json
 import logging
+import queue
 import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
 from logging import StreamHandler
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = "%(asctime)s: %(name)s - %(levelname)s - %(message)s"
+LOG_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S %Z"
+
+# Fields attached to every record, and written out by the JSON formatter when set.
+CONTEXT_FIELDS = (
+    "run_id",
+    "job_id",
+    "station",
+    "playlist_id",
+    "phase",
+    "duration_s",
+    "peak_memory_mib",
+)
+
+RUN_ID = uuid.uuid4().hex[:12]
+LOG_CONTEXT: ContextVar[dict] = ContextVar("log_context", default={})
+
+# The total duration of each phase, when being recorded, e.g. for the run's history.
+PHASE_DURATIONS: ContextVar[dict[str, float] | None] = ContextVar(
+    "phase_durations", default=None
+)
+
+# The number of phases running while tracemalloc traces, on any thread.
+traced_phases = 0
+traced_phases_lock = threading.Lock()
+
+
+class LogContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run_id = RUN_ID
+        for key, value in LOG_CONTEXT.get().items():
+            setattr(record, key, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry)
+
+
+class LogQueueHandler(QueueHandler):
+    listener: QueueListener | None = None
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike the base class, the traceback is kept apart from the message, so that
+        # each handler's formatter lays it out, e.g. as its own JSON field. It is
+        # rendered here, as the frames may have changed by the time the listener runs.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+@contextmanager
+def log_context(**fields):
+    token = LOG_CONTEXT.set({**LOG_CONTEXT.get(), **fields})
+    try:
+        yield
+    finally:
+        LOG_CONTEXT.reset(token)
+
+
+@contextmanager
+def record_phase_durations(durations: dict[str, float]):
+    token = PHASE_DURATIONS.set(durations)
+    try:
+        yield durations
+    finally:
+        PHASE_DURATIONS.reset(token)
+
+
+@contextmanager
+def log_duration(logger: logging.Logger, phase: str):
+    # When tracemalloc is tracing, the peak is reset at the start of a phase, but only
+    # if no other phase is running, as the peak is global to the process. Phases that
+    # nest or overlap (e.g. resolving the source tracks on one thread while fetching
+    # the destination on another) share the peak since the first of them started.
+    global traced_phases
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        with traced_phases_lock:
+            if traced_phases == 0:
+                tracemalloc.reset_peak()
+            traced_phases += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration_s = round(time.perf_counter() - start, 3)
+        durations = PHASE_DURATIONS.get()
+        if durations is not None:
+            durations[phase] = round(durations.get(phase, 0) + duration_s, 3)
+        if tracing:
+            with traced_phases_lock:
+                traced_phases -= 1
+                peak_memory_mib = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+            logger.info(
+                "Finished %s in %.3fs, peaking at %.1fMiB.",
+                phase,
+                duration_s,
+                peak_memory_mib,
+                extra={
+                    "phase": phase,
+                    "duration_s": duration_s,
+                    "peak_memory_mib": peak_memory_mib,
+                },
+            )
+        else:
+            logger.info(
+                "Finished %s in %.3fs.",
+                phase,
+                duration_s,
+                extra={"phase": phase, "duration_s": duration_s},
+            )
 
 
 def log_uncaught_exceptions(exctype, value, tb):
     logging.error("Uncaught exception", exc_info=(exctype, value, tb))
 
 
-def setup_logging(level: int, filename: str | None = None):
+def stop_logging():
+    # Removes the logging set up by setup_logging, writing out any queued records.
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        if not isinstance(handler, LogQueueHandler):
+            continue
+        root_logger.removeHandler(handler)
+        if handler.listener is not None:
+            atexit.unregister(handler.listener.stop)
+            handler.listener.stop()
+            for listener_handler in handler.listener.handlers:
+                listener_handler.close()
+
+
+def setup_logging(
+    level: int, filename: str | None = None, json_format: bool = False
+) -> QueueListener:
 
     handlers = []
     if filename:
@@ -22,12 +181,31 @@ def setup_logging(level: int, filename: str | None = None):
         stream_handler = StreamHandler()
         handlers.append(stream_handler)
 
-    logging.basicConfig(
-        handlers=handlers,
-        level=level,
-        format="%(asctime)s: %(name)s - %(levelname)s - %(message)s",
-        datefmt="%Y-%m-%dT%H:%M:%S %Z",
-    )
+    if json_format:
+        formatter = JsonFormatter(datefmt=LOG_DATE_FORMAT)
+    else:
+        formatter = logging.Formatter(fmt=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    # Logging set up by an earlier call is replaced, rather than logging twice.
+    stop_logging()
+
+    # Callers only put records on a queue; the file or stream I/O (and rotation)
+    # happens on the listener's own thread.
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = LogQueueHandler(log_queue)
+    queue_handler.addFilter(LogContextFilter())
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    queue_handler.listener = listener
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level)
+    root_logger.addHandler(queue_handler)
 
     # Install exception handler
     sys.excepthook = log_uncaught_exceptions
+
+    return listener
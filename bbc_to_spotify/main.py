@@ -1,10 +1,19 @@
 import logging
+import os
+import sys
+import tracemalloc
+
+from pydantic import ValidationError
 
 from bbc_to_spotify.authorize.authorize import authorize, maybe_get_credentials
 from bbc_to_spotify.cli import setup_parser
+from bbc_to_spotify.history.history import format_playlist_stats, get_stats
 from bbc_to_spotify.logging import setup_logging
 from bbc_to_spotify.playlist.create import create_playlist_and_add_tracks
 from bbc_to_spotify.playlist.update import update_playlist
+from bbc_to_spotify.serve.serve import TOKEN_ENV_VAR, InsecureHostError, serve
+from bbc_to_spotify.store.cache import export_cache, import_cache
+from bbc_to_spotify.store.index import IndexFormatError
 from bbc_to_spotify.utils import get_log_level_for_verbosity
 
 logger = logging.getLogger(__name__)
@@ -18,9 +27,12 @@ def main():
     verbosity = args.verbose - args.quiet
     log_level = get_log_level_for_verbosity(verbosity)
 
-    setup_logging(level=log_level, filename=args.log_file)
+    setup_logging(level=log_level, filename=args.log_file, json_format=args.log_json)
     logger.debug(f"Running with args: {vars(args)}")
 
+    if args.trace_memory:
+        tracemalloc.start()
+
     if args.command == "authorize":
         authorize(redirect_uri=args.redirect_uri)
     elif args.command == "create-playlist":
@@ -39,6 +51,9 @@ def main():
                 private=args.private,
                 description=args.desc,
                 dry_run=args.dry_run,
+                fast_parse=args.fast_parse,
+                hedge_search=args.hedge_search,
+                deadline_s=args.deadline,
             )
             if not args.dry_run:
                 print(
@@ -55,19 +70,66 @@ def main():
                 "SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REFRESH_TOKEN."
             )
         else:
-            update_playlist(
+            results = update_playlist(
                 credentials=credentials,
-                playlist_id=args.playlist_id,
+                playlist_ids=args.playlist_ids,
                 source=args.source,
                 remove_duplicates=args.no_dups,
                 prune_dest=args.prune,
+                max_tracks=args.max_tracks,
                 prepend=args.prepend,
                 update_description=args.update_desc,
                 dry_run=args.dry_run,
+                fast_parse=args.fast_parse,
+                hedge_search=args.hedge_search,
+                deadline_s=args.deadline,
             )
-            if not args.dry_run:
-                print(f"Playlist successfully updated.")
-            else:
-                print("Playlist not updated (dry run).")
+            for result in results:
+                if result.error is not None:
+                    print(
+                        f"Playlist {result.playlist_id} could not be updated: "
+                        f"{result.error}"
+                    )
+                elif not args.dry_run:
+                    print(
+                        f"Playlist {result.playlist_id} successfully updated "
+                        f"({len(result.tracks_added)} added, "
+                        f"{len(result.tracks_removed)} removed, "
+                        f"{result.tracks_evicted} evicted, "
+                        f"{len(result.tracks_deferred)} deferred)."
+                    )
+                else:
+                    print(f"Playlist {result.playlist_id} not updated (dry run).")
+            if any(result.error is not None for result in results):
+                sys.exit(1)
+    elif args.command == "serve":
+        try:
+            serve(
+                host=args.host,
+                port=args.port,
+                workers=args.workers,
+                fast_parse=args.fast_parse,
+                hedge_search=args.hedge_search,
+                token=os.environ.get(TOKEN_ENV_VAR) or None,
+            )
+        except InsecureHostError as e:
+            print(e)
+            sys.exit(1)
+    elif args.command == "export-cache":
+        num_tracks = export_cache(path=args.path)
+        print(f"Exported {num_tracks} resolved tracks to {args.path}.")
+    elif args.command == "import-cache":
+        try:
+            num_tracks = import_cache(path=args.path)
+        except (OSError, IndexFormatError, ValidationError) as e:
+            print(f"Index file {args.path} could not be imported: {e}")
+            sys.exit(1)
+        print(f"Imported {num_tracks} resolved tracks from {args.path}.")
+    elif args.command == "stats":
+        playlist_stats = get_stats(days=args.days, station=args.station)
+        if not playlist_stats:
+            print(f"No runs recorded in the last {args.days:g} days.")
+        else:
+            print("\n\n".join(format_playlist_stats(stats) for stats in playlist_stats))
 
     logger.info("Done")
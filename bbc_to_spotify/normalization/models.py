@@ -0,0 +1,7 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class NormalizedTrack:
+    key: str
+    is_simple: bool
@@ -0,0 +1,68 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+from bbc_to_spotify.normalization.models import NormalizedTrack
+from bbc_to_spotify.scraping.models import ScrapedTrack
+
+# Patterns are compiled once at import, rather than on every call.
+SPECIAL_CHARACTERS_PATTERN = re.compile(r"[^ \w+-.]")
+WHITESPACE_PATTERN = re.compile(r"^\s+|\s+$|\s+(?=\s)")
+# Only match feature credits as whole words, so e.g. "Left" or "Swift" are untouched.
+FEATURED_PATTERN = re.compile(r"\b(?:featuring|feat|ft)\b.*", re.IGNORECASE)
+SECONDARY_ARTISTS_PATTERN = re.compile(
+    r"\s*[(\[]?\s*(?:&|\b(?:featuring|feat|ft)\b).*", re.IGNORECASE
+)
+
+MEMO_SIZE = 4096
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def is_simple_track_or_artist(string: str) -> bool:
+    is_simple_string = (
+        SPECIAL_CHARACTERS_PATTERN.search(string) is None
+        and WHITESPACE_PATTERN.search(string) is None
+        and FEATURED_PATTERN.search(string) is None
+    )
+    return is_simple_string
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def simplify_track_or_artist(string: str) -> str:
+    string = SPECIAL_CHARACTERS_PATTERN.sub("", string)
+    string = FEATURED_PATTERN.sub("", string)
+    string = WHITESPACE_PATTERN.sub("", string)
+    return string
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def get_primary_artist(artist: str) -> str:
+    primary_artist = SECONDARY_ARTISTS_PATTERN.sub("", artist)
+    primary_artist = WHITESPACE_PATTERN.sub("", primary_artist)
+    return primary_artist
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def get_key(string: str) -> str:
+    string = unicodedata.normalize("NFKC", string)
+    return simplify_track_or_artist(string).casefold()
+
+
+def get_track_key(artist: str, track_name: str) -> str:
+    return f"{get_key(artist)} - {get_key(track_name)}"
+
+
+def normalize_scraped_tracks(
+    scraped_tracks: list[ScrapedTrack],
+) -> list[NormalizedTrack]:
+    normalized_tracks = [
+        NormalizedTrack(
+            key=get_track_key(scraped_track.artist, scraped_track.name),
+            is_simple=(
+                is_simple_track_or_artist(scraped_track.artist)
+                and is_simple_track_or_artist(scraped_track.name)
+            ),
+        )
+        for scraped_track in scraped_tracks
+    ]
+    return normalized_tracks
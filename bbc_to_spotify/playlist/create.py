@@ -1,16 +1,28 @@
+import itertools
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 
 from bbc_to_spotify.authorize.models.internal import Credentials
-from bbc_to_spotify.playlist.utils import (
-    Station,
-    add_tracks_to_playlist,
-    scrape_tracks_and_get_from_spotify,
-)
+from bbc_to_spotify.deadline import run_deadline
+from bbc_to_spotify.history.history import record_run
+from bbc_to_spotify.logging import log_context
+from bbc_to_spotify.playlist.models import PlaylistUpdateResult
+from bbc_to_spotify.playlist.stream import TrackStream
+from bbc_to_spotify.playlist.update import stream_station_tracks, update_playlist_tracks
+from bbc_to_spotify.playlist.utils import Station
+from bbc_to_spotify.scraping.models import ScrapedTrack
 from bbc_to_spotify.spotify.models.internal import Playlist, User
 from bbc_to_spotify.spotify.spotify import Spotify
+from bbc_to_spotify.store.store import Store
 
 logger = logging.getLogger(__name__)
 
+# Recorded in the run's history until the playlist is created, so that a run which
+# fails to create it is still recorded.
+UNCREATED_PLAYLIST_ID = "(not created)"
+
 
 def get_user(spotify_client: Spotify) -> User:
     user_model = spotify_client.get_current_user_profile()
@@ -59,40 +71,96 @@ def create_playlist_and_add_tracks(
     private: bool,
     description: str,
     dry_run: bool,
+    fast_parse: bool = False,
+    hedge_search: bool = False,
+    deadline_s: float | None = None,
 ) -> Playlist:
 
+    store = Store()
     spotify_client = Spotify(
         client_id=credentials.client_id,
         client_secret=credentials.client_secret,
         grant_type="refresh_token",
         refresh_token=credentials.refresh_token,
+        store=store,
+        fast_parse=fast_parse,
+        hedge_search=hedge_search,
     )
 
-    source_tracks = scrape_tracks_and_get_from_spotify(
-        spotify_client=spotify_client, station=source
-    )
-
-    user = get_user(spotify_client=spotify_client)
-
-    dest_playlist = create_playlist(
-        spotify_client=spotify_client,
-        user_id=user.id,
-        playlist_name=playlist_name,
-        public=not private,
-        description=description,
-        dry_run=dry_run,
-    )
-
-    add_tracks_to_playlist(
-        spotify_client=spotify_client,
-        playlist_id=dest_playlist.id,
-        dest_tracks=dest_playlist.tracks,
-        source_tracks=source_tracks,
-        remove_duplicates=False,
-        prepend=False,
-        dry_run=dry_run,
-    )
-
-    dest_playlist.tracks = source_tracks
+    with (
+        log_context(station=source),
+        run_deadline(deadline_s),
+        record_run(
+            store=store,
+            command="create-playlist",
+            station=source,
+            playlist_ids=[UNCREATED_PLAYLIST_ID],
+            dry_run=dry_run,
+        ) as recording,
+    ):
+        stream = TrackStream()
+        # Filled in before the stream is closed, so complete once the worker sees the end.
+        deferred_tracks: list[ScrapedTrack] = []
+        # Set if the worker fails, e.g. to create the playlist, so that the station's
+        # tracks are no longer resolved for nothing.
+        cancelled = threading.Event()
+
+        def create_and_fill_playlist() -> tuple[Playlist, PlaylistUpdateResult]:
+            try:
+                return _create_and_fill_playlist()
+            except Exception:
+                cancelled.set()
+                raise
+
+        def _create_and_fill_playlist() -> tuple[Playlist, PlaylistUpdateResult]:
+            user = get_user(spotify_client=spotify_client)
+            # The playlist is only created once the first track is resolved (or the
+            # station is resolved without finding any), so that a scrape which fails
+            # does not leave an empty playlist behind.
+            source_tracks = iter(stream)
+            first_tracks = list(itertools.islice(source_tracks, 1))
+            dest_playlist = create_playlist(
+                spotify_client=spotify_client,
+                user_id=user.id,
+                playlist_name=playlist_name,
+                public=not private,
+                description=description,
+                dry_run=dry_run,
+            )
+            recording.playlist_ids = [dest_playlist.id]
+            result = update_playlist_tracks(
+                spotify_client=spotify_client,
+                playlist_id=dest_playlist.id,
+                source_tracks=itertools.chain(first_tracks, source_tracks),
+                remove_duplicates=False,
+                prune_dest=False,
+                prepend=False,
+                update_description=False,
+                dry_run=dry_run,
+                deferred_tracks=deferred_tracks,
+            )
+            return dest_playlist, result
+
+        # The user's profile is fetched while the station is scraped, and the playlist
+        # is then created and filled as its tracks are resolved.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(copy_context().run, create_and_fill_playlist)
+            stream_station_tracks(
+                spotify_client=spotify_client,
+                station=source,
+                streams=[stream],
+                store=store,
+                deferred_tracks=deferred_tracks,
+                resolve_stats=recording.resolve_stats,
+                cancelled=cancelled,
+            )
+            dest_playlist, result = future.result()
+        recording.results = [result]
+
+    logger.info("Spotify API metrics: %s", spotify_client.get_metrics())
+    spotify_client.close()
+    store.close()
+
+    dest_playlist.tracks = result.tracks_added
 
     return dest_playlist
@@ -0,0 +1,77 @@
+from dataclasses import dataclass, field
+from typing import Callable
+
+from bbc_to_spotify.scraping.models import ScrapedTrack
+from bbc_to_spotify.spotify.models.internal import Track
+
+
+@dataclass
+class PlaylistUpdateResult:
+    playlist_id: str
+    # In the order they were added.
+    tracks_added: list[Track] = field(default_factory=list)
+    tracks_removed: set[Track] = field(default_factory=set)
+    # Source tracks left unresolved because the run's deadline was near.
+    tracks_deferred: list[ScrapedTrack] = field(default_factory=list)
+    # The number of the oldest playlist items removed to keep it within its size limit.
+    tracks_evicted: int = 0
+    # The duration of each of the playlist's own phases, e.g. fetching and mutating it.
+    phase_durations_s: dict[str, float] = field(default_factory=dict)
+    error: Exception | None = None
+
+
+@dataclass
+class ResolveStats:
+    # The unique source tracks, and how many were resolved without searching Spotify.
+    tracks: int = 0
+    cache_hits: int = 0
+
+
+@dataclass(frozen=True)
+class QueryStrategy:
+    name: str
+    build_query: Callable[[str, str], str]
+    # Whether the query does not filter by the artist, so the tracks found must be
+    # checked against it.
+    verify_artist: bool = False
+
+
+@dataclass
+class QueryAttempt:
+    strategy: str
+    latency_s: float
+    found: bool
+
+
+@dataclass
+class QueryStrategyStats:
+    name: str
+    attempts: int = 0
+    hits: int = 0
+    total_latency_s: float = 0
+
+    @property
+    def hit_rate(self) -> float:
+        # Smoothed, so that strategies which are yet to be tried start at even odds.
+        return (self.hits + 1) / (self.attempts + 2)
+
+    @property
+    def mean_latency_s(self) -> float:
+        return self.total_latency_s / self.attempts if self.attempts else 0
+
+
+@dataclass
+class SearchTiming:
+    latency_s: float
+    is_simple: bool
+    hedged: bool
+    # The strategy of the query that found the tracks, if any did.
+    strategy: str | None = None
+    attempts: list[QueryAttempt] = field(default_factory=list)
+
+
+@dataclass
+class ScrapedTracksDiff:
+    added: set[str]
+    removed: set[str]
+    unchanged: set[str]
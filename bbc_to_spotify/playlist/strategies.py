@@ -0,0 +1,148 @@
+import random
+from typing import Iterable, Sequence
+
+from bbc_to_spotify.normalization.normalization import (
+    get_key,
+    get_primary_artist,
+    simplify_track_or_artist,
+)
+from bbc_to_spotify.playlist.models import (
+    QueryStrategy,
+    QueryStrategyStats,
+    SearchTiming,
+)
+from bbc_to_spotify.spotify.models.internal import Track
+
+# At most this many distinct queries are searched for each track, so that tracks which
+# cannot be found do not cost a search per strategy. Names without special characters
+# are usually found by the first query if at all, so only get one.
+MAX_QUERIES_PER_TRACK = 3
+MAX_QUERIES_PER_SIMPLE_TRACK = 1
+
+# Strategies that have rarely found a track once tried this often are no longer tried.
+MIN_ATTEMPTS_TO_DROP = 50
+MIN_HIT_RATE = 0.05
+
+# The share of tracks whose first query is built by a strategy chosen at random, dropped
+# ones included, so that every strategy's hit rate keeps being measured.
+EXPLORATION_RATE = 0.05
+
+
+def build_fielded_query(artist: str, track_name: str) -> str:
+    return f"artist:{artist} track:{track_name}"
+
+
+def build_simplified_query(artist: str, track_name: str) -> str:
+    return build_fielded_query(
+        simplify_track_or_artist(artist), simplify_track_or_artist(track_name)
+    )
+
+
+def build_primary_artist_query(artist: str, track_name: str) -> str:
+    # Drops other credited artists, e.g. "A & B" or "A feat. B", which Spotify may
+    # list separately.
+    return build_fielded_query(
+        simplify_track_or_artist(get_primary_artist(artist)),
+        simplify_track_or_artist(track_name),
+    )
+
+
+def build_quoted_query(artist: str, track_name: str) -> str:
+    # Matches the phrases anywhere, e.g. when the artist is credited on the album.
+    return (
+        f'"{simplify_track_or_artist(get_primary_artist(artist))}"'
+        f' "{simplify_track_or_artist(track_name)}"'
+    )
+
+
+def build_title_only_query(artist: str, track_name: str) -> str:
+    return f"track:{simplify_track_or_artist(track_name)}"
+
+
+# In the order they are tried until there are statistics to rank them by.
+QUERY_STRATEGIES = (
+    QueryStrategy(name="fielded", build_query=build_fielded_query),
+    QueryStrategy(name="simplified", build_query=build_simplified_query),
+    QueryStrategy(name="primary-artist", build_query=build_primary_artist_query),
+    QueryStrategy(name="quoted", build_query=build_quoted_query, verify_artist=True),
+    QueryStrategy(
+        name="title-only", build_query=build_title_only_query, verify_artist=True
+    ),
+)
+
+
+def rank_query_strategies(
+    stats: dict[str, QueryStrategyStats],
+    strategies: Sequence[QueryStrategy] = QUERY_STRATEGIES,
+) -> list[QueryStrategy]:
+    # The likeliest to find a track comes first, then the quickest. Hit rates are only
+    # compared to two places, so that latency can break near ties.
+    def get_rank(i: int) -> tuple[float, float, int]:
+        strategy_stats = stats.get(strategies[i].name, QueryStrategyStats(name=""))
+        return (-round(strategy_stats.hit_rate, 2), strategy_stats.mean_latency_s, i)
+
+    ranked = [strategies[i] for i in sorted(range(len(strategies)), key=get_rank)]
+    kept = [
+        strategy
+        for strategy in ranked
+        if strategy.name not in stats
+        or stats[strategy.name].attempts < MIN_ATTEMPTS_TO_DROP
+        or stats[strategy.name].hit_rate >= MIN_HIT_RATE
+    ]
+    return kept or ranked[:1]
+
+
+def explore_query_strategies(
+    strategies: Sequence[QueryStrategy],
+    all_strategies: Sequence[QueryStrategy] = QUERY_STRATEGIES,
+) -> list[QueryStrategy]:
+    if random.random() >= EXPLORATION_RATE:
+        return list(strategies)
+    explored = random.choice(all_strategies)
+    return [explored, *(strategy for strategy in strategies if strategy != explored)]
+
+
+def build_queries(
+    strategies: Iterable[QueryStrategy],
+    artist: str,
+    track_name: str,
+    max_queries: int = MAX_QUERIES_PER_TRACK,
+) -> list[tuple[QueryStrategy, str]]:
+    # Strategies that build the same query as one before them are skipped, e.g. the
+    # simplified query for names without special characters.
+    queries: dict[str, QueryStrategy] = {}
+    for strategy in strategies:
+        query = strategy.build_query(artist, track_name)
+        if query not in queries:
+            queries[query] = strategy
+        if len(queries) == max_queries:
+            break
+    return [(strategy, query) for query, strategy in queries.items()]
+
+
+def is_by_artist(track: Track, artist: str) -> bool:
+    artist_keys = {get_key(artist), get_key(get_primary_artist(artist))}
+    return any(
+        get_key(track_artist.name) in artist_keys for track_artist in track.artists
+    )
+
+
+def get_query_strategy_stats(
+    search_timings: Iterable[SearchTiming],
+) -> dict[str, QueryStrategyStats]:
+    # Later queries are only searched once the first has missed, so would count the
+    # tracks that are hardest to find against their strategies. Only the first query
+    # of each search is counted, and hedged searches are left out, as the queries that
+    # race record their attempts in whichever order they finish.
+    stats: dict[str, QueryStrategyStats] = {}
+    for timing in search_timings:
+        if timing.hedged or not timing.attempts:
+            continue
+        attempt = timing.attempts[0]
+        strategy_stats = stats.setdefault(
+            attempt.strategy, QueryStrategyStats(name=attempt.strategy)
+        )
+        strategy_stats.attempts += 1
+        strategy_stats.hits += attempt.found
+        strategy_stats.total_latency_s += attempt.latency_s
+    return stats
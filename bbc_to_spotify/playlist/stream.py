@@ -0,0 +1,36 @@
+import queue
+from typing import Iterator
+
+from bbc_to_spotify.spotify.models.internal import Track
+
+
+class SourceTracksError(Exception):
+    pass
+
+
+class TrackStream:
+    # Hands resolved tracks from the resolving threads to a playlist's worker, which
+    # blocks while iterating until the next track is resolved or the stream is closed.
+
+    END = object()
+
+    def __init__(self):
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.error: Exception | None = None
+
+    def put(self, track: Track):
+        self.queue.put(track)
+
+    def close(self, error: Exception | None = None):
+        self.error = error
+        self.queue.put(self.END)
+
+    def __iter__(self) -> Iterator[Track]:
+        while True:
+            item = self.queue.get()
+            if item is self.END:
+                break
+            yield item
+        # A partial source must not be mistaken for the whole of it, e.g. when pruning.
+        if self.error is not None:
+            raise SourceTracksError("Failed to get the source tracks.") from self.error
@@ -1,20 +1,36 @@
 import datetime as dt
+import heapq
 import logging
 import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Iterable
 from zoneinfo import ZoneInfo
 
 from bbc_to_spotify.authorize.models.internal import Credentials
+from bbc_to_spotify.deadline import run_deadline
+from bbc_to_spotify.history.history import record_run
+from bbc_to_spotify.logging import log_context, log_duration, record_phase_durations
+from bbc_to_spotify.playlist.models import PlaylistUpdateResult, ResolveStats
+from bbc_to_spotify.playlist.stream import TrackStream
 from bbc_to_spotify.playlist.utils import (
     Station,
     add_tracks_to_playlist,
-    get_playlist,
+    iter_playlist_tracks,
     scrape_tracks_and_get_from_spotify,
 )
-from bbc_to_spotify.spotify.models.internal import Playlist, Track
+from bbc_to_spotify.scraping.models import ScrapedTrack
+from bbc_to_spotify.spotify.models.internal import Track
 from bbc_to_spotify.spotify.spotify import Spotify
+from bbc_to_spotify.store.locks import file_lock
+from bbc_to_spotify.store.store import Store
 
 logger = logging.getLogger(__name__)
 
+ADD_BATCH_SIZE = 100
+
 
 def make_updated_playlist_description(description: str) -> str:
 
@@ -39,11 +55,12 @@ def make_updated_playlist_description(description: str) -> str:
 
 
 def add_timestamp_to_desc(
-    spotify_client: Spotify, playlist: Playlist, dry_run: bool = False
+    spotify_client: Spotify, playlist_id: str, dry_run: bool = False
 ):
     logger.info("Updating playlist description.")
-    if playlist.description:
-        description = make_updated_playlist_description(playlist.description)
+    playlist_meta = spotify_client.get_playlist_meta(playlist_id=playlist_id)
+    if playlist_meta.description:
+        description = make_updated_playlist_description(playlist_meta.description)
     else:
         ts = dt.datetime.now(tz=ZoneInfo("Europe/London")).strftime(
             "%d-%m-%Y %H:%M:%S (%Z)"
@@ -51,7 +68,7 @@ def add_timestamp_to_desc(
         description = f"Last updated: {ts}"
     if not dry_run:
         spotify_client.change_playlist_details(
-            playlist_id=playlist.id,
+            playlist_id=playlist_id,
             description=description,
         )
     else:
@@ -61,89 +78,347 @@ def add_timestamp_to_desc(
 def add_tracks_and_prune_playlist(
     spotify_client: Spotify,
     playlist_id: str,
-    dest_tracks: list[Track],
-    source_tracks: list[Track],
+    dest_track_counts: Counter[Track],
+    source_tracks: Iterable[Track],
+    prune_dest: bool,
     prepend: bool,
     dry_run: bool,
-):
+    deferred_tracks: list[ScrapedTrack] | None = None,
+) -> tuple[list[Track], set[Track]]:
 
-    logger.info("Pruning destination playlist.")
-    # Deduplicate the destination playlist, and remove any tracks that are not in the
-    # source playlist.
-    tracks_to_stay = set(t for t in source_tracks if dest_tracks.count(t) == 1)
-    tracks_to_remove = set(dest_tracks).difference(tracks_to_stay)
+    # In the order they were added, each at most once.
+    tracks_added: list[Track] = []
+    seen_tracks: set[Track] = set()
+    # Tracks duplicated in the destination are removed when pruning, and then added
+    # back once, so they wait until every source track has been seen.
+    held_back_tracks: list[Track] = []
 
-    if tracks_to_remove:
-        logger.info(
-            f"Removing these tracks: {[track.name for track in tracks_to_remove]}"
-        )
-        if not dry_run:
-            spotify_client.remove_from_playlist(
+    # Source tracks are added in batches as they are resolved, rather than all at once.
+    batch: list[Track] = []
+    for track in source_tracks:
+        if track in seen_tracks:
+            continue
+        seen_tracks.add(track)
+        dest_count = dest_track_counts[track]
+        if prune_dest and dest_count > 1:
+            held_back_tracks.append(track)
+        elif dest_count == 0:
+            batch.append(track)
+        if len(batch) == ADD_BATCH_SIZE:
+            add_tracks_to_playlist(
+                spotify_client=spotify_client,
                 playlist_id=playlist_id,
-                track_uris=[track.uri for track in tracks_to_remove],
+                tracks=batch,
+                prepend=prepend,
+                dry_run=dry_run,
             )
+            tracks_added.extend(batch)
+            batch = []
+    if batch:
+        add_tracks_to_playlist(
+            spotify_client=spotify_client,
+            playlist_id=playlist_id,
+            tracks=batch,
+            prepend=prepend,
+            dry_run=dry_run,
+        )
+        tracks_added.extend(batch)
+
+    tracks_to_remove: set[Track] = set()
+    if prune_dest:
+        logger.info(f"Pruning destination playlist {playlist_id}.")
+        # Deduplicate the destination playlist, and remove any tracks that are not in
+        # the source playlist. Deferred tracks may be in the destination, so when any
+        # were deferred the source is incomplete and only duplicates are removed.
+        source_complete = not deferred_tracks
+        tracks_to_remove = set(
+            track
+            for track, count in dest_track_counts.items()
+            if count > 1 or (source_complete and track not in seen_tracks)
+        )
+        if tracks_to_remove:
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "Removing these tracks: %s",
+                    [track.name for track in tracks_to_remove],
+                )
+            if not dry_run:
+                spotify_client.remove_from_playlist(
+                    playlist_id=playlist_id,
+                    track_uris=[track.uri for track in tracks_to_remove],
+                )
+            else:
+                logger.info("No tracks removed (dry run).")
         else:
-            logger.info("No tracks removed (dry run).")
-    else:
-        logger.info("No tracks to remove.")
-
-    # Only add tracks that are not in the remaining source tracks
-    add_tracks_to_playlist(
-        spotify_client=spotify_client,
-        playlist_id=playlist_id,
-        dest_tracks=list(tracks_to_stay),
-        source_tracks=source_tracks,
-        remove_duplicates=True,
-        prepend=prepend,
-        dry_run=dry_run,
+            logger.info("No tracks to remove.")
+
+        if held_back_tracks:
+            add_tracks_to_playlist(
+                spotify_client=spotify_client,
+                playlist_id=playlist_id,
+                tracks=held_back_tracks,
+                prepend=prepend,
+                dry_run=dry_run,
+            )
+            tracks_added.extend(held_back_tracks)
+
+    if not tracks_added:
+        logger.info("No tracks to add.")
+
+    return tracks_added, tracks_to_remove
+
+
+def evict_oldest_tracks(
+    spotify_client: Spotify, playlist_id: str, max_tracks: int, dry_run: bool
+) -> int:
+
+    snapshot_id = spotify_client.get_playlist_meta(playlist_id=playlist_id).snapshot_id
+
+    # One pass over the playlist, keeping when and where each item was added.
+    items: list[tuple[dt.datetime, int, str]] = []
+    num_items = 0
+    for page in spotify_client.iter_playlist_added_items(playlist_id=playlist_id):
+        for item in page:
+            # Unavailable tracks still take up a position, but cannot be removed.
+            if item.track is not None:
+                items.append((item.added_at, num_items, item.track.uri))
+            num_items += 1
+
+    num_to_evict = num_items - max_tracks
+    if num_to_evict <= 0:
+        logger.info(f"Playlist has {num_items} tracks, so none need evicting.")
+        return 0
+
+    # The oldest items go first, ties broken by the earliest position.
+    evicted_items = heapq.nsmallest(num_to_evict, items)
+    logger.info(
+        f"Evicting the {len(evicted_items)} oldest of {num_items} tracks, to keep the"
+        f" playlist within {max_tracks} tracks."
     )
+    if not dry_run:
+        spotify_client.remove_from_playlist_by_position(
+            playlist_id=playlist_id,
+            items=[(uri, position) for _, position, uri in evicted_items],
+            snapshot_id=snapshot_id,
+        )
+    else:
+        logger.info("No tracks evicted (dry run).")
+
+    return len(evicted_items)
+
+
+def stream_station_tracks(
+    spotify_client: Spotify,
+    station: Station,
+    streams: list[TrackStream],
+    store: Store | None = None,
+    deferred_tracks: list[ScrapedTrack] | None = None,
+    resolve_stats: ResolveStats | None = None,
+    cancelled: threading.Event | None = None,
+):
+    def publish(track: Track):
+        for stream in streams:
+            stream.put(track)
+
+    try:
+        scrape_tracks_and_get_from_spotify(
+            spotify_client=spotify_client,
+            station=station,
+            store=store,
+            on_resolved=publish,
+            deferred_tracks=deferred_tracks,
+            resolve_stats=resolve_stats,
+            cancelled=cancelled,
+        )
+    except Exception as e:
+        for stream in streams:
+            stream.close(error=e)
+        raise
+    for stream in streams:
+        stream.close()
+
+
+def update_playlist_tracks(
+    spotify_client: Spotify,
+    playlist_id: str,
+    source_tracks: Iterable[Track],
+    remove_duplicates: bool,
+    prune_dest: bool,
+    prepend: bool,
+    update_description: bool,
+    dry_run: bool,
+    deferred_tracks: list[ScrapedTrack] | None = None,
+    max_tracks: int | None = None,
+) -> PlaylistUpdateResult:
+
+    # The playlist lock stops other processes on the host mutating it at the same time.
+    result = PlaylistUpdateResult(playlist_id=playlist_id)
+    with (
+        log_context(playlist_id=playlist_id),
+        record_phase_durations(result.phase_durations_s),
+        file_lock(f"playlist-{playlist_id}"),
+    ):
+
+        # The destination is fetched while the source tracks are still being resolved.
+        # The counts are built as the destination tracks stream in, so the full
+        # destination playlist is never held in memory.
+        dest_track_counts: Counter[Track] = Counter()
+        if remove_duplicates or prune_dest:
+            with log_duration(logger, "fetch destination"):
+                dest_track_counts.update(
+                    iter_playlist_tracks(
+                        spotify_client=spotify_client, playlist_id=playlist_id
+                    )
+                )
+
+        with log_duration(logger, "mutate"):
+            result.tracks_added, result.tracks_removed = add_tracks_and_prune_playlist(
+                spotify_client=spotify_client,
+                playlist_id=playlist_id,
+                dest_track_counts=dest_track_counts,
+                source_tracks=source_tracks,
+                prune_dest=prune_dest,
+                prepend=prepend,
+                dry_run=dry_run,
+                deferred_tracks=deferred_tracks,
+            )
+        if deferred_tracks:
+            result.tracks_deferred = list(deferred_tracks)
+
+        if max_tracks is not None:
+            with log_duration(logger, "evict"):
+                result.tracks_evicted = evict_oldest_tracks(
+                    spotify_client=spotify_client,
+                    playlist_id=playlist_id,
+                    max_tracks=max_tracks,
+                    dry_run=dry_run,
+                )
+
+        if update_description:
+            add_timestamp_to_desc(
+                spotify_client=spotify_client, playlist_id=playlist_id, dry_run=dry_run
+            )
+
+    return result
 
 
 def update_playlist(
     credentials: Credentials,
-    playlist_id: str,
+    playlist_ids: list[str],
     source: Station,
     remove_duplicates: bool,
     prune_dest: bool,
     prepend: bool,
     update_description: bool,
     dry_run: bool,
-):
+    fast_parse: bool = False,
+    hedge_search: bool = False,
+    deadline_s: float | None = None,
+    max_tracks: int | None = None,
+) -> list[PlaylistUpdateResult]:
 
+    store = Store()
     spotify_client = Spotify(
         client_id=credentials.client_id,
         client_secret=credentials.client_secret,
         grant_type="refresh_token",
         refresh_token=credentials.refresh_token,
+        store=store,
+        fast_parse=fast_parse,
+        hedge_search=hedge_search,
     )
 
-    source_tracks = scrape_tracks_and_get_from_spotify(
-        spotify_client=spotify_client, station=source
-    )
-
-    dest_playlist = get_playlist(spotify_client=spotify_client, playlist_id=playlist_id)
-
-    if prune_dest:
-        add_tracks_and_prune_playlist(
-            spotify_client=spotify_client,
-            playlist_id=dest_playlist.id,
-            dest_tracks=dest_playlist.tracks,
-            source_tracks=source_tracks,
-            prepend=prepend,
+    with (
+        log_context(station=source),
+        run_deadline(deadline_s),
+        record_run(
+            store=store,
+            command="update-playlist",
+            station=source,
+            playlist_ids=playlist_ids,
             dry_run=dry_run,
-        )
-    else:
-        add_tracks_to_playlist(
+        ) as recording,
+    ):
+        results = recording.results = update_playlists(
             spotify_client=spotify_client,
-            playlist_id=dest_playlist.id,
-            dest_tracks=dest_playlist.tracks,
-            source_tracks=source_tracks,
+            playlist_ids=playlist_ids,
+            station=source,
+            store=store,
             remove_duplicates=remove_duplicates,
+            prune_dest=prune_dest,
             prepend=prepend,
+            update_description=update_description,
             dry_run=dry_run,
+            max_tracks=max_tracks,
+            resolve_stats=recording.resolve_stats,
         )
 
-    if update_description:
-        add_timestamp_to_desc(
-            spotify_client=spotify_client, playlist=dest_playlist, dry_run=dry_run
+    logger.info("Spotify API metrics: %s", spotify_client.get_metrics())
+    spotify_client.close()
+    store.close()
+
+    return results
+
+
+def update_playlists(
+    spotify_client: Spotify,
+    playlist_ids: list[str],
+    station: Station,
+    remove_duplicates: bool,
+    prune_dest: bool,
+    prepend: bool,
+    update_description: bool,
+    dry_run: bool,
+    store: Store | None = None,
+    max_tracks: int | None = None,
+    resolve_stats: ResolveStats | None = None,
+) -> list[PlaylistUpdateResult]:
+
+    # Guard against the same playlist being mutated by two workers at once.
+    playlist_ids = list(dict.fromkeys(playlist_ids))
+
+    # Each playlist's worker fetches its destination and mutates it as the station's
+    # tracks are resolved, rather than waiting for all of them.
+    streams = {playlist_id: TrackStream() for playlist_id in playlist_ids}
+    # Filled in before the streams are closed, so complete once a worker sees the end.
+    deferred_tracks: list[ScrapedTrack] = []
+
+    results: list[PlaylistUpdateResult] = []
+    with ThreadPoolExecutor(max_workers=len(playlist_ids)) as executor:
+        futures = {
+            # Each worker runs in a copy of this context, so its logs keep the station.
+            playlist_id: executor.submit(
+                copy_context().run,
+                update_playlist_tracks,
+                spotify_client=spotify_client,
+                playlist_id=playlist_id,
+                source_tracks=streams[playlist_id],
+                remove_duplicates=remove_duplicates,
+                prune_dest=prune_dest,
+                prepend=prepend,
+                update_description=update_description,
+                dry_run=dry_run,
+                deferred_tracks=deferred_tracks,
+                max_tracks=max_tracks,
+            )
+            for playlist_id in playlist_ids
+        }
+
+        # The station is scraped and resolved once, however many playlists it feeds.
+        stream_station_tracks(
+            spotify_client=spotify_client,
+            station=station,
+            streams=list(streams.values()),
+            store=store,
+            deferred_tracks=deferred_tracks,
+            resolve_stats=resolve_stats,
         )
+
+        for playlist_id, future in futures.items():
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.exception(f"Failed to update playlist {playlist_id}.")
+                results.append(PlaylistUpdateResult(playlist_id=playlist_id, error=e))
+
+    return results
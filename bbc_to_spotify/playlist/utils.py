@@ -1,41 +1,142 @@
 import logging
-import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+from typing import Callable, Iterable, Iterator, Sequence
 
+from bbc_to_spotify.deadline import is_nearly_spent
+from bbc_to_spotify.logging import log_duration
+from bbc_to_spotify.normalization.normalization import (
+    is_simple_track_or_artist,
+    normalize_scraped_tracks,
+)
+from bbc_to_spotify.playlist.models import (
+    QueryAttempt,
+    QueryStrategy,
+    ResolveStats,
+    ScrapedTracksDiff,
+    SearchTiming,
+)
+from bbc_to_spotify.playlist.strategies import (
+    MAX_QUERIES_PER_SIMPLE_TRACK,
+    MAX_QUERIES_PER_TRACK,
+    QUERY_STRATEGIES,
+    build_queries,
+    explore_query_strategies,
+    get_query_strategy_stats,
+    is_by_artist,
+    rank_query_strategies,
+)
+from bbc_to_spotify.scraping.models import ScrapedTrack
 from bbc_to_spotify.scraping.scraping import scrape_tracks_from_playlist_page
-from bbc_to_spotify.spotify.models.internal import Playlist, Track
+from bbc_to_spotify.spotify.models.internal import Track
 from bbc_to_spotify.spotify.spotify import Spotify
-from bbc_to_spotify.utils import Station, get_playlist_url
+from bbc_to_spotify.store.locks import file_lock
+from bbc_to_spotify.store.store import Store
+from bbc_to_spotify.utils import Station, get_percentile, get_playlist_url
 
 logger = logging.getLogger(__name__)
 
-SPECIAL_CHARACTERS_PATTEN = r"[^ \w+-.]"
-WHITESPACE_PATTERN = r"^\s+|\s$|\s+(?=\s)"
-FEATURED_PATTERN = r"feat.*|ft.*|featuring.*"
+RESOLVE_WORKERS = 16
 
+# Up to REVALIDATE_BUDGET cached resolutions older than a week are revalidated per run.
+REVALIDATE_MAX_AGE_S = 7 * 24 * 60 * 60
+REVALIDATE_BUDGET = 100
 
-def is_simple_track_or_artist(string: str) -> bool:
-    special_chars_match = re.search(pattern=SPECIAL_CHARACTERS_PATTEN, string=string)
-    whitespace_match = re.search(pattern=WHITESPACE_PATTERN, string=string)
-    featured_match = re.search(pattern=FEATURED_PATTERN, string=string)
-    is_simple_string = (
-        special_chars_match is None
-        and whitespace_match is None
-        and featured_match is None
-    )
-    return is_simple_string
 
+def iter_playlist_tracks(spotify_client: Spotify, playlist_id: str) -> Iterator[Track]:
+    num_tracks = 0
+    if spotify_client.fast_parse:
+        for tracks in spotify_client.iter_playlist_tracks_fast(playlist_id=playlist_id):
+            num_tracks += len(tracks)
+            yield from tracks
+    else:
+        for tracks_with_meta_model in spotify_client.iter_playlist_items(
+            playlist_id=playlist_id
+        ):
+            for track_with_meta_model in tracks_with_meta_model.items:
+                if track_with_meta_model.track is None:
+                    continue
+                num_tracks += 1
+                yield Track.from_external(track_with_meta_model.track)
+    logger.debug(f"{num_tracks} tracks retrieved.")
+
+
+def search_for_tracks(spotify_client: Spotify, query: str) -> list[Track]:
+    if spotify_client.fast_parse:
+        tracks = spotify_client.search_for_tracks_fast(query=query)
+    else:
+        track_models = spotify_client.search_for_tracks(query=query)
+        tracks = [Track.from_external(track_model) for track_model in track_models]
+    return tracks
 
-def simplify_track_or_artist(string: str) -> str:
-    string = re.sub(pattern=SPECIAL_CHARACTERS_PATTEN, repl="", string=string)
-    string = re.sub(pattern=FEATURED_PATTERN, repl="", string=string)
-    string = re.sub(pattern=WHITESPACE_PATTERN, repl="", string=string)
-    return string
+
+def search_with_strategy(
+    spotify_client: Spotify,
+    strategy: QueryStrategy,
+    query: str,
+    artist: str,
+    attempts: list[QueryAttempt],
+) -> list[Track]:
+    start = time.perf_counter()
+    tracks = search_for_tracks(spotify_client=spotify_client, query=query)
+    if strategy.verify_artist:
+        tracks = [track for track in tracks if is_by_artist(track=track, artist=artist)]
+    attempts.append(
+        QueryAttempt(
+            strategy=strategy.name,
+            latency_s=time.perf_counter() - start,
+            found=bool(tracks),
+        )
+    )
+    return tracks
 
 
-def get_playlist(spotify_client: Spotify, playlist_id: str) -> Playlist:
-    playlist_model = spotify_client.get_playlist(playlist_id=playlist_id)
-    playlist = Playlist.from_external(playlist_model)
-    return playlist
+def search_for_tracks_hedged(
+    spotify_client: Spotify,
+    queries: list[tuple[QueryStrategy, str]],
+    artist: str,
+    attempts: list[QueryAttempt],
+) -> tuple[list[Track], QueryStrategy | None]:
+    # The queries race, and the first to find any tracks wins. The others are cancelled
+    # if they have not started yet, and their results ignored otherwise. Only the
+    # attempts of queries that finished are counted. A query that fails only fails
+    # the search if no other query finds the track, so that a failure is never
+    # mistaken for a miss.
+    futures = {}
+    for strategy, query in queries:
+        query_attempts: list[QueryAttempt] = []
+        future = spotify_client.get_hedge_executor().submit(
+            copy_context().run,
+            search_with_strategy,
+            spotify_client=spotify_client,
+            strategy=strategy,
+            query=query,
+            artist=artist,
+            attempts=query_attempts,
+        )
+        futures[future] = (strategy, query_attempts)
+    tracks: list[Track] = []
+    strategy = None
+    errors: list[BaseException] = []
+    try:
+        for future in as_completed(futures):
+            attempts.extend(futures[future][1])
+            if future.exception() is not None:
+                errors.append(future.exception())
+                continue
+            tracks = future.result()
+            if tracks:
+                strategy = futures[future][0]
+                break
+    finally:
+        for future in futures:
+            future.cancel()
+    if strategy is None and errors:
+        raise errors[0]
+    return tracks, strategy
 
 
 def get_tracks_by_artist_and_track_name(
@@ -43,57 +144,406 @@ def get_tracks_by_artist_and_track_name(
     artist: str,
     track_name: str,
     retry_without_special_characters: bool = True,
+    search_timings: list[SearchTiming] | None = None,
+    strategies: Sequence[QueryStrategy] = QUERY_STRATEGIES,
+    is_simple: bool | None = None,
 ) -> set[Track]:
-    track_models = spotify_client.search_for_track_by_artist_and_track_name(
-        artist=artist, track_name=track_name
+    start = time.perf_counter()
+    # Known already when the track was normalized, e.g. for a scraped track.
+    if is_simple is None:
+        is_simple = is_simple_track_or_artist(artist) and is_simple_track_or_artist(
+            track_name
+        )
+    queries = build_queries(
+        strategies=explore_query_strategies(strategies),
+        artist=artist,
+        track_name=track_name,
+        max_queries=(
+            MAX_QUERIES_PER_TRACK
+            if retry_without_special_characters and not is_simple
+            else MAX_QUERIES_PER_SIMPLE_TRACK
+        ),
     )
+    # Only tracks with special characters race their first two queries, as simple ones
+    # are usually found by the first.
+    hedged = spotify_client.hedge_search and len(queries) > 1 and not is_simple
 
-    if not track_models and (
-        retry_without_special_characters
-        and (
-            not is_simple_track_or_artist(artist)
-            or not is_simple_track_or_artist(track_name)
+    attempts: list[QueryAttempt] = []
+    tracks: list[Track] = []
+    strategy = None
+    if hedged:
+        tracks, strategy = search_for_tracks_hedged(
+            spotify_client=spotify_client,
+            queries=queries[:2],
+            artist=artist,
+            attempts=attempts,
+        )
+        queries = queries[2:]
+    for query_strategy, query in queries:
+        if tracks:
+            break
+        if attempts:
+            logger.debug(
+                "Could not find track. Retrying with the %s query strategy.",
+                query_strategy.name,
+            )
+        tracks = search_with_strategy(
+            spotify_client=spotify_client,
+            strategy=query_strategy,
+            query=query,
+            artist=artist,
+            attempts=attempts,
         )
-    ):
-        logger.debug(
-            "Could not find track. Retrying with simplified artist and track names."
+        if tracks:
+            strategy = query_strategy
+
+    if search_timings is not None:
+        search_timings.append(
+            SearchTiming(
+                latency_s=time.perf_counter() - start,
+                is_simple=is_simple,
+                hedged=hedged,
+                strategy=strategy.name if strategy is not None else None,
+                attempts=attempts,
+            )
         )
-        artist_ = simplify_track_or_artist(artist)
-        track_name_ = simplify_track_or_artist(track_name)
-        track_models = spotify_client.search_for_track_by_artist_and_track_name(
-            artist=artist_, track_name=track_name_
+
+    return set(tracks)
+
+
+def log_search_timings(search_timings: list[SearchTiming]):
+    if not search_timings:
+        return
+    latencies = [timing.latency_s for timing in search_timings]
+    num_queries = sum(len(timing.attempts) for timing in search_timings)
+    logger.info(
+        "Searched for %d tracks with %.2f queries each on average, taking %.3fs at p50"
+        " and %.3fs at p95.",
+        len(search_timings),
+        num_queries / len(search_timings),
+        get_percentile(latencies, 50),
+        get_percentile(latencies, 95),
+    )
+    special_latencies = [
+        timing.latency_s for timing in search_timings if not timing.is_simple
+    ]
+    if special_latencies:
+        logger.info(
+            "%d had special characters (%d hedged), taking %.3fs at p50 and %.3fs at"
+            " p95.",
+            len(special_latencies),
+            sum(timing.hedged for timing in search_timings),
+            get_percentile(special_latencies, 50),
+            get_percentile(special_latencies, 95),
         )
+    strategy_counts = Counter(
+        timing.strategy for timing in search_timings if timing.strategy is not None
+    )
+    logger.info(
+        "Tracks found by each query strategy: %s",
+        ", ".join(f"{name} {count}" for name, count in strategy_counts.most_common()),
+    )
 
-    tracks = {Track.from_external(track_model) for track_model in track_models}
 
-    return tracks
+def resolve_scraped_track(
+    spotify_client: Spotify,
+    scraped_track: ScrapedTrack,
+    key: str,
+    store: Store | None = None,
+    search_timings: list[SearchTiming] | None = None,
+    deferred_tracks: list[ScrapedTrack] | None = None,
+    strategies: Sequence[QueryStrategy] = QUERY_STRATEGIES,
+    cached_keys: list[str] | None = None,
+    cancelled: threading.Event | None = None,
+    is_simple: bool | None = None,
+) -> Track | None:
+
+    if cancelled is not None and cancelled.is_set():
+        return None
+
+    text = f"{scraped_track.artist} - {scraped_track.name}"
+    if store is not None:
+        if store.is_known_miss(key=key, text=text):
+            logger.debug("Skipping known unresolvable track: %s", scraped_track)
+            return None
+        track = store.get_resolved_track(key=key)
+        if track is not None:
+            logger.debug("Using cached resolution of track: %s", scraped_track)
+            if cached_keys is not None:
+                cached_keys.append(key)
+            return track
+
+    # Deferred tracks are not recorded as misses, so are searched for on the next run.
+    if is_nearly_spent():
+        logger.debug("Deferring track, as the deadline is near: %s", scraped_track)
+        if deferred_tracks is not None:
+            deferred_tracks.append(scraped_track)
+        return None
+
+    spotify_tracks = get_tracks_by_artist_and_track_name(
+        spotify_client=spotify_client,
+        artist=scraped_track.artist,
+        track_name=scraped_track.name,
+        search_timings=search_timings,
+        strategies=strategies,
+        is_simple=is_simple,
+    )
+    if spotify_tracks:
+        tracks = sorted(
+            list(spotify_tracks),
+            key=lambda x: (x.popularity, x.id),
+            reverse=True,  # make deterministic
+        )
+        logger.info("Successfully found track on Spotify: %s", scraped_track)
+        if store is not None:
+            store.clear_miss(key=key)
+            store.set_resolved_track(key=key, track=tracks[0])
+        return tracks[0]
+    else:
+        logger.warning("Could not find track on Spotify: %s", scraped_track)
+        if store is not None:
+            store.record_miss(key=key, text=text)
+        return None
+
+
+def revalidate_resolved_tracks(
+    spotify_client: Spotify,
+    store: Store,
+    max_age_s: float = REVALIDATE_MAX_AGE_S,
+    budget: int = REVALIDATE_BUDGET,
+):
+    # Refresh the oldest cached resolutions in bulk, evicting any that are no longer
+    # playable so that they are searched for again.
+    stale_tracks = store.get_stale_resolved_tracks(max_age_s=max_age_s, limit=budget)
+    if not stale_tracks:
+        return
+
+    track_models = spotify_client.get_tracks(
+        track_ids=[track.id for track in stale_tracks.values()], market="from_token"
+    )
+    num_evicted = 0
+    for key, track_model in zip(stale_tracks.keys(), track_models):
+        if track_model is None or track_model.is_playable is False:
+            store.evict_resolved_track(key=key)
+            num_evicted += 1
+        else:
+            store.update_resolved_track(key=key, track=Track.from_external(track_model))
+    logger.info(
+        f"Revalidated {len(stale_tracks)} cached tracks, evicting {num_evicted}."
+    )
+
+
+def prepare_to_resolve(spotify_client: Spotify, store: Store | None = None):
+    spotify_client.prefetch_access_token()
+    if store is not None:
+        revalidate_resolved_tracks(spotify_client=spotify_client, store=store)
+
+
+def diff_scraped_tracks(
+    previous_keys: Iterable[str], current_keys: Iterable[str]
+) -> ScrapedTracksDiff:
+    previous_keys = set(previous_keys)
+    current_keys = set(current_keys)
+    diff = ScrapedTracksDiff(
+        added=current_keys.difference(previous_keys),
+        removed=previous_keys.difference(current_keys),
+        unchanged=current_keys.intersection(previous_keys),
+    )
+    return diff
 
 
 def scrape_tracks_and_get_from_spotify(
-    spotify_client: Spotify, station: Station
+    spotify_client: Spotify,
+    station: Station,
+    store: Store | None = None,
+    on_resolved: Callable[[Track], None] | None = None,
+    deferred_tracks: list[ScrapedTrack] | None = None,
+    resolve_stats: ResolveStats | None = None,
+    cancelled: threading.Event | None = None,
 ) -> list[Track]:
 
-    playlist_url = get_playlist_url(station=station)
+    if store is None:
+        return _scrape_tracks_and_get_from_spotify(
+            spotify_client=spotify_client,
+            station=station,
+            on_resolved=on_resolved,
+            deferred_tracks=deferred_tracks,
+            resolve_stats=resolve_stats,
+            cancelled=cancelled,
+        )
+
+    # Other processes scraping the same station wait here, and then reuse the page
+    # and resolutions that the first one stored.
+    with file_lock(f"station-{station}"):
+        return _scrape_tracks_and_get_from_spotify(
+            spotify_client=spotify_client,
+            station=station,
+            store=store,
+            on_resolved=on_resolved,
+            deferred_tracks=deferred_tracks,
+            resolve_stats=resolve_stats,
+            cancelled=cancelled,
+        )
+
 
-    scraped_radio_6_tracks = scrape_tracks_from_playlist_page(playlist_url=playlist_url)
+def _scrape_tracks_and_get_from_spotify(
+    spotify_client: Spotify,
+    station: Station,
+    store: Store | None = None,
+    on_resolved: Callable[[Track], None] | None = None,
+    deferred_tracks: list[ScrapedTrack] | None = None,
+    resolve_stats: ResolveStats | None = None,
+    cancelled: threading.Event | None = None,
+) -> list[Track]:
+
+    # Searches run concurrently; the client's limiter decides how many are in flight.
+    # Keyed in the order the tracks were scraped.
+    pending: dict[str, Track | None | Future] = {}
+    pending_lock = threading.Lock()
+    num_released = 0
+
+    # on_resolved is called with each track in the order they were scraped, as soon
+    # as it and every track before it are resolved, so that callers can start using
+    # tracks before all are ready. Tracks that were not found, or failed to resolve,
+    # are skipped.
+    def release_resolved(*args):
+        nonlocal num_released
+        with pending_lock:
+            keys = list(pending)
+            while num_released < len(keys):
+                track = pending[keys[num_released]]
+                if isinstance(track, Future):
+                    if not track.done():
+                        break
+                    track = track.result() if track.exception() is None else None
+                num_released += 1
+                if track is not None:
+                    on_resolved(track)
+
+    playlist_url = get_playlist_url(station=station)
 
-    spotify_radio_6_tracks: list[Track] = []
-    for scraped_track in scraped_radio_6_tracks:
-        spotify_tracks = get_tracks_by_artist_and_track_name(
+    # The token is fetched and the cache revalidated while the page is downloaded and
+    # parsed, as neither depends on it. Resolving depends on both.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        preparation = executor.submit(
+            copy_context().run,
+            prepare_to_resolve,
             spotify_client=spotify_client,
-            artist=scraped_track.artist,
-            track_name=scraped_track.name,
-        )
-        if spotify_tracks:
-            tracks = sorted(
-                list(spotify_tracks),
-                key=lambda x: (x.popularity, x.id),
-                reverse=True,  # make deterministic
+            store=store,
+        )
+        with log_duration(logger, "scrape"):
+            scraped_radio_6_tracks = scrape_tracks_from_playlist_page(
+                playlist_url=playlist_url, store=store
             )
-            logger.info(f"Successfully found track on Spotify: {scraped_track}")
-            spotify_radio_6_tracks.append(tracks[0])
-        else:
-            logger.warning(f"Could not find track on Spotify: {scraped_track}")
+        preparation.result()
+
+    # Set once nothing is left to use the tracks, e.g. when the playlist to fill could
+    # not be created, so that no more are searched for.
+    if cancelled is not None and cancelled.is_set():
+        logger.info("Not resolving the scraped tracks, as the run was cancelled.")
+        return []
+
+    search_timings: list[SearchTiming] = []
+    if deferred_tracks is None:
+        deferred_tracks = []
+    # Query strategies are tried in order of how often they have found tracks before.
+    strategies = rank_query_strategies(
+        stats=store.get_query_strategy_stats() if store is not None else {}
+    )
+    logger.debug(
+        "Ranked query strategies: %s", [strategy.name for strategy in strategies]
+    )
+    with log_duration(logger, "resolve"):
+        normalized_tracks = normalize_scraped_tracks(scraped_radio_6_tracks)
+
+        # Only entries that are new since the station's previous scrape need searching
+        # for; unchanged entries reuse the resolution stored last time.
+        previous_resolutions = (
+            store.get_scraped_tracks(station=station) if store is not None else {}
+        )
+        diff = diff_scraped_tracks(
+            previous_keys=previous_resolutions.keys(),
+            current_keys=(
+                normalized_track.key for normalized_track in normalized_tracks
+            ),
+        )
+        logger.info(
+            f"Scraped {len(diff.added)} new, {len(diff.removed)} removed and"
+            f" {len(diff.unchanged)} unchanged tracks since the previous scrape."
+        )
+
+        # Tracks resolved without searching, from the previous scrape or the store.
+        num_reused = 0
+        cached_keys: list[str] = []
+        with ThreadPoolExecutor(max_workers=RESOLVE_WORKERS) as executor:
+            for scraped_track, normalized_track in zip(
+                scraped_radio_6_tracks, normalized_tracks
+            ):
+                key = normalized_track.key
+                if key in pending:
+                    continue
+                track = previous_resolutions.get(key)
+                if track is not None:
+                    logger.debug(
+                        "Reusing previous resolution of track: %s", scraped_track
+                    )
+                    with pending_lock:
+                        pending[key] = track
+                    num_reused += 1
+                    if on_resolved is not None:
+                        release_resolved()
+                else:
+                    future = executor.submit(
+                        copy_context().run,
+                        resolve_scraped_track,
+                        spotify_client=spotify_client,
+                        scraped_track=scraped_track,
+                        key=key,
+                        store=store,
+                        search_timings=search_timings,
+                        deferred_tracks=deferred_tracks,
+                        strategies=strategies,
+                        cached_keys=cached_keys,
+                        cancelled=cancelled,
+                        is_simple=normalized_track.is_simple,
+                    )
+                    with pending_lock:
+                        pending[key] = future
+                    if on_resolved is not None:
+                        future.add_done_callback(release_resolved)
+            resolutions: dict[str, Track | None] = {
+                key: track.result() if isinstance(track, Future) else track
+                for key, track in pending.items()
+            }
+
+    # The resolutions of a cancelled run are incomplete, so are not stored.
+    if cancelled is not None and cancelled.is_set():
+        logger.info("Stopped resolving the scraped tracks, as the run was cancelled.")
+        return []
+
+    log_search_timings(search_timings)
+    if store is not None and search_timings:
+        store.add_query_strategy_stats(
+            get_query_strategy_stats(search_timings).values()
+        )
+    # Known misses are skipped without searching, but are not cache hits.
+    if resolve_stats is not None:
+        resolve_stats.tracks = len(resolutions)
+        resolve_stats.cache_hits = num_reused + len(cached_keys)
+    if deferred_tracks:
+        logger.warning(
+            "Deferred %d tracks to the next run, as the deadline was near.",
+            len(deferred_tracks),
+        )
+
+    if store is not None:
+        store.set_scraped_tracks(station=station, resolutions=resolutions)
+
+    spotify_radio_6_tracks = [
+        resolutions[normalized_track.key]
+        for normalized_track in normalized_tracks
+        if resolutions[normalized_track.key] is not None
+    ]
 
     return spotify_radio_6_tracks
 
@@ -101,28 +551,18 @@ def scrape_tracks_and_get_from_spotify(
 def add_tracks_to_playlist(
     spotify_client: Spotify,
     playlist_id: str,
-    dest_tracks: list[Track],
-    source_tracks: list[Track],
-    remove_duplicates: bool,
+    tracks: list[Track],
     prepend: bool,
     dry_run: bool,
 ):
 
-    if remove_duplicates:
-        duplicates = set(source_tracks).intersection(set(dest_tracks))
-        tracks_to_add = set(source_tracks).difference(duplicates)
-    else:
-        tracks_to_add = set(source_tracks)
-
-    if tracks_to_add:
-        logger.info(f"Addings these tracks: {[track.name for track in tracks_to_add]}")
-        if not dry_run:
-            spotify_client.add_to_playlist(
-                playlist_id=playlist_id,
-                track_uris=[track.uri for track in tracks_to_add],
-                position=None if not prepend else 0,
-            )
-        else:
-            logger.info("No tracks added (dry run).")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Addings these tracks: %s", [track.name for track in tracks])
+    if not dry_run:
+        spotify_client.add_to_playlist(
+            playlist_id=playlist_id,
+            track_uris=[track.uri for track in tracks],
+            position=None if not prepend else 0,
+        )
     else:
-        logger.info(f"No tracks to add.")
+        logger.info("No tracks added (dry run).")
@@ -1,18 +1,21 @@
 import logging
+from typing import Callable
 
 import requests
 from bs4 import BeautifulSoup as bs
 from bs4.element import NavigableString, Tag
 
+from bbc_to_spotify.deadline import get_timeout_s
+from bbc_to_spotify.normalization.normalization import get_primary_artist
 from bbc_to_spotify.scraping.models import ScrapedTrack
+from bbc_to_spotify.scraping.structured import scrape_tracks_from_structured_data
+from bbc_to_spotify.store.store import Store
 from bbc_to_spotify.utils import PlaylistUrl
 
 logger = logging.getLogger(__name__)
 
-
-def scrape_primary_artist(artist: str) -> str:
-    artist_primary = artist.replace("&", "ft.").split("ft.")[0]
-    return artist_primary
+# Runs within this window of each other (e.g. cron jobs) share a downloaded page.
+PAGE_MAX_AGE_S = 10 * 60
 
 
 def scrape_all_navigable_strings_in_tag(tag: Tag) -> list[NavigableString]:
@@ -31,9 +34,9 @@ def scrape_tracks_in_para(para: Tag) -> list[ScrapedTrack]:
     logger.debug("Collecting navigable strings.")
     navigable_strings = scrape_all_navigable_strings_in_tag(tag=para)
     for navigable_string in navigable_strings:
-        logger.debug(f"Scraping navigable string: {navigable_string}")
+        logger.debug("Scraping navigable string: %s", navigable_string)
         artist = navigable_string.text.split(" - ")[0]
-        primary_artist = scrape_primary_artist(artist)
+        primary_artist = get_primary_artist(artist)
         track_name = navigable_string.text.split(" - ")[-1]
         scraped_tracks.append(ScrapedTrack(artist=primary_artist, name=track_name))
     return scraped_tracks
@@ -43,20 +46,18 @@ def scrape_tracks_in_section(section: Tag) -> list[ScrapedTrack]:
     scraped_tracks = []
     paras = section.find_all("p")
     for para in paras:
-        logger.debug(f"Scraping para: {para}")
+        logger.debug("Scraping para: %s", para)
         para_tracks = scrape_tracks_in_para(para=para)
         scraped_tracks.extend(para_tracks)
     return scraped_tracks
 
 
-def scrape_tracks_from_playlist_page(playlist_url: PlaylistUrl) -> list[ScrapedTrack]:
+def scrape_tracks_from_html(content: bytes) -> list[ScrapedTrack] | None:
 
     scraped_tracks: list[ScrapedTrack] = []
+    found_list = False
 
-    logger.info(f"Scraping tracks from:{playlist_url}")
-
-    page = requests.get(url=playlist_url, timeout=30)
-    soup = bs(markup=page.content, features="html.parser")
+    soup = bs(markup=content, features="html.parser")
 
     sections = soup.find_all(
         class_=(
@@ -73,10 +74,99 @@ def scrape_tracks_from_playlist_page(playlist_url: PlaylistUrl) -> list[ScrapedT
         header = headers[0].text.strip()
 
         if header.endswith("LIST"):
-            logger.debug(f"Scraping '*-LIST' section: {section}")
+            found_list = True
+            logger.debug("Scraping '*-LIST' section: %s", section)
             section_tracks = scrape_tracks_in_section(section=section)
             scraped_tracks.extend(section_tracks)
 
-    logger.debug(f"Scraped {len(scraped_tracks)} tracks.\n{scraped_tracks}")
+    if not found_list:
+        logger.debug("No '*-LIST' sections found.")
+        return None
+
+    return scraped_tracks
+
+
+# Each source parses the downloaded page, returning None if it does not recognise the
+# page's format. They are tried in order: the structured JSON data is cheaper and less
+# brittle to parse than the article HTML, which is the fallback.
+PageSource = Callable[[bytes], list[ScrapedTrack] | None]
+PAGE_SOURCES: list[PageSource] = [
+    scrape_tracks_from_structured_data,
+    scrape_tracks_from_html,
+]
+
+# A source's tracks are only taken as the whole playlist when there are at least this
+# many. Pages may embed structured data for only the now playing or related tracks,
+# while the playlist itself is in the HTML, and the national stations' A, B and C lists
+# together run to well over 20 tracks. Fewer is not taken as a failure though, as
+# smaller stations' playlists (e.g. the Asian Network's) can be shorter: the following
+# sources are tried too, and the longest list of tracks is used. A short list is then
+# only used when no source found a longer one, e.g. when the page has no HTML list.
+MIN_PLAYLIST_TRACKS = 20
+
+
+class NoTracksScrapedError(Exception):
+    pass
+
+
+def get_playlist_page(playlist_url: PlaylistUrl) -> bytes:
+
+    page = requests.get(url=playlist_url, timeout=get_timeout_s(30))
+    # An error page must not be scraped, nor shared with other runs.
+    page.raise_for_status()
+
+    return page.content
+
+
+def scrape_tracks_from_page(
+    content: bytes, sources: list[PageSource] = PAGE_SOURCES
+) -> list[ScrapedTrack]:
+
+    scraped_tracks: list[ScrapedTrack] = []
+
+    for source in sources:
+        source_tracks = source(content)
+        if source_tracks is None:
+            continue
+        logger.debug(
+            "Scraped %d tracks with source: %s", len(source_tracks), source.__name__
+        )
+        if len(source_tracks) > len(scraped_tracks):
+            scraped_tracks = source_tracks
+        if len(scraped_tracks) >= MIN_PLAYLIST_TRACKS:
+            break
+
+    logger.debug("Scraped %d tracks.\n%s", len(scraped_tracks), scraped_tracks)
+
+    return scraped_tracks
+
+
+def scrape_tracks_from_playlist_page(
+    playlist_url: PlaylistUrl,
+    sources: list[PageSource] = PAGE_SOURCES,
+    store: Store | None = None,
+) -> list[ScrapedTrack]:
+
+    logger.info(f"Scraping tracks from:{playlist_url}")
+
+    content = None
+    if store is not None:
+        content = store.get_page(url=playlist_url, max_age_s=PAGE_MAX_AGE_S)
+        if content is not None:
+            logger.debug("Using page fetched by a recent run.")
+    fetched = content is None
+    if fetched:
+        content = get_playlist_page(playlist_url=playlist_url)
+
+    scraped_tracks = scrape_tracks_from_page(content=content, sources=sources)
+
+    # A playlist is never empty, so the page must have changed or be broken. Taking it
+    # as the source would e.g. remove every track from the playlists being pruned.
+    if not scraped_tracks:
+        raise NoTracksScrapedError(f"No tracks found in the page at {playlist_url}.")
+
+    # Only a page that could be scraped is shared with other runs.
+    if fetched and store is not None:
+        store.set_page(url=playlist_url, content=content)
 
     return scraped_tracks
@@ -0,0 +1,75 @@
+import json
+import logging
+import re
+from typing import Any, Iterator
+
+from bbc_to_spotify.normalization.normalization import get_primary_artist
+from bbc_to_spotify.scraping.models import ScrapedTrack
+
+logger = logging.getLogger(__name__)
+
+# JSON embedded in the page, e.g. <script type="application/ld+json">...</script>.
+JSON_SCRIPT_PATTERN = re.compile(
+    rb"<script[^>]*type=[\"']application/(?:ld\+)?json[\"'][^>]*>(.*?)</script>",
+    re.DOTALL | re.IGNORECASE,
+)
+
+
+def iter_json_objects(data: Any) -> Iterator[dict]:
+    if isinstance(data, dict):
+        yield data
+        for value in data.values():
+            yield from iter_json_objects(value)
+    elif isinstance(data, list):
+        for value in data:
+            yield from iter_json_objects(value)
+
+
+def get_artist_and_track_name(data: dict) -> tuple[str, str] | None:
+    # BBC music segments, with the artist and track as primary and secondary titles.
+    # Programmes use the same titles shape, so the segment type must be checked too.
+    titles = data.get("titles")
+    if (
+        data.get("segment_type") == "music"
+        and isinstance(titles, dict)
+        and titles.get("primary")
+        and titles.get("secondary")
+    ):
+        return titles["primary"], titles["secondary"]
+
+    # schema.org recordings.
+    if data.get("@type") == "MusicRecording" and data.get("name"):
+        by_artist = data.get("byArtist")
+        if isinstance(by_artist, list) and by_artist:
+            by_artist = by_artist[0]
+        if isinstance(by_artist, dict) and by_artist.get("name"):
+            return by_artist["name"], data["name"]
+
+    return None
+
+
+def scrape_tracks_from_structured_data(content: bytes) -> list[ScrapedTrack] | None:
+
+    scraped_tracks: list[ScrapedTrack] = []
+    for match in JSON_SCRIPT_PATTERN.finditer(content):
+        try:
+            data = json.loads(match.group(1))
+        except ValueError:
+            logger.debug("Skipping unparseable JSON script.")
+            continue
+        for obj in iter_json_objects(data):
+            artist_and_track_name = get_artist_and_track_name(obj)
+            if artist_and_track_name is None:
+                continue
+            artist, track_name = artist_and_track_name
+            scraped_tracks.append(
+                ScrapedTrack(
+                    artist=get_primary_artist(artist.strip()), name=track_name.strip()
+                )
+            )
+
+    if not scraped_tracks:
+        logger.debug("No structured playlist data found.")
+        return None
+
+    return scraped_tracks
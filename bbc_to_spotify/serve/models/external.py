@@ -0,0 +1,55 @@
+import datetime as dt
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+from bbc_to_spotify.utils import Station
+
+
+class SyncJobRequest(BaseModel):
+    station: Station
+    playlist_ids: list[str] = Field(min_length=1)
+    # The name of the credentials to use, or "default" for the CLI's own.
+    credentials: str = "default"
+    remove_duplicates: bool = False
+    prune_dest: bool = False
+    prepend: bool = False
+    update_description: bool = False
+    dry_run: bool = False
+    deadline_s: float | None = Field(default=None, gt=0, allow_inf_nan=False)
+    max_tracks: int | None = Field(default=None, ge=1)
+
+
+class PlaylistResultModel(BaseModel):
+    playlist_id: str
+    tracks_added: int
+    tracks_removed: int
+    tracks_evicted: int
+    tracks_deferred: int
+    error: str | None = None
+
+
+class SyncJobModel(BaseModel):
+    id: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    request: SyncJobRequest
+    submitted_at: dt.datetime
+    wait_s: float | None = None
+    run_s: float | None = None
+    results: list[PlaylistResultModel] = []
+    error: str | None = None
+
+
+class SyncJobsModel(BaseModel):
+    jobs: list[SyncJobModel]
+
+
+class HealthModel(BaseModel):
+    status: Literal["ok"] = "ok"
+    workers: int
+    jobs: dict[str, int]
+    api_metrics: dict[str, dict]
+
+
+class ErrorModel(BaseModel):
+    error: str
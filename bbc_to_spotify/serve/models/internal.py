@@ -0,0 +1,54 @@
+import datetime as dt
+import time
+from dataclasses import dataclass, field
+from typing import Literal
+
+from bbc_to_spotify.playlist.models import PlaylistUpdateResult
+from bbc_to_spotify.serve.models.external import (
+    PlaylistResultModel,
+    SyncJobModel,
+    SyncJobRequest,
+)
+
+
+@dataclass
+class SyncJob:
+    id: str
+    request: SyncJobRequest
+    status: Literal["queued", "running", "succeeded", "failed"] = "queued"
+    submitted_ts: float = field(default_factory=time.time)
+    started_ts: float | None = None
+    finished_ts: float | None = None
+    results: list[PlaylistUpdateResult] = field(default_factory=list)
+    error: str | None = None
+
+    def to_external(self) -> SyncJobModel:
+        wait_s = None
+        if self.started_ts is not None:
+            wait_s = round(self.started_ts - self.submitted_ts, 3)
+        run_s = None
+        if self.started_ts is not None and self.finished_ts is not None:
+            run_s = round(self.finished_ts - self.started_ts, 3)
+        job_model = SyncJobModel(
+            id=self.id,
+            status=self.status,
+            request=self.request,
+            submitted_at=dt.datetime.fromtimestamp(
+                self.submitted_ts, tz=dt.timezone.utc
+            ),
+            wait_s=wait_s,
+            run_s=run_s,
+            results=[
+                PlaylistResultModel(
+                    playlist_id=result.playlist_id,
+                    tracks_added=len(result.tracks_added),
+                    tracks_removed=len(result.tracks_removed),
+                    tracks_evicted=result.tracks_evicted,
+                    tracks_deferred=len(result.tracks_deferred),
+                    error=str(result.error) if result.error is not None else None,
+                )
+                for result in self.results
+            ],
+            error=self.error,
+        )
+        return job_model
@@ -0,0 +1,325 @@
+import dataclasses
+import hmac
+import ipaddress
+import logging
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pydantic import BaseModel, ValidationError
+
+from bbc_to_spotify.authorize.authorize import (
+    CREDENTIALS_PATH,
+    maybe_get_credentials,
+    maybe_read_credentials_file,
+)
+from bbc_to_spotify.authorize.models.internal import Credentials
+from bbc_to_spotify.deadline import run_deadline
+from bbc_to_spotify.history.history import record_run
+from bbc_to_spotify.logging import log_context
+from bbc_to_spotify.playlist.update import update_playlists
+from bbc_to_spotify.serve.models.external import (
+    ErrorModel,
+    HealthModel,
+    SyncJobRequest,
+    SyncJobsModel,
+)
+from bbc_to_spotify.serve.models.internal import SyncJob
+from bbc_to_spotify.spotify.limiter import AIMDLimiter
+from bbc_to_spotify.spotify.spotify import Spotify, make_session
+from bbc_to_spotify.store.store import Store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8081
+DEFAULT_WORKERS = 4
+
+# Finished jobs are kept for their status to be queried, up to this many.
+MAX_FINISHED_JOBS = 1000
+
+# Named credentials, e.g. "alice" is read from credentials/alice.json.
+TENANT_CREDENTIALS_PATH = CREDENTIALS_PATH.parent / "credentials"
+CREDENTIALS_NAME_PATTERN = re.compile(r"^[\w-]+$")
+JOB_PATH_PATTERN = re.compile(r"^/jobs/(\w+)$")
+
+# Requests must carry this token, if set, as "Authorization: Bearer <token>".
+TOKEN_ENV_VAR = "BBC_TO_SPOTIFY_SERVE_TOKEN"
+
+
+class UnknownCredentialsError(Exception):
+    pass
+
+
+class InsecureHostError(Exception):
+    pass
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class SyncService:
+    # Runs sync jobs on a pool of workers. Every job shares one store (and so its
+    # resolution cache), one connection pool and limiter, and one client per set of
+    # credentials, with its access token, so they stay warm between jobs.
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        fast_parse: bool = False,
+        hedge_search: bool = False,
+        store: Store | None = None,
+    ):
+        self.workers = workers
+        self.fast_parse = fast_parse
+        self.hedge_search = hedge_search
+
+        self.store = store if store is not None else Store()
+        self.limiter = AIMDLimiter()
+        self.session = make_session(self.limiter.max_limit)
+        self.clients: dict[str, Spotify] = {}
+        self.clients_lock = threading.Lock()
+
+        self.jobs: dict[str, SyncJob] = {}
+        self.jobs_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="job"
+        )
+
+    def get_credentials(self, name: str) -> Credentials:
+        credentials = None
+        if name == "default":
+            credentials = maybe_get_credentials()
+        elif CREDENTIALS_NAME_PATTERN.match(name):
+            credentials = maybe_read_credentials_file(
+                TENANT_CREDENTIALS_PATH / f"{name}.json"
+            )
+        if credentials is None:
+            raise UnknownCredentialsError(f"No credentials found named '{name}'.")
+        return credentials
+
+    def get_client(self, credentials_name: str) -> Spotify:
+        with self.clients_lock:
+            spotify_client = self.clients.get(credentials_name)
+            if spotify_client is None:
+                credentials = self.get_credentials(credentials_name)
+                spotify_client = Spotify(
+                    client_id=credentials.client_id,
+                    client_secret=credentials.client_secret,
+                    grant_type="refresh_token",
+                    refresh_token=credentials.refresh_token,
+                    store=self.store,
+                    fast_parse=self.fast_parse,
+                    hedge_search=self.hedge_search,
+                    session=self.session,
+                    limiter=self.limiter,
+                )
+                self.clients[credentials_name] = spotify_client
+        return spotify_client
+
+    def submit(self, request: SyncJobRequest) -> SyncJob:
+        # Credentials are looked up now, so that unknown ones are rejected up front.
+        spotify_client = self.get_client(credentials_name=request.credentials)
+        job = SyncJob(id=uuid.uuid4().hex[:12], request=request)
+        with self.jobs_lock:
+            self.jobs[job.id] = job
+            finished_jobs = [
+                job_id
+                for job_id, job_ in self.jobs.items()
+                if job_.finished_ts is not None
+            ]
+            for job_id in finished_jobs[: len(finished_jobs) - MAX_FINISHED_JOBS]:
+                del self.jobs[job_id]
+        self.executor.submit(self.run_job, job=job, spotify_client=spotify_client)
+        logger.info(f"Queued job {job.id}.")
+        return job
+
+    def run_job(self, job: SyncJob, spotify_client: Spotify):
+        request = job.request
+        with log_context(job_id=job.id, station=request.station):
+            logger.info(f"Running job {job.id}.")
+            job.status = "running"
+            job.started_ts = time.time()
+            try:
+                with (
+                    run_deadline(request.deadline_s),
+                    record_run(
+                        store=self.store,
+                        command="serve",
+                        station=request.station,
+                        playlist_ids=request.playlist_ids,
+                        dry_run=request.dry_run,
+                        run_id=job.id,
+                    ) as recording,
+                ):
+                    job.results = recording.results = update_playlists(
+                        spotify_client=spotify_client,
+                        playlist_ids=request.playlist_ids,
+                        station=request.station,
+                        store=self.store,
+                        remove_duplicates=request.remove_duplicates,
+                        prune_dest=request.prune_dest,
+                        prepend=request.prepend,
+                        update_description=request.update_description,
+                        dry_run=request.dry_run,
+                        max_tracks=request.max_tracks,
+                        resolve_stats=recording.resolve_stats,
+                    )
+                failed = any(result.error is not None for result in job.results)
+                job.status = "failed" if failed else "succeeded"
+            except Exception as e:
+                logger.exception(f"Job {job.id} failed.")
+                job.status = "failed"
+                job.error = str(e)
+            job.finished_ts = time.time()
+            logger.info(
+                f"Finished job {job.id} ({job.status}) in"
+                f" {job.finished_ts - job.started_ts:.3f}s."
+            )
+
+    def get_job(self, job_id: str) -> SyncJob | None:
+        with self.jobs_lock:
+            return self.jobs.get(job_id)
+
+    def get_jobs(self) -> list[SyncJob]:
+        with self.jobs_lock:
+            return list(self.jobs.values())
+
+    def get_health(self) -> HealthModel:
+        jobs = {"queued": 0, "running": 0, "succeeded": 0, "failed": 0}
+        for job in self.get_jobs():
+            jobs[job.status] += 1
+        with self.clients_lock:
+            api_metrics = {
+                credentials_name: dataclasses.asdict(spotify_client.get_metrics())
+                for credentials_name, spotify_client in self.clients.items()
+            }
+        health = HealthModel(workers=self.workers, jobs=jobs, api_metrics=api_metrics)
+        return health
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for spotify_client in self.clients.values():
+            spotify_client.close()
+        self.session.close()
+        self.store.close()
+
+
+class SyncRequestHandler(BaseHTTPRequestHandler):
+    server: "SyncServer"
+
+    def is_authorized(self) -> bool:
+        if self.server.token is None:
+            return True
+        authorization = self.headers.get("Authorization") or ""
+        return hmac.compare_digest(
+            authorization.encode(), f"Bearer {self.server.token}".encode()
+        )
+
+    def do_GET(self):
+        if not self.is_authorized():
+            self.send_model(401, ErrorModel(error="Unauthorized."))
+            return
+        service = self.server.service
+        match = JOB_PATH_PATTERN.match(self.path)
+        if self.path == "/health":
+            self.send_model(200, service.get_health())
+        elif self.path == "/jobs":
+            jobs = [job.to_external() for job in service.get_jobs()]
+            self.send_model(200, SyncJobsModel(jobs=jobs))
+        elif match is not None:
+            job = service.get_job(match.group(1))
+            if job is None:
+                self.send_model(404, ErrorModel(error="No such job."))
+            else:
+                self.send_model(200, job.to_external())
+        else:
+            self.send_model(404, ErrorModel(error="Not found."))
+
+    def do_POST(self):
+        if not self.is_authorized():
+            self.send_model(401, ErrorModel(error="Unauthorized."))
+            return
+        if self.path != "/jobs":
+            self.send_model(404, ErrorModel(error="Not found."))
+            return
+        try:
+            content_length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            content_length = -1
+        if content_length < 0:
+            self.send_model(400, ErrorModel(error="Invalid Content-Length."))
+            return
+        try:
+            request = SyncJobRequest.model_validate_json(
+                self.rfile.read(content_length)
+            )
+            job = self.server.service.submit(request)
+        except (ValidationError, UnknownCredentialsError) as e:
+            self.send_model(400, ErrorModel(error=str(e)))
+            return
+        self.send_model(202, job.to_external())
+
+    def send_model(self, status: int, model: BaseModel):
+        body = model.model_dump_json().encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args):
+        logger.debug(format, *args)
+
+
+class SyncServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        service: SyncService,
+        token: str | None = None,
+    ):
+        super().__init__(address, SyncRequestHandler)
+        self.service = service
+        self.token = token
+
+
+def serve(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    workers: int = DEFAULT_WORKERS,
+    fast_parse: bool = False,
+    hedge_search: bool = False,
+    token: str | None = None,
+):
+    # Anyone who can reach the API can change playlists with the stored credentials.
+    if token is None and not is_loopback(host):
+        raise InsecureHostError(
+            f"Refusing to listen on {host} without a token. Set {TOKEN_ENV_VAR} to"
+            " require one, or listen on a loopback address."
+        )
+    service = SyncService(
+        workers=workers, fast_parse=fast_parse, hedge_search=hedge_search
+    )
+    server = SyncServer(address=(host, port), service=service, token=token)
+    logger.info(f"Serving sync jobs on http://{host}:{server.server_port}.")
+    print(f"Serving sync jobs on http://{host}:{server.server_port}.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down.")
+    finally:
+        server.server_close()
+        # Jobs that were already queued are finished first.
+        service.close()
@@ -0,0 +1,51 @@
+from pydantic_core import from_json
+
+from bbc_to_spotify.spotify.models.internal import Album, Artist, Track
+
+# Builds internal models straight from trusted Spotify responses, skipping pydantic
+# validation and any fields that are never used (e.g. a playlist item's `added_at`).
+# The validating path through the external models remains the default.
+
+
+def artist_from_json(data: dict) -> Artist:
+    artist = Artist(name=data["name"], uri=data["uri"], id=data["id"])
+    return artist
+
+
+def album_from_json(data: dict) -> Album:
+    album = Album(
+        name=data["name"],
+        artists=[artist_from_json(artist) for artist in data["artists"]],
+        uri=data["uri"],
+        id=data["id"],
+    )
+    return album
+
+
+def track_from_json(data: dict) -> Track:
+    track = Track(
+        album=album_from_json(data["album"]),
+        artists=[artist_from_json(artist) for artist in data["artists"]],
+        name=data["name"],
+        uri=data["uri"],
+        id=data["id"],
+        popularity=data["popularity"],
+    )
+    return track
+
+
+def parse_playlist_items_page(content: bytes) -> tuple[list[Track], str | None]:
+    data = from_json(content)
+    # Items whose track has been deleted from Spotify come back as null.
+    tracks = [
+        track_from_json(item["track"])
+        for item in data["items"]
+        if item.get("track") is not None
+    ]
+    return tracks, data.get("next")
+
+
+def parse_track_search_response(content: bytes) -> list[Track]:
+    data = from_json(content)
+    tracks = [track_from_json(item) for item in data["tracks"]["items"]]
+    return tracks
@@ -0,0 +1,64 @@
+import logging
+import threading
+
+from bbc_to_spotify.deadline import DeadlineExceededError, get_wait_timeout_s
+
+logger = logging.getLogger(__name__)
+
+
+# Bounds the number of in-flight requests (additive-increase/multiplicative-decrease).
+# The limit grows by roughly one for every window of successful requests, and is
+# multiplied by `decrease_factor` whenever a request is throttled, fails with a server
+# error, or takes much longer than the running baseline latency.
+class AIMDLimiter:
+    def __init__(
+        self,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 16,
+        decrease_factor: float = 0.5,
+        latency_spike_factor: float = 3.0,
+        min_latency_spike_s: float = 0.25,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_spike_factor = latency_spike_factor
+        self.min_latency_spike_s = min_latency_spike_s
+
+        self.in_flight = 0
+        self.baseline_latency_s: float | None = None
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        timeout_s = get_wait_timeout_s()
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: self.in_flight < int(self.limit), timeout=timeout_s
+            ):
+                raise DeadlineExceededError("Timed out waiting to send a request.")
+            self.in_flight += 1
+
+    def release(self, latency_s: float, congested: bool = False):
+        with self.condition:
+            self.in_flight -= 1
+            # Ignore jitter on very fast responses by also requiring an absolute rise.
+            latency_spike = (
+                self.baseline_latency_s is not None
+                and latency_s > self.baseline_latency_s * self.latency_spike_factor
+                and latency_s - self.baseline_latency_s > self.min_latency_spike_s
+            )
+            if congested or latency_spike:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                logger.debug("Decreased concurrency limit to %.2f.", self.limit)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if not congested:
+                if self.baseline_latency_s is None:
+                    self.baseline_latency_s = latency_s
+                else:
+                    self.baseline_latency_s = (
+                        0.9 * self.baseline_latency_s + 0.1 * latency_s
+                    )
+            self.condition.notify_all()
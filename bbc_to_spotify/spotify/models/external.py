@@ -29,8 +29,14 @@ class GetAccessTokenBody(BaseModel):
     refresh_token: str | None = None
 
 
+class GetAccessTokenResponse(BaseModel):
+    access_token: str
+    expires_in: int
+
+
 class TrackURI(BaseModel):
     uri: str
+    positions: list[int] | None = None
 
 
 class CreatePlaylistBody(BaseModel):
@@ -68,6 +74,7 @@ class UpdatePlaylistBody(BaseModel):
 
 class RemovePlaylistItemsBody(BaseModel):
     tracks: list[TrackURI]
+    snapshot_id: str | None = None
 
 
 class ChangePlaylistDetailsBody(BaseModel):
@@ -97,21 +104,38 @@ class TrackModel(BaseModel):
     uri: str
     id: str
     popularity: int
+    is_playable: bool | None = None
 
 
 class TrackWithMetaModel(BaseModel):
     added_at: dt.datetime
-    track: TrackModel
+    # Items whose track has been deleted from Spotify come back as null.
+    track: TrackModel | None = None
 
 
 class TracksWithMetaModel(BaseModel):
     items: list[TrackWithMetaModel]
+    next: str | None = None
+
+
+class AddedItemModel(BaseModel):
+    added_at: dt.datetime
+    track: TrackURI | None = None
+
+
+class AddedItemsModel(BaseModel):
+    items: list[AddedItemModel]
+    next: str | None = None
 
 
 class TracksModel(BaseModel):
     items: list[TrackModel]
 
 
+class GetTracksResponse(BaseModel):
+    tracks: list[TrackModel | None]
+
+
 class PlaylistMetaModel(BaseModel):
     collaborative: bool
     name: str
@@ -119,6 +143,7 @@ class PlaylistMetaModel(BaseModel):
     uri: str
     id: str
     description: str | None = None
+    snapshot_id: str | None = None
 
 
 class PlaylistModel(PlaylistMetaModel):
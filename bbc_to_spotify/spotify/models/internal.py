@@ -109,6 +109,7 @@ class Playlist:
         tracks = [
             Track.from_external(track_with_meta_model.track)
             for track_with_meta_model in playlist_model.tracks.items
+            if track_with_meta_model.track is not None
         ]
 
         playlist = cls(
@@ -122,3 +123,12 @@ class Playlist:
         )
 
         return playlist
+
+
+@dataclass
+class ApiMetrics:
+    requests: int = 0
+    retries: int = 0
+    throttled: int = 0
+    server_errors: int = 0
+    concurrency_limit: float = 0
@@ -1,17 +1,28 @@
+import dataclasses
+import hashlib
 import logging
+import threading
 import time
-from typing import Literal, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Literal, Optional
 from urllib.parse import urljoin
 
 import requests
 
 from bbc_to_spotify import utils
+from bbc_to_spotify.deadline import get_remaining_s, get_timeout_s
 from bbc_to_spotify.spotify.models.external import (
+    AddedItemModel,
+    AddedItemsModel,
     AddItemsToPlaylistBody,
     ChangePlaylistDetailsBody,
     CreatePlaylistBody,
     GetAccessTokenBody,
+    GetAccessTokenResponse,
     GetPlaylistsResponse,
+    GetTracksResponse,
     PlaylistMetaModel,
     PlaylistModel,
     RemovePlaylistItemsBody,
@@ -24,29 +35,46 @@ from bbc_to_spotify.spotify.models.external import (
     UpdatePlaylistResponse,
     UserModel,
 )
+from bbc_to_spotify.spotify.limiter import AIMDLimiter
+from bbc_to_spotify.spotify.fast import (
+    parse_playlist_items_page,
+    parse_track_search_response,
+)
+from bbc_to_spotify.spotify.models.internal import ApiMetrics, Track
+from bbc_to_spotify.spotify.token import AccessTokenManager
+from bbc_to_spotify.store.locks import file_lock
+from bbc_to_spotify.store.store import Store
 
 logger = logging.getLogger(__name__)
 
+# Counts requests for the run or job in progress, when being recorded, as well as for
+# the client, which may be shared by several at once.
+RUN_METRICS: ContextVar[ApiMetrics | None] = ContextVar("run_metrics", default=None)
+
+# Enough for two hedged queries from each of the threads resolving tracks at once.
+HEDGE_WORKERS = 32
+
 
 class NoRefreshTokenError(Exception):
     pass
 
 
-def check_access_token(func):
-    def wrapper(*args, **kwargs):
-        spotify: Spotify = args[0]
-        if spotify.token_ts is None:
-            logger.debug("No access token. Getting a new one one.")
-            spotify.get_new_access_token()
-        elif time.time() > spotify.token_ts + spotify.access_token_timeout - 300:
-            logger.debug("Access token out of date. getting a new one.")
-            spotify.get_new_access_token()
+@contextmanager
+def record_api_metrics(metrics: ApiMetrics):
+    token = RUN_METRICS.set(metrics)
+    try:
+        yield metrics
+    finally:
+        RUN_METRICS.reset(token)
 
-        res = func(*args, **kwargs)
 
-        return res
-
-    return wrapper
+def make_session(max_connections: int) -> requests.Session:
+    session = requests.session()
+    # Keep a pooled connection for every request that may be in flight.
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_connections)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 
 class Spotify:
@@ -54,7 +82,7 @@ class Spotify:
     accounts_base_url = "https://accounts.spotify.com"
     json_headers = {"Content-Type": "application/json"}
     version = "v1"
-    access_token_timeout = 3600
+    max_retries = 3
 
     def __init__(
         self,
@@ -62,6 +90,11 @@ class Spotify:
         client_secret: str,
         grant_type: Literal["refresh_token", "client_credentials"],
         refresh_token: str | None = None,
+        store: Store | None = None,
+        fast_parse: bool = False,
+        hedge_search: bool = False,
+        session: requests.Session | None = None,
+        limiter: AIMDLimiter | None = None,
     ):
         if grant_type == "refresh_token" and refresh_token is None:
             logger.error("No refresh token provided")
@@ -74,10 +107,36 @@ class Spotify:
         self.client_secret = client_secret
         self.grant_type = grant_type
         self.refresh_token = refresh_token
+        self.fast_parse = fast_parse
+        self.hedge_search = hedge_search
+
+        # Access tokens belong to the user of the refresh token, not just to the app.
+        refresh_token_hash = hashlib.sha256((refresh_token or "").encode()).hexdigest()
+        self.token_key = f"{client_id}-{refresh_token_hash[:12]}"
+
+        # The transport may be shared between clients for different users of one app,
+        # in which case its owner closes it.
+        self.limiter = limiter if limiter is not None else AIMDLimiter()
+        self.owns_session = session is None
+        self.session = (
+            session if session is not None else make_session(self.limiter.max_limit)
+        )
+        self.store = store
+        self.token_manager = AccessTokenManager(
+            fetch_token=(
+                self.get_shared_access_token
+                if store is not None
+                else self.get_new_access_token
+            )
+        )
+
+        self.metrics = ApiMetrics()
+        self.metrics_lock = threading.Lock()
 
-        self.access_token: str | None = None
-        self.token_ts: float | None = None
-        self.session = requests.session()
+        # Hedged searches run in their own pool, as the threads resolving tracks block
+        # waiting on them. It is started by the first hedged search, if any.
+        self.hedge_executor: ThreadPoolExecutor | None = None
+        self.hedge_executor_lock = threading.Lock()
 
     def api_call(
         self,
@@ -87,32 +146,133 @@ class Spotify:
         data: Optional[dict] = None,
         headers: Optional[dict] = None,
         json: Optional[dict] = None,
-        timeout_s: int = 30,
+        timeout_s: float = 30,
+        authenticated: bool = False,
+        idempotent: bool | None = None,
     ) -> requests.Response:
 
-        response = self.session.request(
-            method=method,
-            url=url,
-            headers=headers,
-            params=params,
-            data=data,
-            json=json,
-            timeout=timeout_s,
-        )
+        # Throttled requests were not processed, so are always retried. Server errors
+        # may come after a request took effect, so are only retried when repeating it
+        # is harmless, e.g. not when adding tracks, which would add them twice.
+        if idempotent is None:
+            idempotent = method == "get"
+
+        retries = 0
+        reauthorized = False
+        while True:
+            request_headers = headers
+            if authenticated:
+                # Fetched before acquiring the limiter, as a refresh is a request too.
+                authorization_headers = self.token_manager.get_headers()
+                if headers is None:
+                    request_headers = authorization_headers
+                else:
+                    request_headers = {**headers, **authorization_headers}
+
+            self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method=method,
+                    url=url,
+                    headers=request_headers,
+                    params=params,
+                    data=data,
+                    json=json,
+                    timeout=get_timeout_s(timeout_s),
+                )
+            except requests.exceptions.RequestException:
+                self.limiter.release(
+                    latency_s=time.perf_counter() - start, congested=True
+                )
+                raise
+            throttled = response.status_code == 429
+            server_error = response.status_code >= 500
+            self.limiter.release(
+                latency_s=time.perf_counter() - start,
+                congested=throttled or server_error,
+            )
+
+            self.add_metrics(
+                requests=1, throttled=int(throttled), server_errors=int(server_error)
+            )
+
+            if response.status_code == 401 and authenticated and not reauthorized:
+                # The token was revoked or expired early; refresh it and retry once.
+                logger.debug("Request unauthorized. Refreshing access token.")
+                reauthorized = True
+                self.token_manager.refresh(stale_headers=authorization_headers)
+                continue
+
+            retryable = throttled or (server_error and idempotent)
+            if not retryable or retries >= self.max_retries:
+                break
+
+            retry_after_s = float(
+                response.headers.get("Retry-After", 2 ** (retries + 1))
+            )
+            remaining_s = get_remaining_s()
+            if remaining_s is not None and retry_after_s >= remaining_s:
+                logger.warning(
+                    "Request failed with status %d. Not retrying, as the run's deadline"
+                    " would pass first.",
+                    response.status_code,
+                )
+                break
+
+            retries += 1
+            self.add_metrics(retries=1)
+            logger.warning(
+                "Request failed with status %d. Retrying in %ss.",
+                response.status_code,
+                retry_after_s,
+            )
+            time.sleep(retry_after_s)
 
         try:
             response.raise_for_status()
         except Exception as e:
-            logger.error(response.json())
+            logger.error(response.text)
             raise e
         return response
 
-    @property
-    def authorization_headers(self) -> dict:
-        headers = {"Authorization": "Bearer {}".format(self.access_token)}
-        return headers
-
-    def get_new_access_token(self):
+    def prefetch_access_token(self):
+        # Gets a token, unless one is held already, so that later requests need not.
+        self.token_manager.get_headers()
+
+    def add_metrics(self, **counts: int):
+        run_metrics = RUN_METRICS.get()
+        with self.metrics_lock:
+            for metrics in (self.metrics, run_metrics):
+                if metrics is None:
+                    continue
+                for name, count in counts.items():
+                    setattr(metrics, name, getattr(metrics, name) + count)
+
+    def get_metrics(self) -> ApiMetrics:
+        with self.metrics_lock:
+            metrics = dataclasses.replace(
+                self.metrics, concurrency_limit=round(self.limiter.limit, 2)
+            )
+        return metrics
+
+    def get_hedge_executor(self) -> ThreadPoolExecutor:
+        with self.hedge_executor_lock:
+            if self.hedge_executor is None:
+                self.hedge_executor = ThreadPoolExecutor(
+                    max_workers=HEDGE_WORKERS, thread_name_prefix="hedge"
+                )
+        return self.hedge_executor
+
+    def close(self):
+        # Queries that lost a race may still be running, and need the session.
+        if self.hedge_executor is not None:
+            self.hedge_executor.shutdown(wait=True, cancel_futures=True)
+        self.token_manager.close()
+        if self.owns_session:
+            self.session.close()
+
+    def get_new_access_token(self) -> GetAccessTokenResponse:
         url_ext = "/api/token"
         url = urljoin(base=self.accounts_base_url, url=url_ext)
         body = GetAccessTokenBody(
@@ -126,19 +286,40 @@ class Spotify:
             url=url,
             method="post",
             data=body,
+            idempotent=True,
         )
-        content = response.json()
-        self.access_token = content["access_token"]
-        self.token_ts = time.time()
+        token = GetAccessTokenResponse.model_validate_json(response.content)
+
+        return token
+
+    def get_shared_access_token(self) -> GetAccessTokenResponse:
+        # Processes on the same host share one access token through the store, rather
+        # than each fetching their own.
+        assert self.store is not None
+        min_ttl_s = self.token_manager.proactive_margin_s + 60
+        with file_lock(f"token-{self.token_key}"):
+            token = self.store.get_access_token(key=self.token_key, min_ttl_s=min_ttl_s)
+            # The stored token is the one being refreshed, e.g. after a 401.
+            if (
+                token is not None
+                and token.access_token == self.token_manager.access_token
+            ):
+                token = None
+            if token is None:
+                token = self.get_new_access_token()
+                self.store.set_access_token(key=self.token_key, token=token)
+            else:
+                logger.debug("Reusing access token shared by another process.")
+
+        return token
 
-    @check_access_token
     def search(
         self,
         query: str,
         thing_type: str,
         market: Optional[str] = None,
         limit: int = 20,
-    ):
+    ) -> bytes:
         url_ext = f"{self.version}/search"
         url = urljoin(base=self.base_url, url=url_ext)
 
@@ -149,67 +330,128 @@ class Spotify:
         response = self.api_call(
             url=url,
             method="get",
-            headers=self.authorization_headers,
+            authenticated=True,
             params=params,
         )
 
-        return response.json()
+        return response.content
 
-    @check_access_token
     def get_track(self, track_id: str, market: Optional[str] = None) -> TrackModel:
         url_ext = f"{self.version}/tracks/{track_id}"
         if market is not None:
             url_ext += f"?market={market}"
         url = urljoin(base=self.base_url, url=url_ext)
 
-        response = self.api_call(
-            url=url, method="get", headers=self.authorization_headers
-        )
+        response = self.api_call(url=url, method="get", authenticated=True)
 
-        track = TrackModel.model_validate(response.json())
+        track = TrackModel.model_validate_json(response.content)
 
         return track
 
-    @check_access_token
+    def get_tracks(
+        self, track_ids: list[str], market: Optional[str] = None
+    ) -> list[TrackModel | None]:
+        # Tracks that no longer exist are returned as None, in the requested order.
+        url_ext = f"{self.version}/tracks"
+        url = urljoin(base=self.base_url, url=url_ext)
+
+        tracks: list[TrackModel | None] = []
+        for _track_ids in utils.batch_list(track_ids, batch_size=50):
+            params = {"ids": ",".join(_track_ids)}
+            if market is not None:
+                params["market"] = market
+            response = self.api_call(
+                url=url, method="get", authenticated=True, params=params
+            )
+            tracks.extend(
+                GetTracksResponse.model_validate_json(response.content).tracks
+            )
+
+        return tracks
+
     def get_user_playlists(self, user_id: str) -> list[PlaylistMetaModel]:
         url_ext = f"{self.version}/users/{user_id}/playlists"
         url = urljoin(base=self.base_url, url=url_ext)
 
-        response = self.api_call(
-            url=url, method="get", headers=self.authorization_headers
-        )
+        response = self.api_call(url=url, method="get", authenticated=True)
 
-        playlists = GetPlaylistsResponse.model_validate(response.json()).items
+        playlists = GetPlaylistsResponse.model_validate_json(response.content).items
 
         return playlists
 
-    @check_access_token
-    def get_playlist(self, playlist_id: str) -> PlaylistModel:
+    def get_playlist_meta(self, playlist_id: str) -> PlaylistMetaModel:
         url_ext = f"{self.version}/playlists/{playlist_id}"
         url = urljoin(base=self.base_url, url=url_ext)
+        params = {"fields": ",".join(PlaylistMetaModel.model_fields)}
+        response = self.api_call(
+            url=url, method="get", authenticated=True, params=params
+        )
+        playlist_meta = PlaylistMetaModel.model_validate_json(response.content)
+
+        return playlist_meta
+
+    def get_playlist_items_page(
+        self, url: str, params: Optional[dict] = None
+    ) -> TracksWithMetaModel:
         response = self.api_call(
-            url=url, method="get", headers=self.authorization_headers
+            url=url, method="get", authenticated=True, params=params
         )
-        response_json = response.json()
-        playlist = PlaylistModel.model_validate(response_json)
-        next = response_json["tracks"].get("next")
+        tracks = TracksWithMetaModel.model_validate_json(response.content)
+
+        return tracks
+
+    def iter_playlist_items(self, playlist_id: str) -> Iterator[TracksWithMetaModel]:
+        # Yield the playlist one page at a time, so that callers never need to hold
+        # every item of a large playlist in memory at once.
+        url_ext = f"{self.version}/playlists/{playlist_id}/tracks"
+        url = urljoin(base=self.base_url, url=url_ext)
+
+        tracks = self.get_playlist_items_page(url=url, params={"limit": 100})
+        yield tracks
+        next = tracks.next
         i = 0
         while next is not None:
             i += 1
             logger.debug(f"Paginating...{i}")
+            tracks = self.get_playlist_items_page(url=next)
+            next = tracks.next
+            yield tracks
+
+    def iter_playlist_tracks_fast(self, playlist_id: str) -> Iterator[list[Track]]:
+        url_ext = f"{self.version}/playlists/{playlist_id}/tracks"
+        url = urljoin(base=self.base_url, url=url_ext)
+
+        next: str | None = url
+        params: dict | None = {"limit": 100}
+        while next is not None:
             response = self.api_call(
-                url=next, method="get", headers=self.authorization_headers
+                url=next, method="get", authenticated=True, params=params
             )
-            response_json = response.json()
-            next = response_json.get("next")
-            tracks = TracksWithMetaModel.model_validate(response_json)
-            playlist.tracks.items.extend(tracks.items)
-
-        logger.debug(f"{len(playlist.tracks.items)} tracks retrieved.")
+            tracks, next = parse_playlist_items_page(response.content)
+            params = None
+            yield tracks
+
+    def iter_playlist_added_items(
+        self, playlist_id: str
+    ) -> Iterator[list[AddedItemModel]]:
+        # Only each item's URI and when it was added, in playlist order.
+        url_ext = f"{self.version}/playlists/{playlist_id}/tracks"
+        url = urljoin(base=self.base_url, url=url_ext)
 
-        return playlist
+        next: str | None = url
+        params: dict | None = {
+            "limit": 100,
+            "fields": "items(added_at,track(uri)),next",
+        }
+        while next is not None:
+            response = self.api_call(
+                url=next, method="get", authenticated=True, params=params
+            )
+            items = AddedItemsModel.model_validate_json(response.content)
+            next = items.next
+            params = None
+            yield items.items
 
-    @check_access_token
     def add_to_playlist(
         self, playlist_id: str, track_uris: list[str], position: int | None = None
     ):
@@ -221,13 +463,10 @@ class Spotify:
                 uris=",".join(_track_uris), position=position
             ).model_dump()
 
-            logger.debug(f"Adding: {params}.")
+            logger.debug("Adding: %s.", params)
 
-            self.api_call(
-                url, method="post", headers=self.authorization_headers, params=params
-            )
+            self.api_call(url, method="post", authenticated=True, params=params)
 
-    @check_access_token
     def remove_from_playlist(self, playlist_id: str, track_uris: list[str]):
         url_ext = f"{self.version}/playlists/{playlist_id}/tracks"
         url = urljoin(base=self.base_url, url=url_ext)
@@ -235,16 +474,51 @@ class Spotify:
         tracks = [TrackURI(uri=uri) for uri in track_uris]
 
         for _tracks in utils.batch_list(tracks, batch_size=100):
-            body = RemovePlaylistItemsBody(tracks=_tracks).model_dump()
-            logger.debug(f"Removing: {body}.")
+            body = RemovePlaylistItemsBody(tracks=_tracks).model_dump(exclude_none=True)
+            logger.debug("Removing: %s.", body)
             self.api_call(
                 url=url,
                 method="delete",
-                headers=self.authorization_headers,
+                authenticated=True,
                 json=body,
             )
 
-    @check_access_token
+    def remove_from_playlist_by_position(
+        self, playlist_id: str, items: list[tuple[str, int]], snapshot_id: str
+    ) -> str:
+        # Removes only the given occurrences of each track, unlike removing by URI. The
+        # last positions are removed first, so each batch's positions are unaffected by
+        # the batches before it, and each batch is made against the snapshot left by
+        # the one before.
+        url_ext = f"{self.version}/playlists/{playlist_id}/tracks"
+        url = urljoin(base=self.base_url, url=url_ext)
+
+        items = sorted(items, key=lambda item: item[1], reverse=True)
+
+        for _items in utils.batch_list(items, batch_size=100):
+            positions: dict[str, list[int]] = {}
+            for uri, position in _items:
+                positions.setdefault(uri, []).append(position)
+            body = RemovePlaylistItemsBody(
+                tracks=[
+                    TrackURI(uri=uri, positions=uri_positions)
+                    for uri, uri_positions in positions.items()
+                ],
+                snapshot_id=snapshot_id,
+            ).model_dump(exclude_none=True)
+            logger.debug("Removing: %s.", body)
+            response = self.api_call(
+                url=url,
+                method="delete",
+                authenticated=True,
+                json=body,
+            )
+            snapshot_id = UpdatePlaylistResponse.model_validate_json(
+                response.content
+            ).snapshot_id
+
+        return snapshot_id
+
     def change_playlist_details(
         self,
         playlist_id: str,
@@ -263,27 +537,37 @@ class Spotify:
             description=description,
         ).model_dump(exclude_none=True)
 
-        self.api_call(url, method="put", headers=self.authorization_headers, json=body)
+        self.api_call(url, method="put", authenticated=True, json=body, idempotent=True)
 
-    @check_access_token
-    def search_for_track_by_artist_and_track_name(
-        self, artist: str, track_name: str, market: Optional[str] = None
+    def search_for_tracks(
+        self, query: str, market: Optional[str] = None
     ) -> list[TrackModel]:
-        query = f"artist:{artist} track:{track_name}"
-
-        logger.debug(f"Searching for track. Query: {query}")
+        logger.debug("Searching for track. Query: %s", query)
         result = self.search(
             query=query,
             thing_type="track",
             market=market,
         )
 
-        track_search_response = TrackSearchResponse.model_validate(result)
+        track_search_response = TrackSearchResponse.model_validate_json(result)
         tracks = track_search_response.tracks.items
 
         return tracks
 
-    @check_access_token
+    def search_for_tracks_fast(
+        self, query: str, market: Optional[str] = None
+    ) -> list[Track]:
+        logger.debug("Searching for track. Query: %s", query)
+        result = self.search(
+            query=query,
+            thing_type="track",
+            market=market,
+        )
+
+        tracks = parse_track_search_response(result)
+
+        return tracks
+
     def create_playlist(
         self,
         user_id: str,
@@ -305,16 +589,12 @@ class Spotify:
 
         logger.debug(f"Creating playlist: {body}")
 
-        response = self.api_call(
-            url, method="post", headers=self.authorization_headers, json=body
-        )
+        response = self.api_call(url, method="post", authenticated=True, json=body)
 
-        response_json = response.json()
-        playlist = PlaylistModel.model_validate(response_json)
+        playlist = PlaylistModel.model_validate_json(response.content)
 
         return playlist
 
-    @check_access_token
     def update_playlist(
         self,
         playlist_id: str,
@@ -338,24 +618,19 @@ class Spotify:
 
         logger.debug(f"Updating playlist: {body}")
 
-        response = self.api_call(
-            url, method="put", headers=self.authorization_headers, json=body
-        )
+        response = self.api_call(url, method="put", authenticated=True, json=body)
 
-        response_json = response.json()
-        response = UpdatePlaylistResponse.model_validate(response_json)
+        response = UpdatePlaylistResponse.model_validate_json(response.content)
 
         return response
 
-    @check_access_token
     def get_current_user_profile(self) -> UserModel:
 
         url_ext = f"{self.version}/me"
         url = urljoin(base=self.base_url, url=url_ext)
 
-        response = self.api_call(url, method="get", headers=self.authorization_headers)
+        response = self.api_call(url, method="get", authenticated=True)
 
-        response_json = response.json()
-        user = UserModel.model_validate(response_json)
+        user = UserModel.model_validate_json(response.content)
 
         return user
@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+from typing import Callable
+
+from bbc_to_spotify.spotify.models.external import GetAccessTokenResponse
+
+logger = logging.getLogger(__name__)
+
+
+# Holds the current access token and refreshes it at most once at a time. A
+# background timer refreshes the token `proactive_margin_s` before it expires, while
+# requests made inside the `refresh_margin_s` window refresh it synchronously as a
+# fallback (e.g. if the background refresh failed).
+class AccessTokenManager:
+    def __init__(
+        self,
+        fetch_token: Callable[[], GetAccessTokenResponse],
+        refresh_margin_s: float = 300,
+        proactive_margin_s: float = 600,
+    ):
+        self.fetch_token = fetch_token
+        self.refresh_margin_s = refresh_margin_s
+        self.proactive_margin_s = proactive_margin_s
+
+        self.lock = threading.Lock()
+        self.access_token: str | None = None
+        self.headers: dict | None = None
+        self.refresh_at = 0.0
+        self.timer: threading.Timer | None = None
+
+    def get_headers(self) -> dict:
+        headers = self.headers
+        if headers is None or time.monotonic() >= self.refresh_at:
+            headers = self.refresh(stale_headers=headers)
+        return headers
+
+    def refresh(self, stale_headers: dict | None = None) -> dict:
+        with self.lock:
+            # Another thread may have refreshed the token while this one was waiting.
+            if self.headers is not None and self.headers is not stale_headers:
+                return self.headers
+
+            logger.debug("Getting a new access token.")
+            token = self.fetch_token()
+            self.access_token = token.access_token
+            self.headers = {"Authorization": f"Bearer {token.access_token}"}
+            self.refresh_at = (
+                time.monotonic() + token.expires_in - self.refresh_margin_s
+            )
+            self.schedule_refresh(
+                delay_s=max(token.expires_in - self.proactive_margin_s, 0)
+            )
+            return self.headers
+
+    def schedule_refresh(self, delay_s: float):
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = threading.Timer(
+            delay_s, self.refresh_in_background, kwargs={"stale_headers": self.headers}
+        )
+        self.timer.daemon = True
+        self.timer.start()
+
+    def refresh_in_background(self, stale_headers: dict):
+        try:
+            self.refresh(stale_headers=stale_headers)
+        except Exception:
+            logger.exception("Background access token refresh failed.")
+
+    def close(self):
+        if self.timer is not None:
+            self.timer.cancel()
@@ -0,0 +1,42 @@
+import logging
+import os
+import shutil
+from pathlib import Path
+
+from bbc_to_spotify.store.index import INDEX_PATH, ResolutionIndex, write_index
+from bbc_to_spotify.store.store import TRACK_ADAPTER, Store
+
+logger = logging.getLogger(__name__)
+
+
+def export_cache(path: Path | str, store: Store | None = None) -> int:
+    owns_store = store is None
+    store = store if store is not None else Store()
+    try:
+        resolutions = store.get_serialized_resolved_tracks()
+    finally:
+        if owns_store:
+            store.close()
+    write_index(path=path, items=resolutions.items())
+    logger.info(f"Exported {len(resolutions)} resolved tracks to {path}.")
+    return len(resolutions)
+
+
+def import_cache(path: Path | str, index_path: Path | str = INDEX_PATH) -> int:
+    # Every track is checked before the index is installed, so that a corrupt or
+    # incompatible export fails here rather than during a later run.
+    index = ResolutionIndex(path)
+    try:
+        for _, track_json in index.items():
+            TRACK_ADAPTER.validate_json(track_json)
+        size = len(index)
+    finally:
+        index.close()
+
+    # Runs that already have the previous index open keep reading it until they end.
+    os.makedirs(Path(index_path).parent, exist_ok=True)
+    tmp_path = Path(f"{index_path}.tmp")
+    shutil.copyfile(path, tmp_path)
+    os.replace(tmp_path, index_path)
+    logger.info(f"Imported {size} resolved tracks from {path}.")
+    return size
@@ -0,0 +1,111 @@
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Iterable
+
+INDEX_PATH = Path(os.path.expanduser("~"), ".bbc-to-spotify", "index.bin")
+
+# The file starts with a header, followed by the offset of each record in key order,
+# and then the records themselves. Each record is a key and a value, prefixed by their
+# lengths. Keys are sorted by their UTF-8 bytes, so lookups are a binary search over
+# the offsets, and opening the file reads nothing but the header.
+MAGIC = b"BTSIDX01"
+HEADER = struct.Struct("<8sId")  # magic, number of records, exported timestamp
+OFFSET = struct.Struct("<Q")
+RECORD_HEADER = struct.Struct("<HI")  # key length, value length
+
+
+class IndexFormatError(Exception):
+    pass
+
+
+def write_index(path: Path | str, items: Iterable[tuple[str, bytes]]):
+    records = sorted((key.encode(), value) for key, value in items)
+
+    offset = HEADER.size + OFFSET.size * len(records)
+    offsets = []
+    for key, value in records:
+        offsets.append(offset)
+        offset += RECORD_HEADER.size + len(key) + len(value)
+
+    # Written aside and moved into place, so that readers never see a partial file.
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(records), time.time()))
+        file.writelines(OFFSET.pack(offset) for offset in offsets)
+        for key, value in records:
+            file.write(RECORD_HEADER.pack(len(key), len(value)))
+            file.write(key)
+            file.write(value)
+    os.replace(tmp_path, path)
+
+
+class ResolutionIndex:
+    # A read-only, memory-mapped map of normalized track keys to serialized tracks. Pages
+    # are only read from disk as lookups touch them, and are shared between processes.
+
+    def __init__(self, path: Path | str):
+        self.path = path
+        with open(path, "rb") as file:
+            try:
+                self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise IndexFormatError(f"Index file is empty: {path}") from e
+        if len(self.mmap) < HEADER.size:
+            self.close()
+            raise IndexFormatError(f"Index file is truncated: {path}")
+        magic, self.size, self.exported_ts = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise IndexFormatError(f"Not an index file: {path}")
+        self.records_start = HEADER.size + OFFSET.size * self.size
+        if self.records_start > len(self.mmap):
+            self.close()
+            raise IndexFormatError(f"Index file is truncated: {path}")
+
+    def __len__(self) -> int:
+        return self.size
+
+    def close(self):
+        self.mmap.close()
+
+    def get_record(self, i: int) -> tuple[bytes, int, int]:
+        # Returns the record's key, and the start and end of its value.
+        (offset,) = OFFSET.unpack_from(self.mmap, HEADER.size + OFFSET.size * i)
+        key_start = offset + RECORD_HEADER.size
+        if offset < self.records_start or key_start > len(self.mmap):
+            raise IndexFormatError(f"Index record {i} is out of bounds: {self.path}")
+        key_length, value_length = RECORD_HEADER.unpack_from(self.mmap, offset)
+        value_start = key_start + key_length
+        value_end = value_start + value_length
+        if value_end > len(self.mmap):
+            raise IndexFormatError(f"Index record {i} is out of bounds: {self.path}")
+        key = self.mmap[key_start:value_start]
+        return key, value_start, value_end
+
+    def get(self, key: str) -> bytes | None:
+        key_bytes = key.encode()
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key, value_start, value_end = self.get_record(mid)
+            if mid_key == key_bytes:
+                return self.mmap[value_start:value_end]
+            elif mid_key < key_bytes:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def items(self) -> Iterable[tuple[str, bytes]]:
+        for i in range(self.size):
+            key, value_start, value_end = self.get_record(i)
+            try:
+                decoded_key = key.decode()
+            except UnicodeDecodeError as e:
+                raise IndexFormatError(
+                    f"Index record {i} has an invalid key: {self.path}"
+                ) from e
+            yield decoded_key, self.mmap[value_start:value_end]
@@ -0,0 +1,49 @@
+import fcntl
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from bbc_to_spotify.deadline import DeadlineExceededError, get_wait_timeout_s
+from bbc_to_spotify.store.store import STORE_PATH
+
+logger = logging.getLogger(__name__)
+
+LOCKS_PATH = STORE_PATH.parent / "locks"
+
+# How often a lock is tried again while the run's deadline bounds the wait for it.
+LOCK_POLL_INTERVAL_S = 0.05
+
+
+# An advisory lock shared by every process (and thread) on the host, so that e.g. cron
+# jobs started in the same minute take turns rather than all doing the same work.
+@contextmanager
+def file_lock(name: str, locks_path: Path | str | None = None):
+    locks_path = locks_path if locks_path is not None else LOCKS_PATH
+    os.makedirs(locks_path, exist_ok=True)
+    path = Path(locks_path, re.sub(r"[^\w.-]", "_", name) + ".lock")
+    with open(path, "a") as file:
+        logger.debug("Waiting for lock: %s", name)
+        timeout_s = get_wait_timeout_s()
+        if timeout_s is None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        else:
+            # flock cannot time out, so is polled until the wait is over.
+            give_up_at = time.monotonic() + timeout_s
+            while True:
+                try:
+                    fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= give_up_at:
+                        raise DeadlineExceededError(
+                            f"Timed out waiting for lock: {name}"
+                        )
+                    time.sleep(LOCK_POLL_INTERVAL_S)
+        logger.debug("Acquired lock: %s", name)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
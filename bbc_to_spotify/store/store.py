@@ -0,0 +1,467 @@
+import dataclasses
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable
+
+from pydantic import TypeAdapter, ValidationError
+
+from bbc_to_spotify.deadline import DeadlineExceededError, get_wait_timeout_s
+from bbc_to_spotify.history.models import RunRecord
+from bbc_to_spotify.playlist.models import QueryStrategyStats
+from bbc_to_spotify.spotify.models.external import GetAccessTokenResponse
+from bbc_to_spotify.spotify.models.internal import Track
+from bbc_to_spotify.store.index import INDEX_PATH, IndexFormatError, ResolutionIndex
+
+logger = logging.getLogger(__name__)
+
+STORE_PATH = Path(os.path.expanduser("~"), ".bbc-to-spotify", "store.db")
+
+# Unresolvable tracks are re-checked after 1 day, then 2, 4, 8... capped at 32 days.
+MISS_RECHECK_BASE_S = 24 * 60 * 60
+MISS_RECHECK_MAX_S = 32 * 24 * 60 * 60
+
+# Runs' history is kept for this long.
+HISTORY_MAX_AGE_S = 90 * 24 * 60 * 60
+
+# How long to wait for other processes to finish writing, unless the run's deadline
+# leaves less.
+BUSY_TIMEOUT_S = 30
+
+TRACK_ADAPTER = TypeAdapter(Track)
+RUN_FIELDS = tuple(field.name for field in dataclasses.fields(RunRecord))
+
+
+def get_miss_recheck_interval(misses: int) -> float:
+    interval = MISS_RECHECK_BASE_S * 2 ** max(misses - 1, 0)
+    return min(interval, MISS_RECHECK_MAX_S)
+
+
+class Store:
+    def __init__(
+        self, path: Path | str = STORE_PATH, index_path: Path | str = INDEX_PATH
+    ):
+        os.makedirs(Path(path).parent, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        # Other processes on the host may be using the store at the same time.
+        self.connection = sqlite3.connect(
+            path, timeout=BUSY_TIMEOUT_S, check_same_thread=False
+        )
+        self.busy_timeout_s: float = BUSY_TIMEOUT_S
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.create_tables()
+        self.index = self.maybe_open_index(index_path)
+
+    @contextmanager
+    def locked(self):
+        # Waits for other threads, and then other processes, for no longer than the
+        # run's deadline allows.
+        timeout_s = get_wait_timeout_s()
+        if not self.lock.acquire(timeout=-1 if timeout_s is None else timeout_s):
+            raise DeadlineExceededError("Timed out waiting for the store.")
+        try:
+            busy_timeout_s = (
+                BUSY_TIMEOUT_S if timeout_s is None else min(timeout_s, BUSY_TIMEOUT_S)
+            )
+            if busy_timeout_s != self.busy_timeout_s:
+                self.connection.execute(
+                    f"PRAGMA busy_timeout = {round(busy_timeout_s * 1000)}"
+                )
+                self.busy_timeout_s = busy_timeout_s
+            yield
+        finally:
+            self.lock.release()
+
+    @staticmethod
+    def maybe_open_index(index_path: Path | str) -> ResolutionIndex | None:
+        if not os.path.exists(index_path):
+            return None
+        try:
+            index = ResolutionIndex(index_path)
+        except IndexFormatError:
+            logger.warning("Ignoring invalid index file: %s", index_path, exc_info=True)
+            return None
+        logger.debug(f"Opened index of {len(index)} resolved tracks: {index_path}")
+        return index
+
+    def create_tables(self):
+        with self.locked(), self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS unresolved_tracks ("
+                " key TEXT PRIMARY KEY,"
+                " text TEXT NOT NULL,"
+                " misses INTEGER NOT NULL,"
+                " next_check_ts REAL NOT NULL"
+                ")"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS scraped_tracks ("
+                " station TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " position INTEGER NOT NULL,"
+                " track TEXT,"
+                " PRIMARY KEY (station, key)"
+                ")"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS resolved_tracks ("
+                " key TEXT PRIMARY KEY,"
+                " track TEXT NOT NULL,"
+                " resolved_ts REAL NOT NULL"
+                ")"
+            )
+            # Resolutions in the index that were found to be unavailable, so that
+            # they are searched for again rather than read from the index.
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS evicted_index_tracks ("
+                " key TEXT PRIMARY KEY"
+                ")"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " url TEXT PRIMARY KEY,"
+                " content BLOB NOT NULL,"
+                " fetched_ts REAL NOT NULL"
+                ")"
+            )
+            # Keyed by the app's client ID and a hash of the user's refresh token.
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS access_tokens ("
+                " key TEXT PRIMARY KEY,"
+                " access_token TEXT NOT NULL,"
+                " expires_ts REAL NOT NULL"
+                ")"
+            )
+            # Totals across every run, for ranking the strategies that tracks are
+            # searched for with.
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS query_strategies ("
+                " name TEXT PRIMARY KEY,"
+                " attempts INTEGER NOT NULL,"
+                " hits INTEGER NOT NULL,"
+                " total_latency_s REAL NOT NULL"
+                ")"
+            )
+            # One row per playlist updated by each run.
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " run_id TEXT NOT NULL,"
+                " command TEXT NOT NULL,"
+                " station TEXT NOT NULL,"
+                " playlist_id TEXT NOT NULL,"
+                " started_ts REAL NOT NULL,"
+                " duration_s REAL NOT NULL,"
+                " phase_durations_s TEXT NOT NULL,"
+                " requests INTEGER NOT NULL,"
+                " retries INTEGER NOT NULL,"
+                " throttled INTEGER NOT NULL,"
+                " server_errors INTEGER NOT NULL,"
+                " tracks INTEGER NOT NULL,"
+                " cache_hits INTEGER NOT NULL,"
+                " tracks_added INTEGER NOT NULL,"
+                " tracks_removed INTEGER NOT NULL,"
+                " tracks_evicted INTEGER NOT NULL,"
+                " tracks_deferred INTEGER NOT NULL,"
+                " error TEXT"
+                ")"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS runs_started_ts ON runs (started_ts)"
+            )
+
+    def close(self):
+        self.connection.close()
+        if self.index is not None:
+            self.index.close()
+
+    def is_known_miss(self, key: str, text: str) -> bool:
+        with self.locked():
+            row = self.connection.execute(
+                "SELECT text, next_check_ts FROM unresolved_tracks WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return False
+        known_text, next_check_ts = row
+        # A change in the scraped text may mean the entry was corrected, so check it.
+        return known_text == text and time.time() < next_check_ts
+
+    def record_miss(self, key: str, text: str):
+        with self.locked(), self.connection:
+            row = self.connection.execute(
+                "SELECT text, misses FROM unresolved_tracks WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[0] == text:
+                misses = row[1] + 1
+            else:
+                misses = 1
+            next_check_ts = time.time() + get_miss_recheck_interval(misses)
+            logger.debug(
+                f"Recording miss {misses} for '{text}'. Next check at {next_check_ts}."
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO unresolved_tracks"
+                " (key, text, misses, next_check_ts) VALUES (?, ?, ?, ?)",
+                (key, text, misses, next_check_ts),
+            )
+
+    def clear_miss(self, key: str):
+        with self.locked(), self.connection:
+            self.connection.execute(
+                "DELETE FROM unresolved_tracks WHERE key = ?", (key,)
+            )
+
+    def get_scraped_tracks(self, station: str) -> dict[str, Track | None]:
+        with self.locked():
+            rows = self.connection.execute(
+                "SELECT key, track FROM scraped_tracks WHERE station = ?"
+                " ORDER BY position",
+                (station,),
+            ).fetchall()
+        resolutions = {
+            key: TRACK_ADAPTER.validate_json(track) if track is not None else None
+            for key, track in rows
+        }
+        return resolutions
+
+    def set_scraped_tracks(self, station: str, resolutions: dict[str, Track | None]):
+        rows = [
+            (
+                station,
+                key,
+                position,
+                TRACK_ADAPTER.dump_json(track) if track is not None else None,
+            )
+            for position, (key, track) in enumerate(resolutions.items())
+        ]
+        with self.locked(), self.connection:
+            self.connection.execute(
+                "DELETE FROM scraped_tracks WHERE station = ?", (station,)
+            )
+            self.connection.executemany(
+                "INSERT INTO scraped_tracks (station, key, position, track)"
+                " VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def get_resolved_track(self, key: str) -> Track | None:
+        with self.locked():
+            row = self.connection.execute(
+                "SELECT track FROM resolved_tracks WHERE key = ?", (key,)
+            ).fetchone()
+        if row is not None:
+            return TRACK_ADAPTER.validate_json(row[0])
+        # Resolutions imported from another host are only used when there is none of
+        # this host's own, which is kept up to date.
+        if self.index is None:
+            return None
+        with self.locked():
+            evicted = self.connection.execute(
+                "SELECT 1 FROM evicted_index_tracks WHERE key = ?", (key,)
+            ).fetchone()
+        if evicted is not None:
+            return None
+        # A damaged index is no worse than a missing one, so the track is searched for
+        # instead.
+        try:
+            track_json = self.index.get(key)
+            if track_json is None:
+                return None
+            track = TRACK_ADAPTER.validate_json(track_json)
+        except (IndexFormatError, ValidationError):
+            logger.warning("Ignoring invalid index record for: %s", key, exc_info=True)
+            return None
+        # Copied into the store as never checked on this host, so that it is first in
+        # line to be revalidated.
+        with self.locked(), self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO resolved_tracks (key, track, resolved_ts)"
+                " VALUES (?, ?, 0)",
+                (key, track_json),
+            )
+        return track
+
+    def get_serialized_resolved_tracks(self) -> dict[str, bytes]:
+        # Includes the index's resolutions, so that re-exporting it keeps them.
+        with self.locked():
+            rows = self.connection.execute(
+                "SELECT key, track FROM resolved_tracks"
+            ).fetchall()
+            evicted_keys = {
+                key
+                for key, in self.connection.execute(
+                    "SELECT key FROM evicted_index_tracks"
+                )
+            }
+        resolutions = (
+            {
+                key: track_json
+                for key, track_json in self.index.items()
+                if key not in evicted_keys
+            }
+            if self.index is not None
+            else {}
+        )
+        resolutions.update(rows)
+        return resolutions
+
+    def set_resolved_track(self, key: str, track: Track):
+        with self.locked(), self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO resolved_tracks (key, track, resolved_ts)"
+                " VALUES (?, ?, ?)",
+                (key, TRACK_ADAPTER.dump_json(track), time.time()),
+            )
+
+    def get_stale_resolved_tracks(
+        self, max_age_s: float, limit: int
+    ) -> dict[str, Track]:
+        with self.locked():
+            rows = self.connection.execute(
+                "SELECT key, track FROM resolved_tracks WHERE resolved_ts < ?"
+                " ORDER BY resolved_ts LIMIT ?",
+                (time.time() - max_age_s, limit),
+            ).fetchall()
+        return {key: TRACK_ADAPTER.validate_json(track) for key, track in rows}
+
+    def update_resolved_track(self, key: str, track: Track):
+        # Also updates the track wherever a station's previous scrape resolved to it.
+        track_json = TRACK_ADAPTER.dump_json(track)
+        with self.locked(), self.connection:
+            self.connection.execute(
+                "UPDATE resolved_tracks SET track = ?, resolved_ts = ? WHERE key = ?",
+                (track_json, time.time(), key),
+            )
+            self.connection.execute(
+                "UPDATE scraped_tracks SET track = ? WHERE key = ?", (track_json, key)
+            )
+
+    def evict_resolved_track(self, key: str):
+        # Stations' previous scrapes forget the track too, so it is searched for again.
+        with self.locked(), self.connection:
+            self.connection.execute("DELETE FROM resolved_tracks WHERE key = ?", (key,))
+            self.connection.execute(
+                "UPDATE scraped_tracks SET track = NULL WHERE key = ?", (key,)
+            )
+            if self.index is not None:
+                self.connection.execute(
+                    "INSERT OR IGNORE INTO evicted_index_tracks (key) VALUES (?)",
+                    (key,),
+                )
+
+    def get_page(self, url: str, max_age_s: float) -> bytes | None:
+        with self.locked():
+            row = self.connection.execute(
+                "SELECT content FROM pages WHERE url = ? AND fetched_ts > ?",
+                (url, time.time() - max_age_s),
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def set_page(self, url: str, content: bytes):
+        with self.locked(), self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO pages (url, content, fetched_ts)"
+                " VALUES (?, ?, ?)",
+                (url, content, time.time()),
+            )
+
+    def get_access_token(
+        self, key: str, min_ttl_s: float
+    ) -> GetAccessTokenResponse | None:
+        with self.locked():
+            row = self.connection.execute(
+                "SELECT access_token, expires_ts FROM access_tokens"
+                " WHERE key = ? AND expires_ts > ?",
+                (key, time.time() + min_ttl_s),
+            ).fetchone()
+        if row is None:
+            return None
+        access_token, expires_ts = row
+        return GetAccessTokenResponse(
+            access_token=access_token, expires_in=int(expires_ts - time.time())
+        )
+
+    def set_access_token(self, key: str, token: GetAccessTokenResponse):
+        with self.locked(), self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO access_tokens"
+                " (key, access_token, expires_ts) VALUES (?, ?, ?)",
+                (key, token.access_token, time.time() + token.expires_in),
+            )
+
+    def add_runs(self, runs: list[RunRecord]):
+        rows = [
+            tuple(
+                json.dumps(value) if field == "phase_durations_s" else value
+                for field, value in zip(RUN_FIELDS, dataclasses.astuple(run))
+            )
+            for run in runs
+        ]
+        with self.locked(), self.connection:
+            self.connection.executemany(
+                f"INSERT INTO runs ({', '.join(RUN_FIELDS)})"
+                f" VALUES ({', '.join('?' * len(RUN_FIELDS))})",
+                rows,
+            )
+            self.connection.execute(
+                "DELETE FROM runs WHERE started_ts < ?",
+                (time.time() - HISTORY_MAX_AGE_S,),
+            )
+
+    def get_runs(self, since_ts: float, station: str | None = None) -> list[RunRecord]:
+        query = f"SELECT {', '.join(RUN_FIELDS)} FROM runs WHERE started_ts >= ?"
+        params: tuple = (since_ts,)
+        if station is not None:
+            query += " AND station = ?"
+            params += (station,)
+        with self.locked():
+            rows = self.connection.execute(
+                query + " ORDER BY started_ts", params
+            ).fetchall()
+        runs = []
+        for row in rows:
+            fields = dict(zip(RUN_FIELDS, row))
+            fields["phase_durations_s"] = json.loads(fields["phase_durations_s"])
+            runs.append(RunRecord(**fields))
+        return runs
+
+    def get_query_strategy_stats(self) -> dict[str, QueryStrategyStats]:
+        with self.locked():
+            rows = self.connection.execute(
+                "SELECT name, attempts, hits, total_latency_s FROM query_strategies"
+            ).fetchall()
+        return {
+            name: QueryStrategyStats(
+                name=name, attempts=attempts, hits=hits, total_latency_s=total_latency_s
+            )
+            for name, attempts, hits, total_latency_s in rows
+        }
+
+    def add_query_strategy_stats(self, stats: Iterable[QueryStrategyStats]):
+        # Adds to the totals, so that runs in other processes are not overwritten.
+        rows = [
+            (
+                strategy_stats.name,
+                strategy_stats.attempts,
+                strategy_stats.hits,
+                strategy_stats.total_latency_s,
+            )
+            for strategy_stats in stats
+        ]
+        with self.locked(), self.connection:
+            self.connection.executemany(
+                "INSERT INTO query_strategies (name, attempts, hits, total_latency_s)"
+                " VALUES (?, ?, ?, ?) ON CONFLICT (name) DO UPDATE SET"
+                " attempts = attempts + excluded.attempts,"
+                " hits = hits + excluded.hits,"
+                " total_latency_s = total_latency_s + excluded.total_latency_s",
+                rows,
+            )
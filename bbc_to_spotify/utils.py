@@ -1,4 +1,5 @@
 import logging
+import math
 from typing import Any, Literal, Union
 
 Station = Union[
@@ -74,3 +75,11 @@ def batch_list(l: list[Any], batch_size: int) -> list[list[Any]]:
         batches.append(l[idx_start:idx_end])
 
     return batches
+
+
+def get_percentile(values: list[float], percentile: float) -> float:
+
+    # Nearest-rank percentile of the values, which must not be empty.
+    sorted_values = sorted(values)
+    idx = math.ceil(percentile / 100 * len(sorted_values)) - 1
+    return sorted_values[max(idx, 0)]
@@ -0,0 +1,348 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import timeit
+from collections import Counter
+from pathlib import Path
+from typing import Callable
+
+from bbc_to_spotify.normalization.normalization import (
+    is_simple_track_or_artist,
+    simplify_track_or_artist,
+)
+from bbc_to_spotify.playlist.update import add_tracks_and_prune_playlist
+from bbc_to_spotify.scraping.scraping import (
+    scrape_tracks_from_html,
+    scrape_tracks_from_page,
+)
+from bbc_to_spotify.scraping.structured import scrape_tracks_from_structured_data
+from bbc_to_spotify.spotify.models.internal import Album, Artist, Track
+from bbc_to_spotify.store.index import ResolutionIndex, write_index
+from bbc_to_spotify.store.store import TRACK_ADAPTER
+
+# Run from the repository root with: python -m benchmarks.benchmarks
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+# Saved playlist pages, one per station, so that changes which only affect the BBC's
+# own markup (e.g. its navigation and scripts) show up too.
+STATION_PAGES_PATH = Path(__file__).parent.parent / "tests" / "fixtures" / "stations"
+
+# Timings depend on the machine and on how busy it is, so each benchmark is timed
+# relative to a fixed workload timed alongside it, and the baseline holds these relative
+# timings. They still differ between CPUs and Python versions, so the baseline should be
+# updated (with --update-baseline) on the machine that checks for regressions.
+
+# Only slowdowns beyond this fraction of the baseline count as regressions, and only
+# when they repeat on every one of this many further timings.
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_CONFIRMATIONS = 2
+
+# A BBC playlist page lists roughly this many tracks.
+PAGE_TRACKS = 60
+
+
+def make_names(n: int) -> list[str]:
+    # A mix of simple names and names with feature credits, punctuation and padding.
+    templates = (
+        "Artist {i}",
+        "Artist {i} feat. Guest {i}",
+        "Artist's {i} (Remix)",
+        "  Artist  {i} & Band ",
+    )
+    names = [templates[i % len(templates)].format(i=i) for i in range(n)]
+    return names
+
+
+def make_html_page(num_tracks: int) -> bytes:
+    paras = "".join(
+        f"<p>{artist} - Song {i}<br/>{artist} &amp; Band - Song {i} (Edit)</p>"
+        for i, artist in enumerate(make_names(num_tracks // 2))
+    )
+    return (
+        "<html><body><div class='component component--box"
+        " component--box-flushbody-vertical component--box--primary'>"
+        f"<h2>A LIST</h2>{paras}</div></body></html>"
+    ).encode()
+
+
+def make_structured_page(num_tracks: int) -> bytes:
+    data = {
+        "segments": [
+            {
+                "segment_type": "music",
+                "titles": {"primary": artist, "secondary": f"Song {i}"},
+            }
+            for i, artist in enumerate(make_names(num_tracks))
+        ]
+    }
+    return (
+        '<html><head><script type="application/json">'
+        f"{json.dumps(data)}</script></head><body></body></html>"
+    ).encode()
+
+
+def read_station_pages() -> dict[str, bytes]:
+    return {
+        path.stem: path.read_bytes()
+        for path in sorted(STATION_PAGES_PATH.glob("*.html"))
+    }
+
+
+def print_page_sizes():
+    # The scrape benchmarks compare the parse times of the two page formats, and these
+    # their sizes.
+    for name, page in (
+        ("HTML", make_html_page(PAGE_TRACKS)),
+        ("Structured", make_structured_page(PAGE_TRACKS)),
+    ):
+        print(f"{name} page of {PAGE_TRACKS} tracks: {len(page) / 1024:.1f}KiB")
+    for station, page in read_station_pages().items():
+        print(f"Saved {station} page: {len(page) / 1024:.1f}KiB")
+
+
+def make_tracks(n: int, offset: int = 0) -> list[Track]:
+    tracks = []
+    for i in range(offset, offset + n):
+        artist = Artist(name=f"Artist {i}", uri=f"spotify:artist:a{i}", id=f"a{i}")
+        album = Album(
+            name=f"Album {i}", artists=[artist], uri=f"spotify:album:b{i}", id=f"b{i}"
+        )
+        tracks.append(
+            Track(
+                album=album,
+                artists=[artist],
+                name=f"Song {i}",
+                uri=f"spotify:track:t{i}",
+                id=f"t{i}",
+                popularity=i % 100,
+            )
+        )
+    return tracks
+
+
+def bench_prune_planning(num_dest_tracks: int) -> Callable[[], object]:
+    # Half the destination stays, half is pruned, and 100 new source tracks are added.
+    dest_tracks = make_tracks(num_dest_tracks)
+    source_tracks = make_tracks(num_dest_tracks // 2 + 100, offset=num_dest_tracks // 2)
+    return lambda: add_tracks_and_prune_playlist(
+        spotify_client=None,  # never called on a dry run
+        playlist_id="benchmark",
+        dest_track_counts=Counter(dest_tracks),
+        source_tracks=iter(source_tracks),
+        prune_dest=True,
+        prepend=False,
+        dry_run=True,
+    )
+
+
+def bench_scrape_html_logged(content: bytes, level: int) -> Callable[[], object]:
+    # Logging is disabled for the other benchmarks. Here it is enabled at the given
+    # level, writing to a stream that discards it, so scraping at WARNING shows the
+    # cost of the debug logs that are not formatted.
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    root_logger = logging.getLogger()
+
+    def scrape():
+        logging.disable(logging.NOTSET)
+        root_logger.addHandler(handler)
+        previous_level = root_logger.level
+        root_logger.setLevel(level)
+        try:
+            return scrape_tracks_from_html(content)
+        finally:
+            root_logger.setLevel(previous_level)
+            root_logger.removeHandler(handler)
+            logging.disable(logging.CRITICAL)
+
+    return scrape
+
+
+def make_index(num_tracks: int) -> Path:
+    # Written once per run, and left for the OS to clean up with the temp directory.
+    path = Path(tempfile.mkdtemp(), "index.bin")
+    write_index(
+        path=path,
+        items=(
+            (f"artist {i}|song {i}", TRACK_ADAPTER.dump_json(track))
+            for i, track in enumerate(make_tracks(num_tracks))
+        ),
+    )
+    return path
+
+
+def bench_index_lookups(index_path: Path, num_lookups: int) -> Callable[[], object]:
+    index = ResolutionIndex(index_path)
+    size = len(index)
+    keys = [
+        f"artist {i * size // num_lookups}|song {i * size // num_lookups}"
+        for i in range(num_lookups)
+    ]
+    return lambda: [index.get(key) for key in keys]
+
+
+def get_benchmarks() -> dict[str, Callable[[], object]]:
+    html_page = make_html_page(PAGE_TRACKS)
+    large_html_page = make_html_page(10 * PAGE_TRACKS)
+    structured_page = make_structured_page(PAGE_TRACKS)
+    large_structured_page = make_structured_page(10 * PAGE_TRACKS)
+    names = make_names(1000)
+    tracks = make_tracks(10_000)
+    other_tracks = make_tracks(10_000, offset=5_000)
+    index_path = make_index(100_000)
+
+    # The saved pages are scraped as a run would, trying each source in turn.
+    station_benchmarks = {
+        f"scrape_page_{station}": lambda page=page: scrape_tracks_from_page(page)
+        for station, page in read_station_pages().items()
+    }
+
+    # The normalization functions are memoized, so the uncached functions are timed.
+    return {
+        **station_benchmarks,
+        "scrape_html": lambda: scrape_tracks_from_html(html_page),
+        "scrape_html_10x": lambda: scrape_tracks_from_html(large_html_page),
+        "scrape_html_10x_warning": bench_scrape_html_logged(
+            large_html_page, level=logging.WARNING
+        ),
+        "scrape_html_10x_debug": bench_scrape_html_logged(
+            large_html_page, level=logging.DEBUG
+        ),
+        "scrape_structured": lambda: scrape_tracks_from_structured_data(
+            structured_page
+        ),
+        "scrape_structured_10x": lambda: scrape_tracks_from_structured_data(
+            large_structured_page
+        ),
+        "simplify_track_or_artist_1k": lambda: [
+            simplify_track_or_artist.__wrapped__(name) for name in names
+        ],
+        "is_simple_track_or_artist_1k": lambda: [
+            is_simple_track_or_artist.__wrapped__(name) for name in names
+        ],
+        "track_set_operations_10k": lambda: set(tracks).difference(other_tracks),
+        "prune_planning_1k": bench_prune_planning(1_000),
+        "prune_planning_10k": bench_prune_planning(10_000),
+        "prune_planning_50k": bench_prune_planning(50_000),
+        "index_open_100k": lambda: ResolutionIndex(index_path).close(),
+        "index_lookup_1k_of_100k": bench_index_lookups(index_path, 1_000),
+    }
+
+
+def make_reference() -> Callable[[], object]:
+    # Pure-Python work that the code under test does not change: building, hashing and
+    # sorting strings, much as the benchmarks do.
+    names = [f"Artist {i} - Song {i}" for i in range(10_000)]
+    return lambda: sorted({name.casefold(): name for name in names}, key=len)
+
+
+def time_relative(
+    func: Callable[[], object], reference: Callable[[], object], repeat: int
+) -> tuple[float, float]:
+    # Returns the benchmark's timing, and its median timing relative to the reference's.
+    # The two are timed in turn each round, so that both see the same load.
+    timer = timeit.Timer(func)
+    reference_timer = timeit.Timer(reference)
+    number, _ = timer.autorange()
+    reference_number, _ = reference_timer.autorange()
+    timings_s = []
+    relative_timings = []
+    for _ in range(repeat):
+        reference_s = reference_timer.timeit(number=reference_number) / reference_number
+        timing_s = timer.timeit(number=number) / number
+        timings_s.append(timing_s)
+        relative_timings.append(timing_s / reference_s)
+    return min(timings_s), statistics.median(relative_timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the benchmarks, comparing them against the saved baseline."
+    )
+    parser.add_argument(
+        "--update-baseline",
+        help="Save the relative timings as the new baseline for this machine.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--threshold",
+        help=(
+            "Fail if a benchmark is slower than the baseline by more than this"
+            f" fraction (default: {DEFAULT_THRESHOLD})."
+        ),
+        default=DEFAULT_THRESHOLD,
+        type=float,
+    )
+    parser.add_argument(
+        "--confirm",
+        help=(
+            "Time a benchmark that regressed this many more times, failing only if it"
+            f" regresses every time (default: {DEFAULT_CONFIRMATIONS})."
+        ),
+        default=DEFAULT_CONFIRMATIONS,
+        type=int,
+    )
+    parser.add_argument(
+        "--repeat",
+        help="The number of timed batches per benchmark (default: 5).",
+        default=5,
+        type=int,
+    )
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    baseline: dict[str, float] = {}
+    if BASELINE_PATH.exists():
+        baseline = json.loads(BASELINE_PATH.read_text())
+
+    print_page_sizes()
+
+    reference = make_reference()
+    relative_timings: dict[str, float] = {}
+    regressions: list[str] = []
+    for name, func in get_benchmarks().items():
+        timing_s, relative_timing = time_relative(
+            func=func, reference=reference, repeat=args.repeat
+        )
+        baseline_timing = baseline.get(name)
+        if baseline_timing is None:
+            relative_timings[name] = round(relative_timing, 5)
+            print(f"{name}: {timing_s * 1e3:.3f}ms (no baseline)")
+            continue
+
+        # A single slow timing may be noise, e.g. from another process competing for
+        # the CPU, so the fastest of the further timings is kept.
+        change = relative_timing / baseline_timing - 1
+        confirmations = 0
+        while (
+            not args.update_baseline
+            and change > args.threshold
+            and confirmations < args.confirm
+        ):
+            confirmations += 1
+            retiming_s, relative_retiming = time_relative(
+                func=func, reference=reference, repeat=args.repeat
+            )
+            if relative_retiming < relative_timing:
+                timing_s, relative_timing = retiming_s, relative_retiming
+                change = relative_timing / baseline_timing - 1
+        relative_timings[name] = round(relative_timing, 5)
+
+        print(f"{name}: {timing_s * 1e3:.3f}ms ({change:+.0%} vs baseline)")
+        if change > args.threshold:
+            regressions.append(name)
+
+    if args.update_baseline:
+        BASELINE_PATH.write_text(json.dumps(relative_timings, indent=2) + "\n")
+        print(f"Baseline saved to {BASELINE_PATH}.")
+    elif regressions:
+        print(f"Regressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
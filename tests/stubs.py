@@ -0,0 +1,116 @@
+import json
+import threading
+from pathlib import Path
+from typing import Callable
+from urllib.parse import parse_qsl, urlparse
+
+import requests
+
+from bbc_to_spotify.spotify.spotify import Spotify
+
+Handler = Callable[[dict], requests.Response]
+
+FIXTURES_PATH = Path(__file__).parent / "fixtures"
+
+
+def read_fixture(name: str) -> bytes:
+    return (FIXTURES_PATH / name).read_bytes()
+
+
+def make_response(
+    status_code: int = 200, body: dict | bytes = b"{}", headers: dict | None = None
+) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = "Stub"
+    response._content = body if isinstance(body, bytes) else json.dumps(body).encode()
+    response.headers.update(headers or {})
+    return response
+
+
+def token_handler(params: dict) -> requests.Response:
+    return make_response(body={"access_token": "token", "expires_in": 3600})
+
+
+class StubSession:
+    # Stands in for a requests session, answering each request with the handler for its
+    # method and path, and recording the requests made.
+
+    def __init__(self, routes: dict[tuple[str, str], Handler]):
+        self.routes = {("post", "/api/token"): token_handler, **routes}
+        self.calls: list[tuple[str, str]] = []
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        params: dict | None = None,
+        **kwargs,
+    ) -> requests.Response:
+        parsed_url = urlparse(url)
+        self.calls.append((method, parsed_url.path))
+        handler = self.routes[(method, parsed_url.path)]
+        response = handler({**dict(parse_qsl(parsed_url.query)), **(params or {})})
+        response.url = url
+        return response
+
+    def close(self):
+        pass
+
+
+def make_client(session: StubSession, **kwargs) -> Spotify:
+    spotify_client = Spotify(
+        client_id="client-id",
+        client_secret="client-secret",
+        grant_type="refresh_token",
+        refresh_token="refresh-token",
+        session=session,
+        **kwargs,
+    )
+    return spotify_client
+
+
+def make_artist_json(i: int) -> dict:
+    return {"name": f"Artist {i}", "uri": f"spotify:artist:a{i}", "id": f"a{i}"}
+
+
+def make_track_json(i: int) -> dict:
+    track_json = {
+        "album": {
+            "name": f"Album {i}",
+            "artists": [make_artist_json(i)],
+            "uri": f"spotify:album:b{i}",
+            "id": f"b{i}",
+        },
+        "artists": [make_artist_json(i)],
+        "name": f"Song {i}",
+        "uri": f"spotify:track:t{i}",
+        "id": f"t{i}",
+        "popularity": i % 100,
+    }
+    return track_json
+
+
+def make_search_response(*track_jsons: dict) -> requests.Response:
+    body = {
+        "tracks": {
+            "items": list(track_jsons),
+            "limit": 20,
+            "offset": 0,
+            "total": len(track_jsons),
+        }
+    }
+    return make_response(body=body)
+
+
+def make_search_handler() -> Handler:
+    # Finds a different track for each distinct query.
+    queries: dict[str, int] = {}
+    lock = threading.Lock()
+
+    def handle(params: dict) -> requests.Response:
+        with lock:
+            i = queries.setdefault(params["q"], len(queries))
+        return make_search_response(make_track_json(i))
+
+    return handle
@@ -0,0 +1,70 @@
+import contextlib
+import io
+import unittest
+
+from pydantic import ValidationError
+
+from bbc_to_spotify.cli import setup_parser
+from bbc_to_spotify.serve.models.external import SyncJobRequest
+
+
+class MaxTracksTest(unittest.TestCase):
+    def parse_max_tracks(self, value: str) -> int:
+        args = setup_parser().parse_args(
+            ["update-playlist", "playlist", "radio-1", "--max-tracks", value]
+        )
+        return args.max_tracks
+
+    def test_valid(self):
+        self.assertEqual(self.parse_max_tracks("1"), 1)
+        self.assertEqual(self.parse_max_tracks("200"), 200)
+
+    def test_invalid(self):
+        for value in ("0", "-5", "ten"):
+            with (
+                self.subTest(value=value),
+                contextlib.redirect_stderr(io.StringIO()) as stderr,
+                self.assertRaises(SystemExit),
+            ):
+                self.parse_max_tracks(value)
+            self.assertIn("--max-tracks", stderr.getvalue())
+
+    def test_job_request(self):
+        with self.assertRaises(ValidationError):
+            SyncJobRequest(station="radio-1", playlist_ids=["playlist"], max_tracks=0)
+
+
+class DeadlineTest(unittest.TestCase):
+    def parse_deadline(self, command: list[str], value: str) -> float:
+        return setup_parser().parse_args([*command, "--deadline", value]).deadline
+
+    def test_valid(self):
+        for command in (
+            ["update-playlist", "playlist", "radio-1"],
+            ["create-playlist", "name", "radio-1"],
+        ):
+            with self.subTest(command=command[0]):
+                self.assertEqual(self.parse_deadline(command, "0.5"), 0.5)
+                self.assertEqual(self.parse_deadline(command, "60"), 60)
+
+    def test_invalid(self):
+        for value in ("0", "-5", "nan", "inf", "ten"):
+            with (
+                self.subTest(value=value),
+                contextlib.redirect_stderr(io.StringIO()) as stderr,
+                self.assertRaises(SystemExit),
+            ):
+                self.parse_deadline(["update-playlist", "playlist", "radio-1"], value)
+            self.assertIn("--deadline", stderr.getvalue())
+
+
+class WorkersTest(unittest.TestCase):
+    def test_workers(self):
+        args = setup_parser().parse_args(["serve", "--workers", "2"])
+        self.assertEqual(args.workers, 2)
+        with (
+            contextlib.redirect_stderr(io.StringIO()) as stderr,
+            self.assertRaises(SystemExit),
+        ):
+            setup_parser().parse_args(["serve", "--workers", "0"])
+        self.assertIn("--workers", stderr.getvalue())
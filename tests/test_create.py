@@ -0,0 +1,151 @@
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import requests
+
+from bbc_to_spotify.authorize.models.internal import Credentials
+from bbc_to_spotify.playlist.create import (
+    UNCREATED_PLAYLIST_ID,
+    create_playlist_and_add_tracks,
+)
+from bbc_to_spotify.spotify.models.internal import Playlist
+from bbc_to_spotify.store.store import Store
+from tests.stubs import (
+    StubSession,
+    make_client,
+    make_response,
+    make_search_handler,
+    read_fixture,
+)
+
+USER = {"display_name": "User", "id": "user", "uri": "spotify:user:user"}
+PLAYLIST = {
+    "tracks": {"items": []},
+    "collaborative": False,
+    "name": "Playlist",
+    "public": False,
+    "uri": "spotify:playlist:created",
+    "id": "created",
+    "snapshot_id": "snapshot",
+}
+
+
+class CreatePlaylistTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = Path(tmp_dir.name)
+        self.store = self.open_store()
+
+        self.session = StubSession(self.get_routes())
+        spotify_client = make_client(self.session)
+
+        for patcher in (
+            mock.patch("bbc_to_spotify.playlist.create.Store", lambda: self.store),
+            mock.patch(
+                "bbc_to_spotify.playlist.create.Spotify",
+                lambda **kwargs: spotify_client,
+            ),
+            mock.patch("bbc_to_spotify.scraping.scraping.requests.get", self.get_page),
+            mock.patch("bbc_to_spotify.store.locks.LOCKS_PATH", tmp_dir.name),
+            # Strategies that check the artist would not match the stub's tracks.
+            mock.patch("bbc_to_spotify.playlist.strategies.EXPLORATION_RATE", 0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(spotify_client.close)
+
+    def open_store(self) -> Store:
+        store = Store(
+            path=self.tmp_path / "store.db", index_path=self.tmp_path / "index"
+        )
+        self.addCleanup(store.close)
+        return store
+
+    def get_routes(self) -> dict:
+        return {
+            ("get", "/v1/me"): lambda params: make_response(body=USER),
+            ("get", "/v1/search"): make_search_handler(),
+            ("post", "/v1/users/user/playlists"): lambda params: make_response(
+                status_code=201, body=PLAYLIST
+            ),
+            ("post", "/v1/playlists/created/tracks"): lambda params: make_response(
+                status_code=201, body={"snapshot_id": "snapshot"}
+            ),
+        }
+
+    def get_page(self, url: str, timeout: float) -> requests.Response:
+        return make_response(body=read_fixture("playlist_html.html"))
+
+    def create(self) -> Playlist:
+        return create_playlist_and_add_tracks(
+            credentials=Credentials("client-id", "client-secret", "refresh-token"),
+            source="radio-6",
+            playlist_name="Playlist",
+            private=True,
+            description="",
+            dry_run=False,
+        )
+
+
+class CreatePlaylistTest(CreatePlaylistTestCase):
+    def test_created_and_filled(self):
+        playlist = self.create()
+        self.assertEqual(playlist.id, "created")
+        self.assertEqual(len(playlist.tracks), 24)
+        self.assertEqual(
+            self.session.calls.count(("post", "/v1/users/user/playlists")), 1
+        )
+        # The run closed its store once done.
+        (run,) = self.open_store().get_runs(since_ts=0)
+        self.assertEqual(run.playlist_id, "created")
+        self.assertEqual(run.tracks_added, 24)
+
+
+class CreatePlaylistFailureTest(CreatePlaylistTestCase):
+    def get_routes(self) -> dict:
+        self.user_requested = threading.Event()
+
+        def handle_user(params: dict) -> requests.Response:
+            self.user_requested.set()
+            return make_response(status_code=403)
+
+        return {**super().get_routes(), ("get", "/v1/me"): handle_user}
+
+    def get_page(self, url: str, timeout: float) -> requests.Response:
+        # Served once the playlist has failed to be created.
+        self.user_requested.wait(timeout=10)
+        time.sleep(0.1)
+        return super().get_page(url=url, timeout=timeout)
+
+    def test_stops_early_and_records_run(self):
+        with self.assertRaises(requests.HTTPError):
+            self.create()
+        # The station was scraped, but none of its tracks searched for.
+        self.assertNotIn(("get", "/v1/search"), self.session.calls)
+
+        (run,) = self.store.get_runs(since_ts=0)
+        self.assertEqual(run.command, "create-playlist")
+        self.assertEqual(run.playlist_id, UNCREATED_PLAYLIST_ID)
+        self.assertIn("403", run.error)
+
+
+class ScrapeFailureTest(CreatePlaylistTestCase):
+    def get_page(self, url: str, timeout: float) -> requests.Response:
+        return make_response(status_code=503)
+
+    def test_playlist_not_created(self):
+        with self.assertRaises(requests.HTTPError):
+            self.create()
+        # The user's profile was fetched alongside the scrape, but no playlist was
+        # left behind.
+        self.assertIn(("get", "/v1/me"), self.session.calls)
+        self.assertNotIn(("post", "/v1/users/user/playlists"), self.session.calls)
+
+        (run,) = self.store.get_runs(since_ts=0)
+        self.assertEqual(run.playlist_id, UNCREATED_PLAYLIST_ID)
+        self.assertIn("503", run.error)
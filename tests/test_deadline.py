@@ -0,0 +1,85 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from bbc_to_spotify.deadline import (
+    DeadlineExceededError,
+    get_wait_timeout_s,
+    is_nearly_spent,
+    run_deadline,
+)
+from bbc_to_spotify.spotify.limiter import AIMDLimiter
+from bbc_to_spotify.store.locks import file_lock
+from bbc_to_spotify.store.store import Store
+
+BUDGET_S = 0.2
+
+
+class DeadlineWaitTest(unittest.TestCase):
+    # Waits are cut short by the run's deadline, once past the shortest wait allowed.
+
+    def setUp(self):
+        patcher = mock.patch("bbc_to_spotify.deadline.MIN_TIMEOUT_S", 0.1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def assertTimesOut(self, wait):
+        start = time.monotonic()
+        with run_deadline(BUDGET_S), self.assertRaises(DeadlineExceededError):
+            wait()
+        self.assertLess(time.monotonic() - start, BUDGET_S + 1)
+
+    def test_wait_timeout(self):
+        self.assertIsNone(get_wait_timeout_s())
+        with run_deadline(60):
+            self.assertGreater(get_wait_timeout_s(), 59)
+
+    def test_file_lock(self):
+        def wait():
+            with file_lock("name", locks_path=self.tmp_dir.name):
+                pass
+
+        with file_lock("name", locks_path=self.tmp_dir.name):
+            self.assertTimesOut(wait)
+        # Once released, the lock can be taken under a deadline.
+        with run_deadline(BUDGET_S), file_lock("name", locks_path=self.tmp_dir.name):
+            pass
+
+    def test_limiter(self):
+        limiter = AIMDLimiter(initial_limit=1)
+        limiter.acquire()
+        self.assertTimesOut(limiter.acquire)
+        limiter.release(latency_s=0.1)
+        with run_deadline(BUDGET_S):
+            limiter.acquire()
+        self.assertEqual(limiter.in_flight, 1)
+
+    def test_store(self):
+        store = Store(
+            path=Path(self.tmp_dir.name, "store.db"),
+            index_path=Path(self.tmp_dir.name, "index"),
+        )
+        self.addCleanup(store.close)
+        with store.lock:
+            self.assertTimesOut(lambda: store.get_page("url", max_age_s=60))
+        with run_deadline(BUDGET_S):
+            self.assertIsNone(store.get_page("url", max_age_s=60))
+        self.assertLessEqual(store.busy_timeout_s, BUDGET_S)
+
+
+class ReserveTest(unittest.TestCase):
+    def test_reserve(self):
+        self.assertFalse(is_nearly_spent())
+        with run_deadline(60):
+            self.assertFalse(is_nearly_spent())
+        with run_deadline(4):
+            self.assertFalse(is_nearly_spent())
+        # A short budget is not all reserve, but is still spent once nearly over.
+        with run_deadline(BUDGET_S):
+            self.assertFalse(is_nearly_spent())
+            time.sleep(BUDGET_S * 0.6)
+            self.assertTrue(is_nearly_spent())
@@ -0,0 +1,70 @@
+import dataclasses
+import unittest
+
+import requests
+
+from bbc_to_spotify.playlist.utils import iter_playlist_tracks, search_for_tracks
+from bbc_to_spotify.spotify.models.internal import Track
+from tests.stubs import StubSession, make_client, make_response, read_fixture
+
+
+def handle_playlist_items(params: dict) -> requests.Response:
+    if params.get("offset") == "3":
+        return make_response(body=read_fixture("spotify_playlist_items_2.json"))
+    return make_response(body=read_fixture("spotify_playlist_items_1.json"))
+
+
+def as_dicts(tracks: list[Track]) -> list[dict]:
+    # Tracks compare equal by name and artists alone, so every field is compared.
+    return [dataclasses.asdict(track) for track in tracks]
+
+
+class FastParseConsistencyTest(unittest.TestCase):
+    # The fast path builds tracks by hand, so must keep up with the validating models.
+
+    def setUp(self):
+        session = StubSession(
+            {
+                ("get", "/v1/search"): lambda params: make_response(
+                    body=read_fixture("spotify_search.json")
+                ),
+                ("get", "/v1/playlists/playlist/tracks"): handle_playlist_items,
+            }
+        )
+        self.spotify_client = make_client(session)
+        self.addCleanup(self.spotify_client.close)
+
+    def test_search_for_tracks(self):
+        fast_tracks = self.spotify_client.search_for_tracks_fast(query="q")
+        tracks = [
+            Track.from_external(track_model)
+            for track_model in self.spotify_client.search_for_tracks(query="q")
+        ]
+        self.assertEqual(len(tracks), 3)
+        self.assertEqual(as_dicts(fast_tracks), as_dicts(tracks))
+
+    def test_iter_playlist_tracks(self):
+        fast_tracks = [
+            track
+            for tracks in self.spotify_client.iter_playlist_tracks_fast("playlist")
+            for track in tracks
+        ]
+        tracks = [
+            Track.from_external(track_with_meta_model.track)
+            for page in self.spotify_client.iter_playlist_items("playlist")
+            for track_with_meta_model in page.items
+            if track_with_meta_model.track is not None
+        ]
+        # The deleted track is skipped, and the duplicate kept.
+        self.assertEqual(len(tracks), 4)
+        self.assertEqual(as_dicts(fast_tracks), as_dicts(tracks))
+
+    def test_playlist_utils(self):
+        tracks = {}
+        for fast_parse in (False, True):
+            self.spotify_client.fast_parse = fast_parse
+            tracks[fast_parse] = (
+                as_dicts(search_for_tracks(self.spotify_client, query="q")),
+                as_dicts(iter_playlist_tracks(self.spotify_client, "playlist")),
+            )
+        self.assertEqual(tracks[True], tracks[False])
@@ -0,0 +1,212 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from bbc_to_spotify.history.history import (
+    BASELINE_RUNS,
+    MIN_BASELINE_RUNS,
+    TREND_RUNS,
+    find_slow_runs,
+    get_trend,
+    make_run_records,
+)
+from bbc_to_spotify.history.models import RunRecord, RunRecording
+from bbc_to_spotify.normalization.normalization import normalize_scraped_tracks
+from bbc_to_spotify.playlist.models import PlaylistUpdateResult, ResolveStats
+from bbc_to_spotify.playlist.utils import scrape_tracks_and_get_from_spotify
+from bbc_to_spotify.scraping.scraping import scrape_tracks_from_html
+from bbc_to_spotify.spotify.fast import track_from_json
+from bbc_to_spotify.store.store import Store
+from bbc_to_spotify.utils import get_playlist_url
+from tests.stubs import (
+    StubSession,
+    make_client,
+    make_response,
+    make_track_json,
+    read_fixture,
+)
+
+
+def make_run(
+    duration_s: float, phase_durations_s: dict[str, float] | None = None, **kwargs
+) -> RunRecord:
+    fields = dict(
+        run_id="run",
+        command="update-playlist",
+        station="radio-6",
+        playlist_id="playlist",
+        started_ts=1_700_000_000.0,
+        duration_s=duration_s,
+        phase_durations_s=phase_durations_s or {},
+        requests=10,
+        retries=0,
+        throttled=0,
+        server_errors=0,
+        tracks=20,
+        cache_hits=15,
+        tracks_added=2,
+        tracks_removed=1,
+        tracks_evicted=0,
+        tracks_deferred=0,
+    )
+    fields.update(kwargs)
+    return RunRecord(**fields)
+
+
+class TrendTest(unittest.TestCase):
+    def test_too_few_runs(self):
+        self.assertIsNone(get_trend([1.0] * TREND_RUNS))
+        self.assertIsNone(get_trend([1.0] * (TREND_RUNS + MIN_BASELINE_RUNS - 1)))
+
+    def test_trend(self):
+        before = [1.0] * BASELINE_RUNS
+        self.assertEqual(get_trend(before + [1.0] * TREND_RUNS), 0)
+        self.assertAlmostEqual(get_trend(before + [1.5] * TREND_RUNS), 0.5)
+        self.assertAlmostEqual(get_trend(before + [0.5] * TREND_RUNS), -0.5)
+        # Runs older than the baseline are left out.
+        self.assertAlmostEqual(get_trend([9.0] * 10 + before + [2.0] * TREND_RUNS), 1)
+
+    def test_zero_baseline(self):
+        self.assertIsNone(get_trend([0.0] * BASELINE_RUNS + [1.0] * TREND_RUNS))
+
+
+class SlowRunsTest(unittest.TestCase):
+    def test_too_few_runs(self):
+        runs = [make_run(1.0)] * (MIN_BASELINE_RUNS - 1) + [make_run(10.0)]
+        self.assertEqual(find_slow_runs(runs), [])
+
+    def test_slow_run(self):
+        phases = {"scrape": 0.2, "resolve": 0.5}
+        runs = [make_run(1.0, phases) for _ in range(BASELINE_RUNS)]
+        slow_run = make_run(2.0, {"scrape": 0.3, "resolve": 1.4, "evict": 0.3})
+        runs += [slow_run, make_run(1.4, phases)]
+        self.assertEqual(len(find_slow_runs(runs)), 1)
+        (found,) = find_slow_runs(runs)
+        self.assertIs(found.run, slow_run)
+        self.assertEqual(found.baseline_s, 1.0)
+        # The new phase has no baseline to compare with.
+        self.assertEqual(found.slowest_phase, "resolve")
+        self.assertAlmostEqual(found.slowest_phase_delta_s, 0.9)
+
+    def test_baseline_follows_gradual_change(self):
+        runs = [make_run(1.02**i) for i in range(BASELINE_RUNS * 5)]
+        self.assertEqual(find_slow_runs(runs), [])
+
+
+class RunRecordsTest(unittest.TestCase):
+    def test_make_run_records(self):
+        recording = RunRecording(
+            playlist_ids=["a", "b", "a"],
+            resolve_stats=ResolveStats(tracks=20, cache_hits=12),
+            phase_durations_s={"scrape": 0.5},
+        )
+        track = track_from_json(make_track_json(1))
+        recording.results = [
+            PlaylistUpdateResult(
+                playlist_id="a",
+                tracks_added=[track],
+                tracks_evicted=3,
+                phase_durations_s={"mutate": 0.2},
+            )
+        ]
+        recording.api_metrics.requests = 7
+        runs = make_run_records(
+            recording=recording,
+            run_id="run",
+            command="update-playlist",
+            station="radio-6",
+            started_ts=1.0,
+            duration_s=2.0,
+        )
+        self.assertEqual([run.playlist_id for run in runs], ["a", "b"])
+        run_a, run_b = runs
+        self.assertEqual(run_a.phase_durations_s, {"scrape": 0.5, "mutate": 0.2})
+        self.assertEqual(run_a.tracks_added, 1)
+        self.assertEqual(run_a.tracks_evicted, 3)
+        self.assertEqual(run_a.requests, 7)
+        self.assertEqual(run_a.cache_hit_rate, 0.6)
+        self.assertIsNone(run_a.error)
+        # A playlist without a result was not updated.
+        self.assertEqual(run_b.phase_durations_s, {"scrape": 0.5})
+        self.assertEqual(run_b.error, "The playlist was not updated.")
+
+    def test_run_error(self):
+        runs = make_run_records(
+            recording=RunRecording(playlist_ids=["a"]),
+            run_id="run",
+            command="update-playlist",
+            station="radio-6",
+            started_ts=1.0,
+            duration_s=2.0,
+            error=ValueError("Failed."),
+        )
+        self.assertEqual(runs[0].error, "Failed.")
+
+    def test_store_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = Store(
+                path=Path(tmp_dir, "store.db"), index_path=Path(tmp_dir, "index")
+            )
+            now = time.time()
+            runs = [
+                make_run(1.0, {"scrape": 0.5}, started_ts=now - 20),
+                make_run(2.0, station="radio-1", started_ts=now - 10, error="Failed."),
+                make_run(3.0, started_ts=now - 100),
+            ]
+            store.add_runs(runs)
+            self.assertEqual(store.get_runs(since_ts=now - 50), runs[:2])
+            self.assertEqual(
+                store.get_runs(since_ts=0, station="radio-6"), [runs[2], runs[0]]
+            )
+            store.close()
+
+
+class ResolveStatsTest(unittest.TestCase):
+    def test_cache_hits(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        lock_patcher = mock.patch("bbc_to_spotify.store.locks.LOCKS_PATH", tmp_dir.name)
+        lock_patcher.start()
+        self.addCleanup(lock_patcher.stop)
+        store = Store(
+            path=Path(tmp_dir.name, "store.db"),
+            index_path=Path(tmp_dir.name, "index"),
+        )
+        self.addCleanup(store.close)
+
+        # The page is served from the store, as if fetched by a recent run.
+        content = read_fixture("playlist_html.html")
+        store.set_page(url=get_playlist_url("radio-6"), content=content)
+        scraped_tracks = scrape_tracks_from_html(content)
+        keys = [track.key for track in normalize_scraped_tracks(scraped_tracks)]
+        # One known miss, one resolution in the store, and one from the previous
+        # scrape. The rest are searched for, and not found.
+        missed_track = scraped_tracks[0]
+        store.record_miss(
+            key=keys[0], text=f"{missed_track.artist} - {missed_track.name}"
+        )
+        store.set_resolved_track(key=keys[1], track=track_from_json(make_track_json(1)))
+        store.set_scraped_tracks(
+            station="radio-6",
+            resolutions={keys[2]: track_from_json(make_track_json(2))},
+        )
+
+        empty_search = {"tracks": {"items": [], "limit": 20, "offset": 0, "total": 0}}
+        spotify_client = make_client(
+            StubSession(
+                {("get", "/v1/search"): lambda params: make_response(body=empty_search)}
+            )
+        )
+        self.addCleanup(spotify_client.close)
+        resolve_stats = ResolveStats()
+        tracks = scrape_tracks_and_get_from_spotify(
+            spotify_client=spotify_client,
+            station="radio-6",
+            store=store,
+            resolve_stats=resolve_stats,
+        )
+        self.assertEqual(len(tracks), 2)
+        self.assertEqual(resolve_stats.tracks, len(set(keys)))
+        self.assertEqual(resolve_stats.cache_hits, 2)
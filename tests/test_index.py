@@ -0,0 +1,124 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from bbc_to_spotify.spotify.fast import track_from_json
+from bbc_to_spotify.store.cache import import_cache
+from bbc_to_spotify.store.index import (
+    HEADER,
+    MAGIC,
+    OFFSET,
+    IndexFormatError,
+    ResolutionIndex,
+    write_index,
+)
+from bbc_to_spotify.store.store import TRACK_ADAPTER, Store
+from tests.stubs import make_track_json
+
+ITEMS = {
+    "b": b"2",
+    "a": b"1",
+    "café": b"4",
+    "c": b"",
+    "d" * 100: b"5" * 1000,
+}
+
+
+class ResolutionIndexTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = Path(tmp_dir.name)
+        self.path = self.tmp_path / "index.bin"
+
+    def open_index(self, path: Path | None = None) -> ResolutionIndex:
+        index = ResolutionIndex(path or self.path)
+        self.addCleanup(index.close)
+        return index
+
+    def test_round_trip(self):
+        write_index(self.path, ITEMS.items())
+        index = self.open_index()
+        self.assertEqual(len(index), len(ITEMS))
+        for key, value in ITEMS.items():
+            self.assertEqual(index.get(key), value)
+        self.assertEqual(dict(index.items()), ITEMS)
+        self.assertEqual(list(dict(index.items())), sorted(ITEMS, key=str.encode))
+
+    def test_missing_key(self):
+        write_index(self.path, ITEMS.items())
+        index = self.open_index()
+        for key in ("", "0", "aa", "caf", "z"):
+            self.assertIsNone(index.get(key))
+
+    def test_empty(self):
+        write_index(self.path, [])
+        index = self.open_index()
+        self.assertEqual(len(index), 0)
+        self.assertIsNone(index.get("a"))
+
+    def test_truncated(self):
+        write_index(self.path, ITEMS.items())
+        content = self.path.read_bytes()
+        path = self.tmp_path / "truncated.bin"
+        # Within the header or the offsets, the file is rejected when opened.
+        for length in (0, 4, HEADER.size + 3):
+            with self.subTest(length=length):
+                path.write_bytes(content[:length])
+                with self.assertRaises(IndexFormatError):
+                    ResolutionIndex(path)
+        # Within the records, only once the records cut short are read.
+        for length in (len(content) - 500, len(content) - 1):
+            with self.subTest(length=length):
+                # Each has its own file, as the mapped files must not change.
+                path = self.tmp_path / f"truncated-{length}.bin"
+                path.write_bytes(content[:length])
+                index = self.open_index(path)
+                with self.assertRaises(IndexFormatError):
+                    dict(index.items())
+
+    def test_garbage(self):
+        path = self.tmp_path / "garbage.bin"
+        path.write_bytes(b"not an index file at all")
+        with self.assertRaises(IndexFormatError):
+            ResolutionIndex(path)
+
+        # A valid header claiming far more records than the file holds.
+        path.write_bytes(HEADER.pack(MAGIC, 2**32 - 1, 0) + b"\xff" * 64)
+        with self.assertRaises(IndexFormatError):
+            ResolutionIndex(path)
+
+        # Offsets pointing into the header, and past the end of the file.
+        for offset in (0, 2**40):
+            with self.subTest(offset=offset):
+                path = self.tmp_path / f"offset-{offset}.bin"
+                path.write_bytes(HEADER.pack(MAGIC, 1, 0) + OFFSET.pack(offset))
+                index = self.open_index(path)
+                with self.assertRaises(IndexFormatError):
+                    index.get("a")
+
+    def test_import_rejects_truncated(self):
+        write_index(
+            self.path,
+            (
+                (
+                    f"key {i}",
+                    TRACK_ADAPTER.dump_json(track_from_json(make_track_json(i))),
+                )
+                for i in range(3)
+            ),
+        )
+        path = self.tmp_path / "truncated.bin"
+        path.write_bytes(self.path.read_bytes()[:-1])
+        index_path = self.tmp_path / "installed.bin"
+        with self.assertRaises(IndexFormatError):
+            import_cache(path, index_path=index_path)
+        self.assertFalse(index_path.exists())
+
+    def test_store_ignores_damaged_record(self):
+        write_index(self.path, [("key", b"x" * 100)])
+        self.path.write_bytes(self.path.read_bytes()[:-50])
+        store = Store(path=self.tmp_path / "store.db", index_path=self.path)
+        self.addCleanup(store.close)
+        with self.assertLogs("bbc_to_spotify.store.store", level="WARNING"):
+            self.assertIsNone(store.get_resolved_track("key"))
@@ -0,0 +1,200 @@
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import tracemalloc
+import unittest
+from collections import Counter
+from unittest import mock
+
+from bs4.element import Tag
+
+from bbc_to_spotify.logging import (
+    LogQueueHandler,
+    log_duration,
+    setup_logging,
+    stop_logging,
+)
+from bbc_to_spotify.playlist.update import add_tracks_and_prune_playlist
+from bbc_to_spotify.playlist.utils import resolve_scraped_track
+from bbc_to_spotify.scraping.models import ScrapedTrack
+from bbc_to_spotify.scraping.scraping import scrape_tracks_from_html
+from bbc_to_spotify.spotify.models.internal import Album, Artist, Track
+from tests.stubs import StubSession, make_client, make_response, make_track_json
+
+
+class CountingScrapedTrack(ScrapedTrack):
+    formatted = 0
+
+    def __repr__(self) -> str:
+        type(self).formatted += 1
+        return super().__repr__()
+
+    __str__ = __repr__
+
+
+class CountingStr(str):
+    formatted = 0
+
+    def __repr__(self) -> str:
+        type(self).formatted += 1
+        return super().__repr__()
+
+    __str__ = __repr__
+
+
+def make_counting_track(i: int) -> Track:
+    artist = Artist(name=f"Artist {i}", uri=f"spotify:artist:a{i}", id=f"a{i}")
+    album = Album(name="Album", artists=[artist], uri="spotify:album:b", id="b")
+    track = Track(
+        album=album,
+        artists=[artist],
+        name=CountingStr(f"Song {i}"),
+        uri=f"spotify:track:t{i}",
+        id=f"t{i}",
+        popularity=0,
+    )
+    return track
+
+
+PAGE = (
+    b"<html><body><div class='component component--box"
+    b" component--box-flushbody-vertical component--box--primary'>"
+    b"<h2>A LIST</h2><p>Artist 1 - Song 1<br/>Artist 2 - Song 2</p></div>"
+    b"</body></html>"
+)
+
+
+class LazyLogFormattingTest(unittest.TestCase):
+    # Log arguments on the hot paths must only be formatted when their record is
+    # emitted, so nothing is rendered for the debug and info logs at WARNING.
+
+    def setUp(self):
+        CountingScrapedTrack.formatted = 0
+        CountingStr.formatted = 0
+
+        root_logger = logging.getLogger()
+        handler = logging.StreamHandler(io.StringIO())
+        root_logger.addHandler(handler)
+        self.addCleanup(root_logger.removeHandler, handler)
+        self.addCleanup(root_logger.setLevel, root_logger.level)
+
+        session = StubSession(
+            {
+                ("get", "/v1/search"): lambda params: make_response(
+                    body={"tracks": {"items": [make_track_json(1)]}}
+                ),
+                ("post", "/v1/playlists/playlist/tracks"): lambda params: (
+                    make_response(body={"snapshot_id": "s"})
+                ),
+                ("delete", "/v1/playlists/playlist/tracks"): lambda params: (
+                    make_response(body={"snapshot_id": "s"})
+                ),
+            }
+        )
+        self.spotify_client = make_client(session)
+        self.addCleanup(self.spotify_client.close)
+
+    def run_hot_paths(self) -> int:
+        with mock.patch.object(
+            Tag, "decode", autospec=True, side_effect=Tag.decode
+        ) as decode:
+            scrape_tracks_from_html(PAGE)
+        track = resolve_scraped_track(
+            spotify_client=self.spotify_client,
+            scraped_track=CountingScrapedTrack(name="Song 1", artist="Artist 1"),
+            key="artist 1|song 1",
+        )
+        self.assertIsNotNone(track)
+        add_tracks_and_prune_playlist(
+            spotify_client=self.spotify_client,
+            playlist_id="playlist",
+            dest_track_counts=Counter([make_counting_track(1)]),
+            source_tracks=[make_counting_track(i) for i in range(2, 5)],
+            prune_dest=True,
+            prepend=False,
+            dry_run=False,
+        )
+        return (
+            decode.call_count + CountingScrapedTrack.formatted + CountingStr.formatted
+        )
+
+    def test_nothing_formatted_at_warning(self):
+        logging.getLogger().setLevel(logging.WARNING)
+        self.assertEqual(self.run_hot_paths(), 0)
+
+    def test_formatted_at_debug(self):
+        # Checks that the objects above would notice being formatted.
+        logging.getLogger().setLevel(logging.DEBUG)
+        self.assertGreater(self.run_hot_paths(), 0)
+
+
+class SetupLoggingTest(unittest.TestCase):
+    def setUp(self):
+        root_logger = logging.getLogger()
+        self.addCleanup(root_logger.setLevel, root_logger.level)
+        self.addCleanup(setattr, sys, "excepthook", sys.excepthook)
+        self.addCleanup(stop_logging)
+        self.log_path = os.path.join(tempfile.mkdtemp(), "log.jsonl")
+
+    def test_json_exc_info(self):
+        setup_logging(level=logging.INFO, filename=self.log_path, json_format=True)
+        try:
+            raise ValueError("Bad value.")
+        except ValueError:
+            logging.getLogger("test").exception("Failed to %s.", "run")
+        stop_logging()
+
+        with open(self.log_path) as file:
+            entry = json.loads(file.readline())
+        self.assertEqual(entry["message"], "Failed to run.")
+        self.assertIn("Traceback", entry["exc_info"])
+        self.assertIn("ValueError: Bad value.", entry["exc_info"])
+
+    def test_setup_twice(self):
+        setup_logging(level=logging.INFO, filename=self.log_path)
+        setup_logging(level=logging.INFO, filename=self.log_path)
+        logging.getLogger("test").info("Logged once.")
+        queue_handlers = [
+            handler
+            for handler in logging.getLogger().handlers
+            if isinstance(handler, LogQueueHandler)
+        ]
+        self.assertEqual(len(queue_handlers), 1)
+        stop_logging()
+
+        with open(self.log_path) as file:
+            self.assertEqual(file.read().count("Logged once."), 1)
+
+
+class PhasePeakMemoryTest(unittest.TestCase):
+    def test_overlapping_phases_share_peak(self):
+        logger = logging.getLogger("test")
+
+        def run_other_phase():
+            with log_duration(logger, "other"):
+                pass
+
+        tracemalloc.start()
+        try:
+            with self.assertLogs(logger, level="INFO") as logs:
+                with log_duration(logger, "outer"):
+                    buffer = bytearray(8 * 2**20)
+                    del buffer
+                    # Starting while the outer phase runs, the other phase must not
+                    # reset the peak that the outer phase reports.
+                    thread = threading.Thread(target=run_other_phase)
+                    thread.start()
+                    thread.join()
+                with log_duration(logger, "after"):
+                    pass
+        finally:
+            tracemalloc.stop()
+        peaks_mib = {record.phase: record.peak_memory_mib for record in logs.records}
+        self.assertGreaterEqual(peaks_mib["outer"], 8)
+        self.assertGreaterEqual(peaks_mib["other"], 8)
+        # Once no phase is running, the next one starts from a fresh peak.
+        self.assertLess(peaks_mib["after"], 8)
@@ -0,0 +1,101 @@
+import json
+import tempfile
+import tracemalloc
+import unittest
+from unittest import mock
+
+import requests
+
+from bbc_to_spotify.playlist.update import update_playlist_tracks
+from bbc_to_spotify.spotify.fast import track_from_json
+from tests.stubs import StubSession, make_client, make_response, make_track_json
+
+NUM_TRACKS = 20_000
+PAGE_SIZE = 100
+PAGE_URL = "https://api.spotify.com/v1/playlists/playlist/tracks"
+
+# The peak memory allocated while updating a playlist of NUM_TRACKS tracks, half of
+# which are replaced. It was about 30MiB on CPython 3.11 when this was written, most of
+# it the destination's tracks, which are counted to diff against. Holding every page of
+# the destination's models at once, rather than one at a time, takes it to about 84MiB.
+PEAK_MEMORY_CEILING_MIB = 36
+
+
+def make_playlist_pages(num_tracks: int) -> dict[int, bytes]:
+    pages = {}
+    for offset in range(0, num_tracks, PAGE_SIZE):
+        next_offset = offset + PAGE_SIZE
+        page = {
+            "items": [
+                {"added_at": "2024-05-01T10:00:00Z", "track": make_track_json(i)}
+                for i in range(offset, min(next_offset, num_tracks))
+            ],
+            "next": (
+                f"{PAGE_URL}?offset={next_offset}&limit={PAGE_SIZE}"
+                if next_offset < num_tracks
+                else None
+            ),
+        }
+        pages[offset] = json.dumps(page).encode()
+    return pages
+
+
+class PlaylistUpdateMemoryTest(unittest.TestCase):
+    def setUp(self):
+        # The stand-in server's responses are made up front, so that only the update's
+        # own allocations are traced.
+        pages = make_playlist_pages(NUM_TRACKS)
+
+        def handle_playlist_items(params: dict) -> requests.Response:
+            return make_response(body=pages[int(params.get("offset", 0))])
+
+        def handle_mutation(params: dict) -> requests.Response:
+            return make_response(body={"snapshot_id": "snapshot"})
+
+        self.session = StubSession(
+            {
+                ("get", "/v1/playlists/playlist/tracks"): handle_playlist_items,
+                ("post", "/v1/playlists/playlist/tracks"): handle_mutation,
+                ("delete", "/v1/playlists/playlist/tracks"): handle_mutation,
+            }
+        )
+        lock_patcher = mock.patch(
+            "bbc_to_spotify.store.locks.LOCKS_PATH", tempfile.mkdtemp()
+        )
+        lock_patcher.start()
+        self.addCleanup(lock_patcher.stop)
+
+    def test_peak_memory(self):
+        spotify_client = make_client(self.session)
+        self.addCleanup(spotify_client.close)
+        source_tracks = [
+            track_from_json(make_track_json(i))
+            for i in range(NUM_TRACKS // 2, NUM_TRACKS // 2 + NUM_TRACKS)
+        ]
+
+        # The phases run one after the other, so each logs its own peak.
+        tracemalloc.start()
+        try:
+            with self.assertLogs("bbc_to_spotify", level="INFO") as logs:
+                result = update_playlist_tracks(
+                    spotify_client=spotify_client,
+                    playlist_id="playlist",
+                    source_tracks=iter(source_tracks),
+                    remove_duplicates=False,
+                    prune_dest=True,
+                    prepend=False,
+                    update_description=False,
+                    dry_run=False,
+                )
+        finally:
+            tracemalloc.stop()
+        phase_peaks_mib = {
+            record.phase: record.peak_memory_mib
+            for record in logs.records
+            if hasattr(record, "peak_memory_mib")
+        }
+
+        self.assertEqual(len(result.tracks_added), NUM_TRACKS // 2)
+        self.assertEqual(len(result.tracks_removed), NUM_TRACKS // 2)
+        self.assertEqual(set(phase_peaks_mib), {"fetch destination", "mutate"})
+        self.assertLess(max(phase_peaks_mib.values()), PEAK_MEMORY_CEILING_MIB)
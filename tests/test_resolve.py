@@ -0,0 +1,305 @@
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from bbc_to_spotify.playlist.models import ResolveStats
+from bbc_to_spotify.playlist.utils import (
+    diff_scraped_tracks,
+    revalidate_resolved_tracks,
+    scrape_tracks_and_get_from_spotify,
+)
+from bbc_to_spotify.spotify.fast import track_from_json
+from bbc_to_spotify.store.index import write_index
+from bbc_to_spotify.store.store import TRACK_ADAPTER, Store
+from bbc_to_spotify.utils import get_playlist_url
+from tests.stubs import (
+    StubSession,
+    make_client,
+    make_response,
+    make_search_handler,
+    make_track_json,
+    read_fixture,
+)
+
+PAGE = read_fixture("playlist_html.html")
+# The same playlist, with its last track swapped for a new one.
+CHANGED_PAGE = PAGE.replace(b"Delia Rowe - Porchlight", b"Wren Hollis - Lanterns")
+
+
+# Holds a station's lock in another process until told to let go.
+HOLD_LOCK_SCRIPT = """
+import sys
+from bbc_to_spotify.store.locks import file_lock
+with file_lock("station-radio-6", locks_path=sys.argv[1]):
+    print("locked", flush=True)
+    sys.stdin.readline()
+"""
+
+
+def fail_to_get_page(url: str, timeout: float):
+    raise AssertionError("The page should have been served from the store.")
+
+
+class ResolveTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = Path(tmp_dir.name)
+        for patcher in (
+            mock.patch("bbc_to_spotify.store.locks.LOCKS_PATH", tmp_dir.name),
+            mock.patch(
+                "bbc_to_spotify.scraping.scraping.requests.get", fail_to_get_page
+            ),
+            # Strategies that check the artist would not match the stub's tracks.
+            mock.patch("bbc_to_spotify.playlist.strategies.EXPLORATION_RATE", 0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.store = self.open_store()
+        self.session = StubSession({("get", "/v1/search"): make_search_handler()})
+        self.spotify_client = self.make_client()
+
+    def make_client(self):
+        spotify_client = make_client(self.session)
+        self.addCleanup(spotify_client.close)
+        return spotify_client
+
+    def open_store(self) -> Store:
+        store = Store(
+            path=self.tmp_path / "store.db", index_path=self.tmp_path / "index"
+        )
+        self.addCleanup(store.close)
+        return store
+
+    def get_num_searches(self) -> int:
+        return self.session.calls.count(("get", "/v1/search"))
+
+    def resolve(self, content: bytes, **kwargs) -> list:
+        self.store.set_page(url=get_playlist_url("radio-6"), content=content)
+        return scrape_tracks_and_get_from_spotify(
+            spotify_client=self.spotify_client,
+            station="radio-6",
+            store=self.store,
+            **kwargs,
+        )
+
+
+class DiffScrapedTracksTest(unittest.TestCase):
+    def test_diff(self):
+        diff = diff_scraped_tracks(
+            previous_keys=["a", "b", "c"], current_keys=["b", "c", "d", "d"]
+        )
+        self.assertEqual(diff.added, {"d"})
+        self.assertEqual(diff.removed, {"a"})
+        self.assertEqual(diff.unchanged, {"b", "c"})
+
+
+class PreviousScrapeTest(ResolveTestCase):
+    def test_only_new_tracks_resolved(self):
+        tracks = self.resolve(PAGE)
+        num_tracks = len(tracks)
+        self.assertEqual(self.get_num_searches(), num_tracks)
+
+        # Unchanged entries reuse the previous scrape's resolutions, without looking
+        # them up or searching for them.
+        resolve_stats = ResolveStats()
+        with mock.patch.object(
+            self.store, "get_resolved_track", wraps=self.store.get_resolved_track
+        ) as get_resolved_track:
+            changed_tracks = self.resolve(CHANGED_PAGE, resolve_stats=resolve_stats)
+        self.assertEqual(get_resolved_track.call_count, 1)
+        self.assertEqual(self.get_num_searches(), num_tracks + 1)
+        self.assertEqual(changed_tracks[:-1], tracks[:-1])
+        self.assertNotEqual(changed_tracks[-1], tracks[-1])
+        self.assertEqual(resolve_stats.cache_hits, num_tracks - 1)
+
+        # The removed entry is forgotten, and resolved from the store if it returns.
+        resolved = []
+        self.assertEqual(self.resolve(PAGE, on_resolved=resolved.append), tracks)
+        self.assertEqual(self.get_num_searches(), num_tracks + 1)
+        self.assertEqual(resolved, tracks)
+
+    def test_kept_by_station(self):
+        self.resolve(PAGE)
+        self.assertEqual(
+            len(self.store.get_scraped_tracks(station="radio-6")),
+            len(self.resolve(PAGE)),
+        )
+        self.assertEqual(self.store.get_scraped_tracks(station="radio-1"), {})
+
+
+class ResolvedOrderTest(ResolveTestCase):
+    def test_released_in_scrape_order(self):
+        handle_search = make_search_handler()
+        num_searches = 0
+        lock = threading.Lock()
+
+        # The first search to arrive finishes last.
+        def search(params: dict):
+            nonlocal num_searches
+            with lock:
+                num_searches += 1
+                is_first = num_searches == 1
+            if is_first:
+                time.sleep(0.3)
+            return handle_search(params)
+
+        self.session.routes[("get", "/v1/search")] = search
+        resolved = []
+        tracks = self.resolve(PAGE, on_resolved=resolved.append)
+        self.assertEqual(resolved, tracks)
+
+
+class ConcurrentRunsTest(ResolveTestCase):
+    def test_waits_for_other_process(self):
+        process = subprocess.Popen(
+            [sys.executable, "-c", HOLD_LOCK_SCRIPT, str(self.tmp_path)],
+            cwd=Path(__file__).parent.parent,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        self.addCleanup(process.wait, timeout=10)
+        self.addCleanup(process.stdin.close)
+        self.addCleanup(process.stdout.close)
+        self.assertEqual(process.stdout.readline().strip(), "locked")
+
+        tracks = []
+        thread = threading.Thread(target=lambda: tracks.extend(self.resolve(PAGE)))
+        thread.start()
+        time.sleep(0.5)
+        # Nothing is searched for until the other process lets go of the station.
+        self.assertTrue(thread.is_alive())
+        self.assertEqual(self.get_num_searches(), 0)
+        process.stdin.write("\n")
+        process.stdin.flush()
+        thread.join(timeout=10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(tracks), self.get_num_searches())
+
+    def test_page_and_resolutions_shared(self):
+        page_requests = []
+
+        def get_page(url: str, timeout: float):
+            page_requests.append(url)
+            return make_response(body=PAGE)
+
+        with mock.patch("bbc_to_spotify.scraping.scraping.requests.get", get_page):
+            tracks = scrape_tracks_and_get_from_spotify(
+                spotify_client=self.spotify_client,
+                station="radio-6",
+                store=self.store,
+            )
+            num_searches = self.get_num_searches()
+
+            # Another process, with its own connection to the store and its own client.
+            other_tracks = scrape_tracks_and_get_from_spotify(
+                spotify_client=self.make_client(),
+                station="radio-6",
+                store=self.open_store(),
+            )
+        self.assertEqual(other_tracks, tracks)
+        self.assertEqual(page_requests, [get_playlist_url("radio-6")])
+        self.assertEqual(self.get_num_searches(), num_searches)
+
+
+class RevalidateTest(ResolveTestCase):
+    def test_unavailable_tracks_evicted(self):
+        week_s = 7 * 24 * 60 * 60
+        tracks = [track_from_json(make_track_json(i)) for i in range(4)]
+        with mock.patch(
+            "bbc_to_spotify.store.store.time.time", return_value=time.time() - week_s
+        ):
+            for i, track in enumerate(tracks[:3]):
+                self.store.set_resolved_track(key=f"key {i}", track=track)
+        self.store.set_resolved_track(key="key 3", track=tracks[3])
+        self.store.set_scraped_tracks(
+            station="radio-6", resolutions={"key 1": tracks[1], "key 3": tracks[3]}
+        )
+
+        requested_ids = []
+
+        def get_tracks(params: dict):
+            requested_ids.extend(params["ids"].split(","))
+            self.assertEqual(params["market"], "from_token")
+            renamed = {**make_track_json(0), "name": "Renamed", "is_playable": True}
+            unplayable = {**make_track_json(2), "is_playable": False}
+            return make_response(body={"tracks": [renamed, None, unplayable]})
+
+        self.session.routes[("get", "/v1/tracks")] = get_tracks
+        revalidate_resolved_tracks(
+            spotify_client=self.spotify_client, store=self.store, max_age_s=week_s / 2
+        )
+
+        # Only the stale resolutions are checked, in one request.
+        self.assertEqual(requested_ids, ["t0", "t1", "t2"])
+        self.assertEqual(self.store.get_resolved_track(key="key 0").name, "Renamed")
+        # Tracks that are gone or no longer playable are searched for again.
+        self.assertIsNone(self.store.get_resolved_track(key="key 1"))
+        self.assertIsNone(self.store.get_resolved_track(key="key 2"))
+        self.assertEqual(
+            self.store.get_scraped_tracks(station="radio-6"),
+            {"key 1": None, "key 3": tracks[3]},
+        )
+        self.assertEqual(
+            self.store.get_stale_resolved_tracks(max_age_s=week_s / 2, limit=10), {}
+        )
+
+    def test_budget(self):
+        old_ts = time.time() - 30 * 24 * 60 * 60
+        for i in range(5):
+            with mock.patch(
+                "bbc_to_spotify.store.store.time.time", return_value=old_ts + i
+            ):
+                self.store.set_resolved_track(
+                    key=f"key {i}", track=track_from_json(make_track_json(i))
+                )
+        self.session.routes[("get", "/v1/tracks")] = lambda params: make_response(
+            body={
+                "tracks": [
+                    make_track_json(int(track_id[1:]))
+                    for track_id in params["ids"].split(",")
+                ]
+            }
+        )
+        revalidate_resolved_tracks(
+            spotify_client=self.spotify_client, store=self.store, budget=2
+        )
+        # The oldest are revalidated first.
+        self.assertEqual(
+            list(self.store.get_stale_resolved_tracks(max_age_s=60, limit=10)),
+            ["key 2", "key 3", "key 4"],
+        )
+
+    def test_index_hits_revalidated(self):
+        tracks = [track_from_json(make_track_json(i)) for i in range(2)]
+        write_index(
+            self.tmp_path / "index",
+            [
+                (f"key {i}", TRACK_ADAPTER.dump_json(track))
+                for i, track in enumerate(tracks)
+            ],
+        )
+        store = self.open_store()
+        self.session.routes[("get", "/v1/tracks")] = lambda params: make_response(
+            body={"tracks": [None]}
+        )
+
+        # Only resolutions that were used are copied into the store to be revalidated.
+        self.assertEqual(store.get_resolved_track(key="key 0"), tracks[0])
+        self.assertEqual(
+            store.get_stale_resolved_tracks(max_age_s=60, limit=10),
+            {"key 0": tracks[0]},
+        )
+        revalidate_resolved_tracks(spotify_client=self.spotify_client, store=store)
+
+        # Once found to be unavailable, the index's resolution is no longer used or
+        # exported.
+        self.assertIsNone(store.get_resolved_track(key="key 0"))
+        self.assertEqual(list(store.get_serialized_resolved_tracks()), ["key 1"])
+        self.assertEqual(store.get_resolved_track(key="key 1"), tracks[1])
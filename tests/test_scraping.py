@@ -0,0 +1,168 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import requests
+
+from bbc_to_spotify.scraping.models import ScrapedTrack
+from bbc_to_spotify.scraping.scraping import (
+    PAGE_MAX_AGE_S,
+    NoTracksScrapedError,
+    scrape_tracks_from_html,
+    scrape_tracks_from_page,
+    scrape_tracks_from_playlist_page,
+)
+from bbc_to_spotify.scraping.structured import scrape_tracks_from_structured_data
+from bbc_to_spotify.store.store import Store
+from tests.stubs import FIXTURES_PATH, make_response, read_fixture
+
+URL = "https://www.bbc.co.uk/playlist"
+
+
+def fail_source(content: bytes) -> list[ScrapedTrack] | None:
+    raise AssertionError("Source should not have been tried.")
+
+
+class ScrapeHtmlTest(unittest.TestCase):
+    def test_list_sections(self):
+        tracks = scrape_tracks_from_html(read_fixture("playlist_html.html"))
+        self.assertEqual(len(tracks), 24)
+        self.assertEqual(
+            tracks[0], ScrapedTrack(name="Paper Harbour", artist="The Lumen Drifters")
+        )
+        # Only the primary artist is kept.
+        self.assertEqual(
+            tracks[1], ScrapedTrack(name="Slow Arithmetic", artist="Maya Okafor")
+        )
+        self.assertEqual(tracks[2], ScrapedTrack(name="Westbound", artist="Kestrel"))
+        self.assertEqual(
+            tracks[-1], ScrapedTrack(name="Porchlight", artist="Delia Rowe")
+        )
+
+    def test_no_list_sections(self):
+        self.assertIsNone(scrape_tracks_from_html(read_fixture("no_playlist.html")))
+        self.assertIsNone(
+            scrape_tracks_from_html(read_fixture("playlist_segments.html"))
+        )
+
+
+class ScrapeStructuredDataTest(unittest.TestCase):
+    def test_music_segments(self):
+        # Speech segments and the programme's own titles are skipped.
+        tracks = scrape_tracks_from_structured_data(
+            read_fixture("playlist_segments.html")
+        )
+        html_tracks = scrape_tracks_from_html(read_fixture("playlist_html.html"))
+        self.assertEqual(tracks, html_tracks)
+
+    def test_music_recordings(self):
+        # The unparseable JSON script is skipped.
+        tracks = scrape_tracks_from_structured_data(
+            read_fixture("playlist_ld_json.html")
+        )
+        html_tracks = scrape_tracks_from_html(read_fixture("playlist_html.html"))
+        self.assertEqual(tracks, html_tracks)
+
+    def test_no_structured_data(self):
+        self.assertIsNone(
+            scrape_tracks_from_structured_data(read_fixture("playlist_html.html"))
+        )
+
+
+class ScrapePageTest(unittest.TestCase):
+    def test_structured_data_preferred(self):
+        tracks = scrape_tracks_from_page(
+            read_fixture("playlist_segments.html"),
+            sources=[scrape_tracks_from_structured_data, fail_source],
+        )
+        self.assertEqual(len(tracks), 24)
+
+    def test_html_fallback(self):
+        tracks = scrape_tracks_from_page(read_fixture("playlist_html.html"))
+        self.assertEqual(len(tracks), 24)
+
+    def test_short_structured_data(self):
+        # The page's only structured entry is the track now playing, which must not
+        # replace the playlist in its HTML.
+        tracks = scrape_tracks_from_page(read_fixture("playlist_now_playing.html"))
+        self.assertEqual(
+            tracks, scrape_tracks_from_html(read_fixture("playlist_html.html"))
+        )
+
+    def test_short_playlist(self):
+        # A smaller station's playlist, with fewer tracks than most but no HTML list
+        # to prefer to it.
+        tracks = scrape_tracks_from_page(read_fixture("playlist_short_ld_json.html"))
+        self.assertEqual(len(tracks), 8)
+        self.assertEqual(
+            tracks[1], ScrapedTrack(name="Raat Baaki", artist="Amar Sangha")
+        )
+        self.assertEqual(
+            tracks[-1], ScrapedTrack(name="Slow Rain", artist="Noor Hussain")
+        )
+
+    def test_station_pages(self):
+        # The saved pages that the benchmarks scrape, one per station.
+        for path in sorted((FIXTURES_PATH / "stations").glob("*.html")):
+            with self.subTest(station=path.stem):
+                tracks = scrape_tracks_from_page(path.read_bytes())
+                self.assertGreater(len(tracks), 0)
+                self.assertTrue(all(track.artist and track.name for track in tracks))
+
+    def test_no_playlist(self):
+        self.assertEqual(scrape_tracks_from_page(read_fixture("no_playlist.html")), [])
+
+
+class ScrapePlaylistPageTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.store = Store(
+            path=Path(tmp_dir.name, "store.db"),
+            index_path=Path(tmp_dir.name, "index"),
+        )
+        self.addCleanup(self.store.close)
+        self.responses: list[requests.Response] = []
+        patcher = mock.patch(
+            "bbc_to_spotify.scraping.scraping.requests.get",
+            lambda url, timeout: self.responses.pop(0),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def scrape(self) -> list[ScrapedTrack]:
+        return scrape_tracks_from_playlist_page(playlist_url=URL, store=self.store)
+
+    def test_page_shared(self):
+        self.responses = [make_response(body=read_fixture("playlist_html.html"))]
+        tracks = self.scrape()
+        self.assertEqual(len(tracks), 24)
+        # Served from the store, without fetching the page again.
+        self.assertEqual(self.scrape(), tracks)
+
+        self.responses = [make_response(body=read_fixture("playlist_segments.html"))]
+        with mock.patch(
+            "bbc_to_spotify.store.store.time.time",
+            return_value=time.time() + PAGE_MAX_AGE_S,
+        ):
+            self.assertEqual(self.scrape(), tracks)
+        self.assertEqual(self.responses, [])
+
+    def test_error_page_not_shared(self):
+        self.responses = [
+            make_response(status_code=503, body=b"<html>Unavailable</html>"),
+            make_response(body=read_fixture("playlist_html.html")),
+        ]
+        with self.assertRaises(requests.HTTPError):
+            self.scrape()
+        self.assertIsNone(self.store.get_page(url=URL, max_age_s=PAGE_MAX_AGE_S))
+        self.assertEqual(len(self.scrape()), 24)
+
+    def test_page_without_tracks(self):
+        # Taken as broken, rather than as an empty playlist.
+        self.responses = [make_response(body=read_fixture("no_playlist.html"))]
+        with self.assertRaises(NoTracksScrapedError):
+            self.scrape()
+        self.assertIsNone(self.store.get_page(url=URL, max_age_s=PAGE_MAX_AGE_S))
@@ -0,0 +1,167 @@
+import http.client
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import requests
+
+from bbc_to_spotify.playlist.models import PlaylistUpdateResult
+from bbc_to_spotify.serve.serve import InsecureHostError, SyncServer, SyncService, serve
+from bbc_to_spotify.store.store import Store
+from tests.stubs import StubSession, make_client
+
+TOKEN = "token"
+
+
+def update_playlists(playlist_ids: list[str], **kwargs) -> list[PlaylistUpdateResult]:
+    return [
+        PlaylistUpdateResult(playlist_id=playlist_id) for playlist_id in playlist_ids
+    ]
+
+
+class SyncServerTest(unittest.TestCase):
+    token: str | None = None
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        for patcher in (
+            mock.patch(
+                "bbc_to_spotify.serve.serve.TENANT_CREDENTIALS_PATH", Path(tmp_dir.name)
+            ),
+            mock.patch("bbc_to_spotify.serve.serve.update_playlists", update_playlists),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        store = Store(
+            path=Path(tmp_dir.name, "store.db"), index_path=Path(tmp_dir.name, "index")
+        )
+        self.service = SyncService(workers=1, store=store)
+        spotify_client = make_client(StubSession({}))
+        self.service.clients["default"] = spotify_client
+
+        self.server = SyncServer(
+            address=("127.0.0.1", 0), service=self.service, token=self.token
+        )
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        self.addCleanup(self.service.close)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        return requests.request(method, self.url + path, timeout=10, **kwargs)
+
+    def wait_for_job(self, job_id: str, **kwargs) -> dict:
+        give_up_at = time.monotonic() + 10
+        while True:
+            job = self.request("get", f"/jobs/{job_id}", **kwargs).json()
+            if (
+                job["status"] in ("succeeded", "failed")
+                or time.monotonic() > give_up_at
+            ):
+                return job
+            time.sleep(0.01)
+
+
+class SyncApiTest(SyncServerTest):
+    def test_submit_and_status(self):
+        response = self.request(
+            "post", "/jobs", json={"station": "radio-6", "playlist_ids": ["a", "b"]}
+        )
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["id"]
+
+        job = self.wait_for_job(job_id)
+        self.assertEqual(job["status"], "succeeded")
+        self.assertEqual(
+            [result["playlist_id"] for result in job["results"]], ["a", "b"]
+        )
+        jobs = self.request("get", "/jobs").json()["jobs"]
+        self.assertEqual([job["id"] for job in jobs], [job_id])
+        health = self.request("get", "/health").json()
+        self.assertEqual(health["jobs"]["succeeded"], 1)
+
+    def test_not_found(self):
+        self.assertEqual(self.request("get", "/jobs/unknown").status_code, 404)
+        self.assertEqual(self.request("get", "/other").status_code, 404)
+        self.assertEqual(self.request("post", "/other", json={}).status_code, 404)
+
+    def test_bad_request(self):
+        for body in (
+            {"station": "radio-6", "playlist_ids": []},
+            {"station": "radio-7", "playlist_ids": ["a"]},
+            {"station": "radio-6", "playlist_ids": ["a"], "max_tracks": 0},
+            {"station": "radio-6", "playlist_ids": ["a"], "deadline_s": 0},
+            {"station": "radio-6", "playlist_ids": ["a"], "credentials": "unknown"},
+        ):
+            with self.subTest(body=body):
+                response = self.request("post", "/jobs", json=body)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+        response = self.request("post", "/jobs", data=b"not json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.service.get_jobs(), [])
+
+    def test_invalid_content_length(self):
+        for content_length in ("ten", "-1"):
+            with self.subTest(content_length=content_length):
+                connection = http.client.HTTPConnection(
+                    "127.0.0.1", self.server.server_port, timeout=10
+                )
+                self.addCleanup(connection.close)
+                connection.putrequest("POST", "/jobs")
+                connection.putheader("Content-Length", content_length)
+                connection.endheaders()
+                self.assertEqual(connection.getresponse().status, 400)
+        self.assertEqual(self.service.get_jobs(), [])
+
+
+class SyncApiTokenTest(SyncServerTest):
+    token = TOKEN
+
+    def test_requires_token(self):
+        for headers in (
+            {},
+            {"Authorization": "Bearer wrong"},
+            {"Authorization": TOKEN},
+        ):
+            with self.subTest(headers=headers):
+                self.assertEqual(
+                    self.request("get", "/health", headers=headers).status_code, 401
+                )
+                response = self.request(
+                    "post",
+                    "/jobs",
+                    headers=headers,
+                    json={"station": "radio-6", "playlist_ids": ["a"]},
+                )
+                self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.service.get_jobs(), [])
+
+        headers = {"Authorization": f"Bearer {TOKEN}"}
+        self.assertEqual(
+            self.request("get", "/health", headers=headers).status_code, 200
+        )
+        response = self.request(
+            "post",
+            "/jobs",
+            headers=headers,
+            json={"station": "radio-6", "playlist_ids": ["a"]},
+        )
+        self.assertEqual(response.status_code, 202)
+        job = self.wait_for_job(response.json()["id"], headers=headers)
+        self.assertEqual(job["status"], "succeeded")
+
+
+class ServeTest(unittest.TestCase):
+    def test_refuses_public_host_without_token(self):
+        for host in ("0.0.0.0", "192.168.1.2", "example.com"):
+            with self.subTest(host=host), self.assertRaises(InsecureHostError):
+                serve(host=host, port=0)
@@ -0,0 +1,240 @@
+import threading
+import time
+import unittest
+
+import requests
+
+from bbc_to_spotify.playlist.strategies import QUERY_STRATEGIES
+from bbc_to_spotify.playlist.utils import search_for_tracks_hedged
+from bbc_to_spotify.spotify.models.external import GetAccessTokenResponse
+from bbc_to_spotify.spotify.token import AccessTokenManager
+from tests.stubs import StubSession, make_client, make_response, read_fixture
+
+URL = "https://api.spotify.com/v1/resource"
+
+
+def make_handler(*status_codes: int):
+    # Answers with each status code in turn, then with 200.
+    remaining = list(status_codes)
+
+    def handle(params: dict) -> requests.Response:
+        status_code = remaining.pop(0) if remaining else 200
+        return make_response(status_code=status_code, headers={"Retry-After": "0"})
+
+    return handle
+
+
+class ApiCallRetryTest(unittest.TestCase):
+    def make_client(self, method: str, *status_codes: int):
+        self.session = StubSession(
+            {(method, "/v1/resource"): make_handler(*status_codes)}
+        )
+        spotify_client = make_client(self.session)
+        self.addCleanup(spotify_client.close)
+        return spotify_client
+
+    def test_get_retries_server_errors(self):
+        spotify_client = self.make_client("get", 500, 503)
+        response = spotify_client.api_call(URL, method="get")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.session.calls), 3)
+        self.assertEqual(spotify_client.get_metrics().retries, 2)
+
+    def test_post_does_not_retry_server_errors(self):
+        spotify_client = self.make_client("post", 500)
+        with self.assertRaises(requests.HTTPError):
+            spotify_client.api_call(URL, method="post")
+        self.assertEqual(len(self.session.calls), 1)
+
+    def test_delete_does_not_retry_server_errors(self):
+        spotify_client = self.make_client("delete", 502)
+        with self.assertRaises(requests.HTTPError):
+            spotify_client.api_call(URL, method="delete")
+        self.assertEqual(len(self.session.calls), 1)
+
+    def test_idempotent_post_retries_server_errors(self):
+        spotify_client = self.make_client("post", 500)
+        response = spotify_client.api_call(URL, method="post", idempotent=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.session.calls), 2)
+
+    def test_post_retries_throttling(self):
+        spotify_client = self.make_client("post", 429, 429)
+        response = spotify_client.api_call(URL, method="post")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.session.calls), 3)
+
+    def test_retries_are_bounded(self):
+        spotify_client = self.make_client("get", *[500] * 10)
+        with self.assertRaises(requests.HTTPError):
+            spotify_client.api_call(URL, method="get")
+        self.assertEqual(len(self.session.calls), spotify_client.max_retries + 1)
+
+
+class HedgeExecutorTest(unittest.TestCase):
+    def test_started_by_hedged_search_and_shut_down_on_close(self):
+        session = StubSession(
+            {
+                ("get", "/v1/search"): lambda params: make_response(
+                    body=read_fixture("spotify_search.json")
+                )
+            }
+        )
+        spotify_client = make_client(session, hedge_search=True)
+        self.assertIsNone(spotify_client.hedge_executor)
+
+        tracks, strategy = search_for_tracks_hedged(
+            spotify_client=spotify_client,
+            queries=[(strategy, "query") for strategy in QUERY_STRATEGIES[:2]],
+            artist="Maya Okafor",
+            attempts=[],
+        )
+        self.assertTrue(tracks)
+        hedge_executor = spotify_client.hedge_executor
+        self.assertIsNotNone(hedge_executor)
+
+        spotify_client.close()
+        with self.assertRaises(RuntimeError):
+            hedge_executor.submit(print)
+
+
+class HedgedSearchTest(unittest.TestCase):
+    def search(self, handle_search) -> tuple:
+        spotify_client = make_client(
+            StubSession({("get", "/v1/search"): handle_search}), hedge_search=True
+        )
+        self.addCleanup(spotify_client.close)
+        return search_for_tracks_hedged(
+            spotify_client=spotify_client,
+            queries=list(zip(QUERY_STRATEGIES[:2], ["failing", "found"])),
+            artist="Maya Okafor",
+            attempts=[],
+        )
+
+    def test_failed_query_does_not_fail_search(self):
+        # The failing query finishes first.
+        def handle_search(params: dict) -> requests.Response:
+            if params["q"] == "failing":
+                return make_response(status_code=403)
+            time.sleep(0.1)
+            return make_response(body=read_fixture("spotify_search.json"))
+
+        tracks, strategy = self.search(handle_search)
+        self.assertTrue(tracks)
+        self.assertEqual(strategy, QUERY_STRATEGIES[1])
+
+    def test_failed_query_is_not_a_miss(self):
+        def handle_search(params: dict) -> requests.Response:
+            if params["q"] == "failing":
+                return make_response(status_code=403)
+            return make_response(body={"tracks": {"items": []}})
+
+        with self.assertRaises(requests.HTTPError):
+            self.search(handle_search)
+
+
+class TokenFetcher:
+    # Hands out a new token each time, taking a while to do so.
+
+    def __init__(self, expires_in: int = 3600, delay_s: float = 0):
+        self.expires_in = expires_in
+        self.delay_s = delay_s
+        self.num_fetched = 0
+
+    def __call__(self) -> GetAccessTokenResponse:
+        time.sleep(self.delay_s)
+        self.num_fetched += 1
+        return GetAccessTokenResponse(
+            access_token=f"token-{self.num_fetched}", expires_in=self.expires_in
+        )
+
+
+class AccessTokenManagerTest(unittest.TestCase):
+    def make_manager(self, fetch_token: TokenFetcher, **kwargs) -> AccessTokenManager:
+        token_manager = AccessTokenManager(fetch_token=fetch_token, **kwargs)
+        self.addCleanup(token_manager.close)
+        return token_manager
+
+    def test_single_flight(self):
+        fetch_token = TokenFetcher(delay_s=0.1)
+        token_manager = self.make_manager(fetch_token)
+        headers = []
+        threads = [
+            threading.Thread(target=lambda: headers.append(token_manager.get_headers()))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(fetch_token.num_fetched, 1)
+        self.assertEqual(headers, [{"Authorization": "Bearer token-1"}] * 10)
+
+        # Requests rejected with the same token refresh it once between them.
+        stale_headers = headers[0]
+        token_manager.refresh(stale_headers=stale_headers)
+        token_manager.refresh(stale_headers=stale_headers)
+        self.assertEqual(fetch_token.num_fetched, 2)
+        self.assertEqual(token_manager.access_token, "token-2")
+
+    def test_refreshed_ahead_of_expiry(self):
+        fetch_token = TokenFetcher(expires_in=10)
+        token_manager = self.make_manager(
+            fetch_token, refresh_margin_s=1, proactive_margin_s=9.9
+        )
+        self.assertEqual(token_manager.get_headers()["Authorization"], "Bearer token-1")
+        # The timer refreshes the token in the background, before requests need to.
+        give_up_at = time.monotonic() + 5
+        while fetch_token.num_fetched < 2 and time.monotonic() < give_up_at:
+            time.sleep(0.01)
+        self.assertEqual(fetch_token.num_fetched, 2)
+        self.assertEqual(token_manager.get_headers()["Authorization"], "Bearer token-2")
+        self.assertEqual(fetch_token.num_fetched, 2)
+
+    def test_refreshed_within_margin(self):
+        # E.g. when the background refresh failed.
+        fetch_token = TokenFetcher(expires_in=10)
+        token_manager = self.make_manager(
+            fetch_token, refresh_margin_s=10, proactive_margin_s=0
+        )
+        token_manager.get_headers()
+        self.assertEqual(token_manager.get_headers()["Authorization"], "Bearer token-2")
+
+
+class UnauthorizedRetryTest(unittest.TestCase):
+    def make_client(self, *status_codes: int):
+        num_tokens = 0
+
+        def handle_token(params: dict) -> requests.Response:
+            nonlocal num_tokens
+            num_tokens += 1
+            return make_response(
+                body={"access_token": f"token-{num_tokens}", "expires_in": 3600}
+            )
+
+        self.session = StubSession(
+            {
+                ("post", "/api/token"): handle_token,
+                ("get", "/v1/resource"): make_handler(*status_codes),
+            }
+        )
+        spotify_client = make_client(self.session)
+        self.addCleanup(spotify_client.close)
+        return spotify_client
+
+    def test_retried_once_with_new_token(self):
+        spotify_client = self.make_client(401)
+        response = spotify_client.api_call(URL, method="get", authenticated=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.session.calls,
+            [("post", "/api/token"), ("get", "/v1/resource")] * 2,
+        )
+        self.assertEqual(spotify_client.token_manager.access_token, "token-2")
+
+    def test_not_retried_twice(self):
+        spotify_client = self.make_client(401, 401)
+        with self.assertRaises(requests.HTTPError):
+            spotify_client.api_call(URL, method="get", authenticated=True)
+        self.assertEqual(self.session.calls.count(("get", "/v1/resource")), 2)
+        self.assertEqual(self.session.calls.count(("post", "/api/token")), 2)
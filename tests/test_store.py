@@ -0,0 +1,110 @@
+import tempfile
+import unittest
+from unittest import mock
+from pathlib import Path
+
+from bbc_to_spotify.playlist.utils import resolve_scraped_track
+from bbc_to_spotify.scraping.models import ScrapedTrack
+from bbc_to_spotify.spotify.models.external import GetAccessTokenResponse
+from bbc_to_spotify.store.store import (
+    MISS_RECHECK_BASE_S,
+    MISS_RECHECK_MAX_S,
+    Store,
+    get_miss_recheck_interval,
+)
+from tests.stubs import StubSession, make_client, make_search_handler
+
+DAY_S = 24 * 60 * 60
+
+
+class StoreTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = Path(tmp_dir.name, "store.db")
+        self.index_path = Path(tmp_dir.name, "index")
+
+    def open_store(self) -> Store:
+        store = Store(path=self.path, index_path=self.index_path)
+        self.addCleanup(store.close)
+        return store
+
+    def test_access_token(self):
+        store = self.open_store()
+        self.assertIsNone(store.get_access_token("key", min_ttl_s=60))
+        store.set_access_token(
+            "key", GetAccessTokenResponse(access_token="token", expires_in=3600)
+        )
+        self.assertEqual(
+            store.get_access_token("key", min_ttl_s=60).access_token, "token"
+        )
+        # Tokens too close to expiring are not handed out.
+        self.assertIsNone(store.get_access_token("key", min_ttl_s=3600))
+        self.assertIsNone(store.get_access_token("other", min_ttl_s=60))
+
+
+class MissBackoffTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.store = Store(
+            path=Path(tmp_dir.name, "store.db"),
+            index_path=Path(tmp_dir.name, "index"),
+        )
+        self.addCleanup(self.store.close)
+        self.now = 1_700_000_000.0
+        patcher = mock.patch(
+            "bbc_to_spotify.store.store.time.time", side_effect=lambda: self.now
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_recheck_interval(self):
+        self.assertEqual(
+            [get_miss_recheck_interval(misses) / DAY_S for misses in range(1, 8)],
+            [1, 2, 4, 8, 16, 32, 32],
+        )
+        self.assertEqual(get_miss_recheck_interval(100), MISS_RECHECK_MAX_S)
+
+    def test_backoff(self):
+        # Each miss in a row waits twice as long as the one before to be re-checked.
+        for interval_s in (MISS_RECHECK_BASE_S, 2 * MISS_RECHECK_BASE_S):
+            self.store.record_miss(key="key", text="Artist - Song")
+            self.now += interval_s - 1
+            self.assertTrue(self.store.is_known_miss(key="key", text="Artist - Song"))
+            self.now += 1
+            self.assertFalse(self.store.is_known_miss(key="key", text="Artist - Song"))
+        self.assertFalse(self.store.is_known_miss(key="other", text="Artist - Song"))
+
+    def test_changed_text_rechecked(self):
+        self.store.record_miss(key="key", text="Artist - Song")
+        self.store.record_miss(key="key", text="Artist - Song")
+        self.assertFalse(self.store.is_known_miss(key="key", text="Artist - Song!"))
+        # The corrected entry starts its backoff again.
+        self.store.record_miss(key="key", text="Artist - Song!")
+        self.now += MISS_RECHECK_BASE_S
+        self.assertFalse(self.store.is_known_miss(key="key", text="Artist - Song!"))
+
+    def test_hit_resets_backoff(self):
+        for _ in range(3):
+            self.store.record_miss(key="key", text="Artist - Song")
+        self.now += 4 * MISS_RECHECK_BASE_S
+
+        spotify_client = make_client(
+            StubSession({("get", "/v1/search"): make_search_handler()})
+        )
+        self.addCleanup(spotify_client.close)
+        with mock.patch("bbc_to_spotify.playlist.strategies.EXPLORATION_RATE", 0):
+            track = resolve_scraped_track(
+                spotify_client=spotify_client,
+                scraped_track=ScrapedTrack(name="Song", artist="Artist"),
+                key="key",
+                store=self.store,
+            )
+        self.assertIsNotNone(track)
+        self.assertEqual(self.store.get_resolved_track(key="key"), track)
+
+        # Missing again later starts over from the shortest interval.
+        self.store.record_miss(key="key", text="Artist - Song")
+        self.now += MISS_RECHECK_BASE_S
+        self.assertFalse(self.store.is_known_miss(key="key", text="Artist - Song"))
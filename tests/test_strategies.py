@@ -0,0 +1,198 @@
+import unittest
+from unittest import mock
+
+from bbc_to_spotify.playlist.models import (
+    QueryAttempt,
+    QueryStrategyStats,
+    SearchTiming,
+)
+from bbc_to_spotify.playlist.strategies import (
+    MIN_ATTEMPTS_TO_DROP,
+    QUERY_STRATEGIES,
+    build_queries,
+    explore_query_strategies,
+    get_query_strategy_stats,
+    rank_query_strategies,
+)
+from bbc_to_spotify.playlist.utils import get_tracks_by_artist_and_track_name
+from tests.stubs import StubSession, make_client, make_response
+
+NAMES = [strategy.name for strategy in QUERY_STRATEGIES]
+
+
+def make_stats(
+    name: str, attempts: int, hits: int, latency_s: float = 0.1
+) -> QueryStrategyStats:
+    return QueryStrategyStats(
+        name=name, attempts=attempts, hits=hits, total_latency_s=attempts * latency_s
+    )
+
+
+def get_names(strategies) -> list[str]:
+    return [strategy.name for strategy in strategies]
+
+
+class RankQueryStrategiesTest(unittest.TestCase):
+    def test_no_stats(self):
+        self.assertEqual(get_names(rank_query_strategies({})), NAMES)
+
+    def test_hit_rate_then_latency(self):
+        stats = {
+            "fielded": make_stats("fielded", 100, 50),
+            "quoted": make_stats("quoted", 100, 80, latency_s=0.3),
+            # Within a hundredth of the quoted strategy's hit rate, and quicker.
+            "title-only": make_stats("title-only", 101, 80, latency_s=0.2),
+        }
+        ranked = get_names(rank_query_strategies(stats))
+        # Strategies yet to be tried start at even odds.
+        self.assertEqual(
+            ranked, ["title-only", "quoted", "simplified", "primary-artist", "fielded"]
+        )
+
+    def test_drops_rarely_found(self):
+        stats = {
+            "quoted": make_stats("quoted", MIN_ATTEMPTS_TO_DROP, 0),
+            # Not yet tried often enough to drop.
+            "title-only": make_stats("title-only", MIN_ATTEMPTS_TO_DROP - 1, 0),
+        }
+        ranked = get_names(rank_query_strategies(stats))
+        self.assertNotIn("quoted", ranked)
+        self.assertEqual(ranked[-1], "title-only")
+
+    def test_keeps_best_if_all_dropped(self):
+        stats = {name: make_stats(name, 1000, 1) for name in NAMES}
+        stats["primary-artist"] = make_stats("primary-artist", 1000, 1, latency_s=0.05)
+        ranked = get_names(rank_query_strategies(stats))
+        self.assertEqual(ranked, ["primary-artist"])
+
+
+class ExploreQueryStrategiesTest(unittest.TestCase):
+    def test_not_exploring(self):
+        with mock.patch("bbc_to_spotify.playlist.strategies.EXPLORATION_RATE", 0):
+            strategies = explore_query_strategies(QUERY_STRATEGIES[:2])
+        self.assertEqual(strategies, list(QUERY_STRATEGIES[:2]))
+
+    def test_exploring_dropped_strategy(self):
+        with (
+            mock.patch("bbc_to_spotify.playlist.strategies.EXPLORATION_RATE", 1),
+            mock.patch("random.choice", return_value=QUERY_STRATEGIES[3]),
+        ):
+            strategies = explore_query_strategies(QUERY_STRATEGIES[:3])
+        self.assertEqual(get_names(strategies), ["quoted", *NAMES[:3]])
+
+    def test_exploring_kept_strategy(self):
+        with (
+            mock.patch("bbc_to_spotify.playlist.strategies.EXPLORATION_RATE", 1),
+            mock.patch("random.choice", return_value=QUERY_STRATEGIES[1]),
+        ):
+            strategies = explore_query_strategies(QUERY_STRATEGIES[:3])
+        self.assertEqual(get_names(strategies), ["simplified", "fielded", NAMES[2]])
+
+
+class BuildQueriesTest(unittest.TestCase):
+    def test_special_characters(self):
+        queries = build_queries(
+            QUERY_STRATEGIES, artist="Beyoncé & Jay-Z", track_name="Crazy in Love"
+        )
+        self.assertEqual(
+            [(strategy.name, query) for strategy, query in queries],
+            [
+                ("fielded", "artist:Beyoncé & Jay-Z track:Crazy in Love"),
+                ("simplified", "artist:Beyoncé Jay-Z track:Crazy in Love"),
+                ("primary-artist", "artist:Beyoncé track:Crazy in Love"),
+            ],
+        )
+
+    def test_duplicate_queries_skipped(self):
+        queries = build_queries(QUERY_STRATEGIES, artist="kestrel", track_name="west")
+        # The simplified and primary artist queries are the same as the fielded one.
+        self.assertEqual(
+            [strategy.name for strategy, _ in queries],
+            ["fielded", "quoted", "title-only"],
+        )
+
+    def test_max_queries(self):
+        queries = build_queries(
+            QUERY_STRATEGIES, artist="Kestrel", track_name="West", max_queries=1
+        )
+        self.assertEqual(len(queries), 1)
+
+
+class QueryStrategyStatsTest(unittest.TestCase):
+    def test_first_attempts_only(self):
+        search_timings = [
+            SearchTiming(
+                latency_s=0.3,
+                is_simple=False,
+                hedged=False,
+                strategy="quoted",
+                attempts=[
+                    QueryAttempt(strategy="fielded", latency_s=0.1, found=False),
+                    QueryAttempt(strategy="quoted", latency_s=0.2, found=True),
+                ],
+            ),
+            SearchTiming(
+                latency_s=0.1,
+                is_simple=True,
+                hedged=False,
+                strategy="fielded",
+                attempts=[QueryAttempt(strategy="fielded", latency_s=0.1, found=True)],
+            ),
+            SearchTiming(
+                latency_s=0.1,
+                is_simple=False,
+                hedged=True,
+                strategy="simplified",
+                attempts=[
+                    QueryAttempt(strategy="simplified", latency_s=0.1, found=True)
+                ],
+            ),
+            SearchTiming(latency_s=0, is_simple=True, hedged=False),
+        ]
+        stats = get_query_strategy_stats(search_timings)
+        self.assertEqual(list(stats), ["fielded"])
+        self.assertEqual(stats["fielded"].attempts, 2)
+        self.assertEqual(stats["fielded"].hits, 1)
+        self.assertAlmostEqual(stats["fielded"].total_latency_s, 0.2)
+
+
+class SearchQueriesTest(unittest.TestCase):
+    def setUp(self):
+        empty_search = {"tracks": {"items": [], "limit": 20, "offset": 0, "total": 0}}
+        self.session = StubSession(
+            {("get", "/v1/search"): lambda params: make_response(body=empty_search)}
+        )
+        self.spotify_client = make_client(self.session)
+        self.addCleanup(self.spotify_client.close)
+        patcher = mock.patch("bbc_to_spotify.playlist.strategies.EXPLORATION_RATE", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def search(self, artist: str, track_name: str, **kwargs) -> list[SearchTiming]:
+        search_timings: list[SearchTiming] = []
+        tracks = get_tracks_by_artist_and_track_name(
+            spotify_client=self.spotify_client,
+            artist=artist,
+            track_name=track_name,
+            search_timings=search_timings,
+            **kwargs,
+        )
+        self.assertEqual(tracks, set())
+        return search_timings
+
+    def test_simple_miss_searches_once(self):
+        (timing,) = self.search(artist="Kestrel", track_name="West")
+        self.assertEqual(len(self.session.calls), 2)  # The token, then the search.
+        self.assertEqual(len(timing.attempts), 1)
+
+    def test_special_characters_miss_searches_each_query(self):
+        (timing,) = self.search(artist="Beyoncé & Jay-Z", track_name="Crazy in Love")
+        self.assertEqual([attempt.strategy for attempt in timing.attempts], NAMES[:3])
+
+    def test_is_simple_given(self):
+        # As normalized with the scraped track, rather than checked again.
+        (timing,) = self.search(
+            artist="Beyoncé & Jay-Z", track_name="Crazy in Love", is_simple=True
+        )
+        self.assertTrue(timing.is_simple)
+        self.assertEqual(len(timing.attempts), 1)
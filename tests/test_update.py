@@ -0,0 +1,120 @@
+import tempfile
+import unittest
+from collections import Counter
+from unittest import mock
+
+import requests
+
+from bbc_to_spotify.playlist.update import (
+    ADD_BATCH_SIZE,
+    add_tracks_and_prune_playlist,
+    update_playlists,
+)
+from bbc_to_spotify.scraping.scraping import scrape_tracks_from_html
+from bbc_to_spotify.spotify.fast import track_from_json
+from tests.stubs import (
+    StubSession,
+    make_client,
+    make_response,
+    make_search_handler,
+    make_track_json,
+    read_fixture,
+)
+
+
+class AddTracksAndPruneTest(unittest.TestCase):
+    def setUp(self):
+        self.spotify_client = make_client(StubSession({}))
+        self.addCleanup(self.spotify_client.close)
+
+    def test_tracks_added_in_order(self):
+        # Spans several batches, with repeats in the source and a duplicated track in
+        # the destination, which is added back after the rest.
+        tracks = [
+            track_from_json(make_track_json(i)) for i in range(ADD_BATCH_SIZE * 3)
+        ]
+        source_tracks = list(reversed(tracks)) + tracks[:10]
+        tracks_added, tracks_removed = add_tracks_and_prune_playlist(
+            spotify_client=self.spotify_client,
+            playlist_id="playlist",
+            dest_track_counts=Counter([tracks[0], tracks[0], tracks[1]]),
+            source_tracks=iter(source_tracks),
+            prune_dest=True,
+            prepend=False,
+            dry_run=True,
+        )
+        self.assertEqual(tracks_added, list(reversed(tracks[2:])) + [tracks[0]])
+        self.assertEqual(tracks_removed, {tracks[0]})
+        self.assertEqual(self.spotify_client.session.calls, [])
+
+
+class UpdatePlaylistsTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        page = make_response(body=read_fixture("playlist_html.html"))
+        for patcher in (
+            mock.patch("bbc_to_spotify.store.locks.LOCKS_PATH", tmp_dir.name),
+            mock.patch(
+                "bbc_to_spotify.scraping.scraping.requests.get",
+                lambda url, timeout: page,
+            ),
+            # Strategies that check the artist would not match the stub's tracks.
+            mock.patch("bbc_to_spotify.playlist.strategies.EXPLORATION_RATE", 0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.added: dict[str, list[str]] = {"a": [], "c": []}
+
+        def make_add_handler(playlist_id: str):
+            def handle(params: dict) -> requests.Response:
+                self.added[playlist_id].extend(params["uris"].split(","))
+                return make_response(status_code=201, body={"snapshot_id": "s"})
+
+            return handle
+
+        self.session = StubSession(
+            {
+                ("get", "/v1/search"): make_search_handler(),
+                ("post", "/v1/playlists/a/tracks"): make_add_handler("a"),
+                ("post", "/v1/playlists/b/tracks"): lambda params: make_response(
+                    status_code=403
+                ),
+                ("post", "/v1/playlists/c/tracks"): make_add_handler("c"),
+            }
+        )
+        self.spotify_client = make_client(self.session)
+        self.addCleanup(self.spotify_client.close)
+
+    def test_one_scrape_for_several_playlists(self):
+        with self.assertLogs("bbc_to_spotify.playlist.update", level="ERROR") as logs:
+            results = update_playlists(
+                spotify_client=self.spotify_client,
+                playlist_ids=["a", "b", "a", "c"],
+                station="radio-6",
+                remove_duplicates=False,
+                prune_dest=False,
+                prepend=False,
+                update_description=False,
+                dry_run=False,
+            )
+        self.assertEqual([result.playlist_id for result in results], ["a", "b", "c"])
+        result_a, result_b, result_c = results
+
+        # The station's tracks were searched for once, for every playlist.
+        num_tracks = len(scrape_tracks_from_html(read_fixture("playlist_html.html")))
+        self.assertEqual(self.session.calls.count(("get", "/v1/search")), num_tracks)
+        for result in (result_a, result_c):
+            self.assertIsNone(result.error)
+            self.assertEqual(len(result.tracks_added), num_tracks)
+            self.assertEqual(
+                self.added[result.playlist_id],
+                [track.uri for track in result.tracks_added],
+            )
+        self.assertEqual(result_a.tracks_added, result_c.tracks_added)
+
+        # The playlist that could not be updated does not stop the others.
+        self.assertIsInstance(result_b.error, requests.HTTPError)
+        self.assertEqual(result_b.tracks_added, [])
+        self.assertIn("Failed to update playlist b.", logs.output[0])